@@ -26,10 +26,18 @@ if _is_py3k:
     def _is_integer(obj): return isinstance(obj, int)
     def _is_string(obj): return isinstance(obj, str)
     def _ord2byte(i): return bytes((i,))
+    def _bytes2int(b): return int.from_bytes(b, 'big')
+    def _int2bytes(i, length): return i.to_bytes(length, 'big')
 else:
     def _is_integer(obj): return isinstance(obj, (int, long))
     def _is_string(obj): return isinstance(obj, basestring)
     def _ord2byte(i): return bytes(chr(i))
+    def _bytes2int(b):
+        return int(__import__('binascii').hexlify(bytearray(b)) or b'0', 16)
+    def _int2bytes(i, length):
+        # The field width must be an int, not a long.
+        return __import__('binascii').unhexlify(
+            b'%0*x' % (int(2 * length), i))
 
 def _byte2ord(b):
     try:
@@ -50,7 +58,17 @@ if not _is_py3k:
 ##  Global Imports  ##
 ## ---------------- ##
 
+import base64
+import binascii
+import collections
 import functools
+import hashlib
+import hmac
+import os
+import random
+import threading
+import time
+import weakref
 
 #--------------------------------------------------------------------------
 
@@ -78,6 +96,12 @@ class IMValueError(IMException, ValueError):
     dealing with integers (mod n)"""
     pass
 
+class IMTimeoutError(IMRuntimeError):
+    """Exception raised when a computation dealing with integers (mod n)
+    is interrupted because its deadline has expired or it has been
+    cancelled"""
+    pass
+
 class CryptoException(Exception):
     """Base class for exceptions that can be raised by classes and
     subroutines dealing with RSA encryption (keys, encrypters and
@@ -94,12 +118,20 @@ class CryptoValueError(CryptoException, ValueError):
     dealing with RSA encryption (keys, encrypters and decrypters)"""
     pass
 
+class CryptoTimeoutError(CryptoRuntimeError):
+    """Exception raised when an encryption or decryption is interrupted
+    because its deadline has expired or it has been cancelled"""
+    pass
+
 #--------------------------------------------------------------------------
 
 ## ---------------------------------------------- ##
 ##  Internal Classes, Subroutines and Decorators  ##
 ## ---------------------------------------------- ##
 
+# Python 2 has no monotonic clock in the standard library.
+_monotonic = getattr(time, 'monotonic', time.time)
+
 def _operation_modulo_integer(func):
     def wrapper(self, other):
         if _is_integer(other):
@@ -109,6 +141,43 @@ def _operation_modulo_integer(func):
         return self.__class__(func(self, other))
     return functools.update_wrapper(wrapper, func)
 
+class Deadline:
+    """A deadline for long computations, that can also be used as a
+    cancellation token.  Computations accepting a deadline check it
+    periodically, and are interrupted once it has expired.
+
+      >>> Deadline().expired()
+      False
+      >>> Deadline(timeout=0).expired()
+      True
+      >>> deadline = Deadline(timeout=3600)
+      >>> deadline.cancel()
+      >>> deadline.check()
+      ... #doctest: +IGNORE_EXCEPTION_DETAIL
+      Traceback (most recent call last):
+       ...
+      IMTimeoutError: computation cancelled
+    """
+    def __init__(self, timeout=None):
+        """The timeout is in seconds; if it is None, the deadline never
+        expires by itself, but can still be cancelled."""
+        if timeout is None:
+            self.expires_at = None
+        else:
+            self.expires_at = _monotonic() + timeout
+        self.cancelled = False
+    def cancel(self):
+        self.cancelled = True
+    def expired(self):
+        return (self.cancelled or (self.expires_at is not None
+                                   and _monotonic() >= self.expires_at))
+    def check(self):
+        """Raise an `IMTimeoutError' if the deadline has expired."""
+        if self.cancelled:
+            raise IMTimeoutError("computation cancelled")
+        elif self.expired():
+            raise IMTimeoutError("deadline expired")
+
 #--------------------------------------------------------------------------
 
 ## ---------------------------------------------- ##
@@ -269,6 +338,21 @@ class IntegerMod(object):
     def __repr__(self):
         return "%r(%u)" % (self.__class__, self.residue)
 
+    def __reduce__(self):
+        # Integers (mod n) are pickled as their "modulus spec" and residue,
+        # and rebuilt with the classes of `integer_mod_class' and
+        # `integer_mod_pq_class'.  Such classes always return the same
+        # spec object, which is thus stored only once in a pickle, even
+        # if shared by many integers (mod n).
+        spec = self.__class__.__dict__.get('_spec')
+        if spec is None:
+            spec = self._modulus_spec()
+        return (_rebuild_integer_mod, (spec, self.residue))
+
+    @classmethod
+    def _modulus_spec(cls):
+        return (cls.modulo,)
+
     def __str__(self):
         return "%u (mod %u)" % (self.residue, self.modulo)
 
@@ -321,6 +405,17 @@ class IntegerMod(object):
     __rtruediv__ = __rdiv__
 
     def __pow__(self, exponent):
+        return self.pow_steps(exponent).finish()
+
+    def pow_with_deadline(self, exponent, deadline=None):
+        """Calculate self**exponent.  If a `Deadline' is given, the
+        exponentiation is interrupted with an `IMTimeoutError' once it
+        expires."""
+        return self.pow_steps(exponent).finish(deadline)
+
+    def pow_steps(self, exponent):
+        """Return an `ExponentiationSteps' object, that can be used to
+        calculate self**exponent a bounded number of steps at a time."""
         if not _is_integer(exponent):
             raise IMTypeError("exponent %r is not an integer", exponent)
         elif exponent < 0:
@@ -328,26 +423,22 @@ class IntegerMod(object):
             base = self._get_reciprocal()
         else:
             base = self
-            if self.residue == 0:
-                # NOTE: for the optimized RSA decryption to work correctly,
-                # it must be assumed that 0**0 = 0 (mod p) for any prime p.
-                # Thus, for consistency, we  set 0**0 = (mod m) for any
-                # integer m.
-                return self.__class__(0)
-        # Implementatione of the "square and multiply" algorithm described
-        # in our latex document.  The `partial1' and `partial2' variables
-        # correspond respectively to the "parameters" b and f used there.
-        partial1 = partial2 = self.__class__(1)
-        while exponent > 0:
-            if exponent % 2 == 1:
-                partial1 *= base
-                exponent -= 1
-            else:
-                exponent //= 2
-                partial2 = base = base * base
-                if exponent == 1:
-                    break
-        return partial1 * partial2
+        return ExponentiationSteps(base, exponent)
+
+    @classmethod
+    def pow_many(cls, wholes, exponent, deadline=None):
+        """Return the list of the integers (mod n) built from the given
+        wholes, each raised to exponent.  The exponentiation plan is
+        calculated only once, and shared among all the elements."""
+        if not _is_integer(exponent):
+            raise IMTypeError("exponent %r is not an integer", exponent)
+        values = [cls(x) for x in wholes]
+        if exponent < 0:
+            exponent *= -1
+            values = [x._get_reciprocal() for x in values]
+        plan = exponentiation_plan(exponent)
+        return [ExponentiationSteps(x, exponent, plan).finish(deadline)
+                for x in values]
 
     def _get_reciprocal(self):
         d, x, y = extended_gcd(self.modulo, self.residue)
@@ -359,6 +450,118 @@ class IntegerMod(object):
         return self.__class__(y)
 
 
+def exponentiation_plan(exponent):
+    """Return the sequence of operations performed by the "square and
+    multiply" algorithm described in our latex document to raise an
+    integer to the given non-negative exponent: True stands for "multiply
+    the partial result by the base", False for "square the base".  The
+    plan depends only on the exponent, so it can be calculated once and
+    reused for any number of bases.
+
+      >>> exponentiation_plan(0)
+      ()
+      >>> exponentiation_plan(1)
+      (True,)
+      >>> exponentiation_plan(11)
+      (True, False, True, False, False)
+    """
+    plan = []
+    while exponent > 0:
+        if exponent % 2 == 1:
+            plan.append(True)
+            exponent -= 1
+        else:
+            exponent //= 2
+            plan.append(False)
+            if exponent == 1:
+                break
+    return tuple(plan)
+
+
+class ExponentiationSteps(object):
+    """Calculate the power of an integer (mod n) with the "square and
+    multiply" algorithm described in our latex document, a bounded
+    number of iterations at a time.  This allows long exponentiations
+    to be interleaved with other work (e.g., by an asyncio task that
+    yields control to its event loop between each slice of work).
+    Not meant to be instantiated directly; use `IntegerMod.pow_steps'.
+
+      >>> class IntegerMod15(IntegerMod):
+      ...    modulo = 15
+      >>> steps = IntegerMod15(2).pow_steps(11)
+      >>> steps.advance(2)
+      False
+      >>> while not steps.advance(2):
+      ...     pass
+      >>> print (steps.result)
+      8 (mod 15)
+      >>> print (IntegerMod15(13).pow_steps(-3).finish())
+      13 (mod 15)
+    """
+
+    def __init__(self, base, exponent, plan=None):
+        # The `partial1' and `partial2' attributes correspond respectively
+        # to the "parameters" b and f used in the latex document.
+        if plan is None:
+            plan = exponentiation_plan(exponent)
+        self.result = None
+        self.steps = 0 # iterations performed so far
+        self._plan = plan
+        self._base = base
+        self._partial1 = self._partial2 = base.__class__(1)
+        if base.residue == 0:
+            # NOTE: for the optimized RSA decryption to work correctly,
+            # it must be assumed that 0**0 = 0 (mod p) for any prime p.
+            # Thus, for consistency, we  set 0**0 = (mod m) for any
+            # integer m.
+            self.result = base.__class__(0)
+
+    def advance(self, max_steps=None):
+        """Perform at most `max_steps' iterations of the algorithm (all
+        of the remaining ones if `max_steps' is None).  Return True if
+        the exponentiation has been completed, False otherwise."""
+        if self.result is not None:
+            return True
+        plan, position = self._plan, self.steps
+        if max_steps is None:
+            end = len(plan)
+        else:
+            end = min(len(plan), position + max_steps)
+        base, partial1, partial2 = self._base, self._partial1, self._partial2
+        while position < end:
+            if plan[position]:
+                partial1 *= base
+            else:
+                partial2 = base = base * base
+            position += 1
+        self.steps = position
+        self._base, self._partial1, self._partial2 = base, partial1, partial2
+        if position == len(plan):
+            self.result = partial1 * partial2
+            return True
+        return False
+
+    """Number of iterations performed between two checks of the
+    deadline passed to `finish'."""
+    deadline_check_steps = 32
+
+    def finish(self, deadline=None):
+        """Complete the exponentiation, and return its result.  If a
+        `Deadline' is given, check it periodically and raise an
+        `IMTimeoutError' if it expires before completion."""
+        if deadline is None:
+            self.advance()
+        else:
+            while not self.advance(self.deadline_check_steps):
+                deadline.check()
+        return self.result
+
+    def cancel(self):
+        """Give up the exponentiation, releasing any resource held for
+        it.  Nothing to do here."""
+        pass
+
+
 class IntegerModPQ(IntegerMod):
     """A class representing integers (modulo pq), where p and q are two
     different prime numbers.  It offers an optimized implementation of
@@ -372,21 +575,38 @@ class IntegerModPQ(IntegerMod):
     p = None
     q = None
 
+    """The inverse of p (mod q), assuming p > q.  Calculated on first use,
+    unless it is given by the subclass."""
+    p_reciprocal_mod_q = None
+
     @classmethod
     def _cls_init(cls):
-        if cls.p is None or cls.q is None:
-            # Sanity check: `p' and `q' should be overridden by subclasses.
-            raise IMRuntimeError("p or q not overridden (is still None)")
-        # So that we can assume p > q.
-        cls.p, cls.q = max(cls.p, cls.q), min(cls.p, cls.q)
-        cls.modulo = cls.p * cls.q
-        class int_mod_p(IntegerMod): modulo = cls.p
-        class int_mod_q(IntegerMod): modulo = cls.q
-        cls.int_mod_p = int_mod_p
-        cls.int_mod_q = int_mod_q
-        # p^(-1) (mod q)
-        cls.p_reciprocal_mod_q = modular_reciprocal(cls.p, cls.q)
-        cls._cls_init = classmethod(lambda cls : None)
+        # The class is set up on first use.  This must be thread-safe:
+        # the class attributes are calculated while holding a lock, and
+        # are published all together; after that, they never change.
+        if '_initialized' in cls.__dict__:
+            return
+        with _integer_mod_classes_lock:
+            if '_initialized' in cls.__dict__:
+                return
+            if cls.p is None or cls.q is None:
+                # Sanity check: `p' and `q' should be overridden by
+                # subclasses.
+                raise IMRuntimeError("p or q not overridden (is still None)")
+            # So that we can assume p > q.
+            p, q = max(cls.p, cls.q), min(cls.p, cls.q)
+            # p^(-1) (mod q)
+            p_reciprocal_mod_q = cls.p_reciprocal_mod_q
+            if p_reciprocal_mod_q is None:
+                p_reciprocal_mod_q = modular_reciprocal(p, q)
+            elif p * p_reciprocal_mod_q % q != 1:
+                raise IMValueError("%d is not the inverse of %d (mod %d)" %
+                                   (p_reciprocal_mod_q, p, q))
+            cls.p, cls.q, cls.modulo = p, q, p * q
+            cls.int_mod_p = integer_mod_class(p)
+            cls.int_mod_q = integer_mod_class(q)
+            cls.p_reciprocal_mod_q = p_reciprocal_mod_q
+            cls._initialized = True
 
     def __init__(self, whole):
         self.__class__._cls_init()
@@ -394,23 +614,208 @@ class IntegerModPQ(IntegerMod):
         self.mod_p = self.int_mod_p(whole)
         self.mod_q = self.int_mod_q(whole)
 
-    def __pow__(self, exponent):
+    @classmethod
+    def _modulus_spec(cls):
+        cls._cls_init()
+        return (cls.p, cls.q)
+
+    def pow_steps(self, exponent, executor=None):
+        """Like `IntegerMod.pow_steps'.  If an executor is given (normally
+        a `concurrent.futures.ProcessPoolExecutor'), the exponentiation
+        (mod q) is done in it, while the one (mod p) is done locally."""
         if not _is_integer(exponent):
             raise IMTypeError("exponent %r is not an integer", exponent)
-        a = (self.mod_p ** (exponent % (self.p - 1))).residue
-        b = (self.mod_q ** (exponent % (self.q - 1))).residue
-        result = a + self.p * self.p_reciprocal_mod_q * (b - a)
-        return self.__class__(result)
+        exponent_q = exponent % (self.q - 1)
+        if executor is None:
+            steps_mod_q = self.mod_q.pow_steps(exponent_q)
+        else:
+            steps_mod_q = RemoteExponentiationSteps(
+                self.mod_q, exponent_q, executor)
+        return CRTExponentiationSteps(
+            self, self.mod_p.pow_steps(exponent % (self.p - 1)),
+            steps_mod_q)
+
+    def pow_parallel(self, exponent, executor, deadline=None):
+        """Calculate self**exponent, doing the two exponentiations of the
+        Chinese Reminder Theorem at the same time, one in the current
+        process and one in the given executor.
+
+          >>> import concurrent.futures  #doctest: +SKIP
+          >>> class IntegerMod221(IntegerModPQ):
+          ...     p, q = 13, 17
+          >>> with concurrent.futures.ThreadPoolExecutor(1) as executor:
+          ...     print (IntegerMod221(2).pow_parallel(100, executor))
+          ... #doctest: +SKIP
+          16 (mod 221)
+        """
+        steps = self.pow_steps(exponent, executor)
+        try:
+            return steps.finish(deadline)
+        finally:
+            # Don't leave work behind if the deadline has expired.
+            steps.cancel()
 
+    @classmethod
+    def pow_many(cls, wholes, exponent, deadline=None):
+        # Reduce the exponent and calculate the plans only once.
+        if not _is_integer(exponent):
+            raise IMTypeError("exponent %r is not an integer", exponent)
+        cls._cls_init()
+        exponent_p = exponent % (cls.p - 1)
+        exponent_q = exponent % (cls.q - 1)
+        plan_p = exponentiation_plan(exponent_p)
+        plan_q = exponentiation_plan(exponent_q)
+        results = []
+        for x in wholes:
+            x = cls(x)
+            steps_mod_p = ExponentiationSteps(x.mod_p, exponent_p, plan_p)
+            steps_mod_q = ExponentiationSteps(x.mod_q, exponent_q, plan_q)
+            results.append(CRTExponentiationSteps(
+                x, steps_mod_p, steps_mod_q).finish(deadline))
+        return results
+
+
+class CRTExponentiationSteps(ExponentiationSteps):
+    """Like `ExponentiationSteps', but for integers (modulo pq), whose
+    powers are calculated using the Chinese Reminder Theorem.  Not meant
+    to be instantiated directly; use `IntegerModPQ.pow_steps'."""
+
+    def __init__(self, whole, steps_mod_p, steps_mod_q):
+        self.result = None
+        self._whole = whole
+        self._steps_mod_p = steps_mod_p
+        self._steps_mod_q = steps_mod_q
+
+    def advance(self, max_steps=None):
+        if self.result is not None:
+            return True
+        # Complete the exponentiation (mod p) before going on with the
+        # one (mod q), sharing the same budget of iterations.
+        remaining = max_steps
+        for steps in (self._steps_mod_p, self._steps_mod_q):
+            steps_before = steps.steps
+            if not steps.advance(remaining):
+                return False
+            if remaining is not None:
+                remaining -= steps.steps - steps_before
+        cls = self._whole.__class__
+        a = self._steps_mod_p.result.residue
+        b = self._steps_mod_q.result.residue
+        self.result = cls(a + cls.p * cls.p_reciprocal_mod_q * (b - a))
+        return True
+
+    @property
+    def steps(self):
+        return self._steps_mod_p.steps + self._steps_mod_q.steps
+
+    def cancel(self):
+        self._steps_mod_p.cancel()
+        self._steps_mod_q.cancel()
+
+
+def _pow_residue(modulo, residue, exponent):
+    # Run in the worker processes: only integers go in and out.
+    return (integer_mod_class(modulo)(residue)**exponent).residue
+
+class RemoteExponentiationSteps(ExponentiationSteps):
+    """Like `ExponentiationSteps', but the exponentiation is done all at
+    once in a `concurrent.futures' executor.  Advancing it just checks
+    whether it has completed, waiting at most `poll_interval' seconds
+    (or until completion, if no bound on the steps is given).  Not meant
+    to be instantiated directly; use `IntegerModPQ.pow_steps'."""
+
+    poll_interval = 0.01
+
+    def __init__(self, base, exponent, executor):
+        self.result = None
+        self.steps = 0
+        self._class = base.__class__
+        self._future = executor.submit(_pow_residue, base.modulo,
+                                       base.residue, exponent)
+
+    def advance(self, max_steps=None):
+        if self.result is not None:
+            return True
+        import concurrent.futures
+        timeout = None if max_steps is None else self.poll_interval
+        if not concurrent.futures.wait([self._future], timeout).done:
+            return False
+        self.result = self._class(self._future.result())
+        return True
+
+    def cancel(self):
+        """Cancel the exponentiation, if it hasn't started yet."""
+        self._future.cancel()
+
+
+# Classes returned by `integer_mod_class' and `integer_mod_pq_class',
+# indexed by their "modulus spec".  A class lives here only as long as
+# it is in use somewhere else.
+_integer_mod_classes = weakref.WeakValueDictionary()
+_integer_mod_classes_lock = threading.RLock()
+
+def _integer_mod_class_name(modulo):
+    # Huge moduli would give unwieldy names (and newer pythons refuse to
+    # convert them to decimal strings anyway).
+    if modulo.bit_length() <= 256:
+        return str("IntegerMod%u" % modulo)
+    else:
+        return str("IntegerMod_%ubits" % modulo.bit_length())
+
+def _integer_mod_class_from_spec(spec, p_reciprocal_mod_q=None):
+    with _integer_mod_classes_lock:
+        cls = _integer_mod_classes.get(spec)
+        if cls is None:
+            if len(spec) == 1:
+                class cls(IntegerMod):
+                    modulo = spec[0]
+            else:
+                class cls(IntegerModPQ):
+                    p, q = spec
+                cls.p_reciprocal_mod_q = p_reciprocal_mod_q
+                cls._cls_init()
+            cls.__name__ = _integer_mod_class_name(cls.modulo)
+            cls._spec = spec
+            _integer_mod_classes[spec] = cls
+        return cls
+
+def integer_mod_class(modulo):
+    """Return the subclass of `IntegerMod' with the given modulo.  The
+    same class is returned by all the calls with the same modulo (as
+    long as that class is referenced somewhere).  Contrarily to classes
+    created with a custom class statement, such classes are preserved
+    when their instances are pickled and then unpickled.
+
+      >>> integer_mod_class(15) is integer_mod_class(15)
+      True
+      >>> print (integer_mod_class(15)(17))
+      2 (mod 15)
+    """
+    return _integer_mod_class_from_spec((modulo,))
+
+def integer_mod_pq_class(p, q, p_reciprocal_mod_q=None):
+    """Like `integer_mod_class', but return the subclass of
+    `IntegerModPQ' for the given primes p and q.  The inverse of
+    max(p, q) modulo min(p, q) can be passed in if already known, to
+    save its calculation when the class is created.
+
+      >>> integer_mod_pq_class(13, 17) is integer_mod_pq_class(17, 13)
+      True
+      >>> integer_mod_pq_class(53, 61, 20).p_reciprocal_mod_q
+      20
+    """
+    return _integer_mod_class_from_spec((max(p, q), min(p, q)),
+                                        p_reciprocal_mod_q)
+
+def _rebuild_integer_mod(spec, residue):
+    return _integer_mod_class_from_spec(spec)(residue)
 
 def modular_reciprocal(a, m):
     """Calculate the inverse of a (mod m), i.e. 0 < b < m such that
     ab = 1 (mod m).  This will raise an exception if a and b are not
     coprime"""
-    class cls(IntegerMod):
-        modulo = m
-    cls.__name__ = str("IntegerMod%u" % m)  # for better error messages
-    return (cls(a)**(-1)).residue
+    # Named classes give better error messages.
+    return (integer_mod_class(m)(a)**(-1)).residue
 
 
 #--------------------------------------------------------------------------
@@ -421,32 +826,158 @@ def modular_reciprocal(a, m):
 ## -------------------------------- ##
 
 
+def _factor_modulus(n, e, d, attempts=100):
+    """Find the prime factors p and q of n = pq, given the RSA exponents
+    e and d.  This uses the well-known probabilistic algorithm described
+    e.g. in NIST SP 800-56B, Appendix C: since e * d - 1 is a multiple of
+    lcm(p - 1, q - 1), for a random g there's at least a 50% chance that
+    a non-trivial square root of 1 (mod n) can be found among the values
+    g^(t * 2^i), with t the odd part of e * d - 1; and such square root
+    reveals a factor of n."""
+    k = e * d - 1
+    if n < 6 or k <= 0 or k % 2 != 0:
+        raise CryptoValueError("invalid RSA parameters")
+    t, s = k, 0
+    while t % 2 == 0:
+        t, s = t // 2, s + 1
+    mod_n = integer_mod_class(n)
+    one, minus_one = mod_n(1), mod_n(-1)
+    for _ in range(attempts):
+        g = random.randrange(2, n - 1)
+        p = gcd(g, n)
+        if p == 1:
+            x = mod_n(g)**t
+            for _ in range(s):
+                if x == one or x == minus_one:
+                    break
+                y = x * x
+                if y == one:
+                    # x is a non-trivial square root of 1 (mod n).
+                    p = gcd(x.residue - 1, n)
+                    break
+                x = y
+        if 1 < p < n and n % p == 0:
+            return max(p, n // p), min(p, n // p)
+    raise CryptoValueError("can't factor n with the given exponents")
+
+def _validate_primes(p, q):
+    for prime in (p, q):
+        if not is_probable_prime(prime):
+            raise CryptoValueError("%u is not prime" % prime)
+
+def _key_fingerprint(n, e):
+    digest = hashlib.sha256()
+    for x in (n, e):
+        length = (x.bit_length() + 7) // 8
+        digest.update(_int2bytes(length, 4))
+        digest.update(_int2bytes(x, length))
+    return digest.digest()
+
+
 class PublicKey:
-    """The most basic usable RSA Public Key. Just a data container."""
+    """The most basic usable RSA Public Key. Just a data container,
+    immutable so that it can be shared among threads."""
     def __init__(self, n, e):
-        self.n = n
-        self.e = e
+        self.__dict__.update(n=n, e=e)
+    def __setattr__(self, name, value):
+        raise AttributeError("RSA keys are immutable")
     def __eq__(self, other):
         return (self.n == other.n and self.e == other.e)
     def __ne__(self, other):
         return (not self == other)
     def bit_length(self):
         return self.n.bit_length()
+    def fingerprint(self):
+        """Return a digest (as a byte sequence) identifying the key."""
+        return _key_fingerprint(self.n, self.e)
+    @classmethod
+    def from_der(cls, data):
+        """Build a public key from its PKCS#1 DER encoding."""
+        n, e = _der_decode_integers(data, 2)
+        return cls(n, e)
+    @classmethod
+    def from_pem(cls, text):
+        """Build a public key from its PKCS#1 PEM encoding."""
+        return cls.from_der(_pem_decode(text, _PEM_PUBLIC_LABEL))
+    def to_der(self):
+        """Return the PKCS#1 DER encoding of the key."""
+        return _der_encode_integers([self.n, self.e])
+    def to_pem(self):
+        """Return the PKCS#1 PEM encoding of the key."""
+        return _pem_encode(self.to_der(), _PEM_PUBLIC_LABEL)
 
 
 class PrivateKey:
-    """The most basic private RSA Key. Basically just a data container."""
+    """The most basic private RSA Key. Basically just a data container,
+    immutable so that it can be shared among threads."""
     public_key_class = PublicKey
-    def __init__(self, p, q, e):
-        # We just trust p and q to be prime and of similar size.
-        self.p = p
-        self.q = q
-        self.n = p * q
+    """The inverse of q (mod p), if known in advance (e.g., because it
+    was read from a PKCS#1 file); used to speed up the setup of the
+    Chinese Reminder Theorem optimization."""
+    qinv = None
+    def __init__(self, p, q, e, validate=False):
+        # Unless asked to validate them, we just trust p and q to be
+        # prime; and we always trust them to be of similar size.
+        if validate:
+            _validate_primes(p, q)
         phi_n = (p - 1) * (q - 1)
         if not (gcd(e, phi_n) == 1 and 0 < e < phi_n):
             raise CryptoValueError("invalid exponent %u" % e)
-        self.e = e
-        self.d = modular_reciprocal(e, phi_n)
+        self.__dict__.update(p=p, q=q, n=p * q, e=e,
+                             d=modular_reciprocal(e, phi_n))
+    def __setattr__(self, name, value):
+        raise AttributeError("RSA keys are immutable")
+    @classmethod
+    def from_components(cls, p, q, e, d, qinv=None, validate=False):
+        """Build a private key from all its components, trusting the
+        given private exponent d (and, if given, inverse of q modulo p)
+        instead of calculating them.  Only cheap consistency checks are
+        done, plus a primality test of p and q if validate is true."""
+        if validate:
+            _validate_primes(p, q)
+        if not (0 < e and 0 < d and
+                e * d % (p - 1) == 1 and e * d % (q - 1) == 1):
+            raise CryptoValueError("inconsistent exponents %u and %u" %
+                                   (e, d))
+        if qinv is not None and q * qinv % p != 1:
+            raise CryptoValueError("%u is not the inverse of q (mod p)"
+                                   % qinv)
+        key = cls.__new__(cls)
+        key.__dict__.update(p=p, q=q, n=p * q, e=e, d=d)
+        if qinv is not None:
+            key.__dict__['qinv'] = qinv
+        return key
+    @classmethod
+    def from_exponents(cls, n, e, d):
+        """Build a private key from the modulus n and the exponents e and
+        d only, recovering the prime factors of n (so that the resulting
+        key allows to use the Chinese Reminder Theorem optimization).
+
+          >>> key = PrivateKey(p=2**89-1, q=2**107-1, e=65537)
+          >>> recovered = PrivateKey.from_exponents(key.n, key.e, key.d)
+          >>> recovered.p == key.q and recovered.q == key.p
+          True
+          >>> recovered.public() == key.public()
+          True
+        """
+        p, q = _factor_modulus(n, e, d)
+        return cls.from_components(p, q, e, d)
+    @classmethod
+    def from_der(cls, data, validate=False):
+        """Build a private key from its PKCS#1 DER encoding; if validate
+        is true, check that its primes are really prime."""
+        return _private_key_from_der(cls, data, validate)
+    @classmethod
+    def from_pem(cls, text, validate=False):
+        """Build a private key from its PKCS#1 PEM encoding; if validate
+        is true, check that its primes are really prime."""
+        return cls.from_der(_pem_decode(text, _PEM_PRIVATE_LABEL), validate)
+    def to_der(self):
+        """Return the PKCS#1 DER encoding of the key."""
+        return _private_key_to_der(self)
+    def to_pem(self):
+        """Return the PKCS#1 PEM encoding of the key."""
+        return _pem_encode(self.to_der(), _PEM_PRIVATE_LABEL)
     def __eq__(self, other):
         return (self.p == other.p and self.q == other.q
                 and self.d == other.d)
@@ -456,6 +987,193 @@ class PrivateKey:
         return self.public_key_class(self.n, self.e)
     def bit_length(self):
         return self.n.bit_length()
+    def fingerprint(self):
+        """Return a digest (as a byte sequence) identifying the key; this
+        is the same as the fingerprint of the corresponding public key."""
+        return _key_fingerprint(self.n, self.e)
+
+
+def _is_private_key(key):
+    return hasattr(key, 'p') and hasattr(key, 'q')
+
+
+class KeyContext:
+    """All the data derived from a RSA key that is needed to encrypt and
+    decrypt with it.  Key contexts are immutable, and thus can be shared
+    by all the encrypters using the same key; you should normally obtain
+    them through the `key_contexts' registry rather than instantiating
+    them directly."""
+
+    def __init__(self, key, mod_n=None):
+        """The key might be a public RSA key or a private RSA key.  The
+        class of the integers modulo n can be passed in if already
+        available (e.g., with its CRT precomputations done)."""
+        # If it is a private key, we can use an optimized implementation
+        # to improve encryption and decryption performances.
+        set_attr = super(KeyContext, self).__setattr__
+        set_attr('key', key)
+        set_attr('fingerprint', key.fingerprint())
+        set_attr('is_private', _is_private_key(key))
+        if mod_n is not None:
+            set_attr('mod_n', mod_n)
+        elif self.is_private:
+            set_attr('mod_n', integer_mod_pq_class(
+                key.p, key.q, _p_reciprocal_from_qinv(key)))
+        else:
+            set_attr('mod_n', integer_mod_class(key.n))
+
+    def __reduce__(self):
+        # Unpickled contexts are taken from the registry, so that they
+        # are shared with the existing encrypters if possible.
+        return (_registered_key_context, (self.key,))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("key contexts are immutable")
+
+    def matches(self, key):
+        """Whether the context can be used for the given key."""
+        if (key.fingerprint() != self.fingerprint
+                or _is_private_key(key) != self.is_private):
+            return False
+        return (not self.is_private or
+                set((key.p, key.q)) == set((self.key.p, self.key.q)))
+
+
+class KeyContextRegistry:
+    """A thread-safe registry of key contexts, indexed by the fingerprint
+    of their keys.  When the registry is full, the least recently used
+    contexts are evicted.
+
+      >>> registry = KeyContextRegistry(max_size=2)
+      >>> key1 = PrivateKey(p=4111, q=4703, e=127)
+      >>> key2 = PrivateKey(p=99713, q=104707, e=997)
+      >>> ctx = registry.get(key1)
+      >>> registry.get(PrivateKey(p=4111, q=4703, e=127)) is ctx
+      True
+      >>> # Public and private keys get different contexts.
+      >>> registry.get(key1.public()) is ctx
+      False
+      >>> len(registry)
+      2
+      >>> registry.get(key2) is registry.get(key2)
+      True
+      >>> len(registry)
+      2
+      >>> registry.get(key1) is ctx  # was evicted
+      False
+    """
+
+    def __init__(self, max_size=128):
+        """If `max_size' is 0, contexts are never cached."""
+        self.max_size = max_size
+        self._contexts = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._contexts)
+
+    def clear(self):
+        with self._lock:
+            self._contexts.clear()
+
+    def get(self, key, mod_n=None):
+        """Return a context for the given key, building it if needed;
+        mod_n is passed to `KeyContext' in that case."""
+        index = (key.fingerprint(), _is_private_key(key))
+        with self._lock:
+            context = self._contexts.pop(index, None)
+            if context is not None and context.matches(key):
+                # Mark it as the most recently used.
+                self._contexts[index] = context
+                return context
+        # Build the context outside the lock, since this might take a
+        # while for big keys.
+        context = KeyContext(key, mod_n)
+        with self._lock:
+            self._contexts[index] = context
+            while len(self._contexts) > self.max_size:
+                self._contexts.popitem(last=False)
+        return context
+
+
+"""The process-wide registry of key contexts used by the encrypters."""
+key_contexts = KeyContextRegistry()
+
+_BYTES_TYPES = (type(b''), bytearray, memoryview)
+
+def _iterbytes(blocks):
+    for block in blocks:
+        for byte in block:
+            yield byte
+
+def _registered_key_context(key):
+    return key_contexts.get(key)
+
+
+class ChunkCache:
+    """A thread-safe cache of the results of the encryption and decryption
+    of single integers (i.e., chunks); when the cache is full, the least
+    recently used results are evicted.  Since our encryption is
+    deterministic, an encrypter using a cache doesn't have to repeat the
+    exponentiations for the chunks it has already seen (e.g., the
+    zero-filled blocks of a disk image).  A cache can be shared among
+    many encrypters, even if they use different keys.
+
+      >>> cache = ChunkCache(max_size=100)
+      >>> key = PrivateKey(p=4111, q=4703, e=127)
+      >>> E = BinaryEncrypter(key, chunk_cache=cache)
+      >>> ciphertext = b''.join(E.encrypt(b'\\0' * 300))
+      >>> cache.hits, cache.misses
+      (149, 1)
+      >>> b''.join(E.decrypt(ciphertext)) == b'\\0' * 300
+      True
+      >>> cache.hits, cache.misses, len(cache)
+      (298, 2, 2)
+    """
+
+    def __init__(self, max_size=1024):
+        if max_size <= 0:
+            raise CryptoValueError("cache size must be positive")
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._results = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    # Only the size of the cache is pickled, not its contents.
+    def __getstate__(self):
+        return {'max_size': self.max_size}
+    def __setstate__(self, state):
+        self.__init__(state['max_size'])
+
+    def __len__(self):
+        return len(self._results)
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+
+    def get(self, index, compute):
+        """Return the result cached under index, calling compute (without
+        arguments) to obtain it if it is not there."""
+        with self._lock:
+            try:
+                result = self._results.pop(index)
+            except KeyError:
+                self.misses += 1
+            else:
+                # Mark it as the most recently used.
+                self._results[index] = result
+                self.hits += 1
+                return result
+        # Compute the result outside the lock, so that other threads
+        # are not held up by the exponentiation.
+        result = compute()
+        with self._lock:
+            self._results[index] = result
+            while len(self._results) > self.max_size:
+                self._results.popitem(last=False)
+        return result
 
 
 class BasicEncrypter:
@@ -494,23 +1212,30 @@ class BasicEncrypter:
       CryptoRuntimeError: can't decrypt without a private key
     """
 
-    def __init__(self, key):
+    def __init__(self, key, crt_executor=None, chunk_cache=None):
         """ The key might be a public RSA key or a private RSA key."""
-        # But we can decrypt only if it is a private key, in which case we
-        # can also used on optimized implementation to improve encryption
-        # and decryption performances.
+        # But we can decrypt only if it is a private key.  If an executor
+        # is given, the decryptions do half of their work in it (see
+        # `IntegerModPQ.pow_parallel').  If a `ChunkCache' is given, the
+        # results of the encryption and decryption of single integers
+        # are cached in it.
         self.key = key
-        try:
-            key.p, key.q
-        except AttributeError:
-            # is a public key
-            class mod_n(IntegerMod):
-                modulo = key.n
-        else:
-            # is a private key
-            class mod_n(IntegerModPQ):
-                p, q = key.p, key.q
-        self.mod_n = mod_n
+        self.context = key_contexts.get(key)
+        self.mod_n = self.context.mod_n
+        self.crt_executor = crt_executor
+        self.chunk_cache = chunk_cache
+
+    # Encrypters are pickled together with their key context; the
+    # other data derived from the key is rebuilt from it.  Executors
+    # can't be pickled, so they are left behind.
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['mod_n']
+        state['crt_executor'] = None
+        return state
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.mod_n = self.context.mod_n
 
     #
     # Transform the encrypted/decrypted messages into/from a sequence
@@ -550,26 +1275,107 @@ class BasicEncrypter:
         By default, equivalent to 'i2o'"""
         return self.i2o(integer)
 
-    def _modexp(self, integer, exponent):
+    def _modexp(self, integer, exponent, deadline=None, executor=None):
         if not 0 <= integer < self.key.n:
             raise CryptoValueError("integer %d out of range" % integer)
-        return (self.mod_n(integer)**exponent).residue
-
-    def _encrypt(self, integer):
-        return self._modexp(integer, self.key.e)
+        try:
+            if executor is None:
+                return self.mod_n(integer).pow_with_deadline(
+                    exponent, deadline).residue
+            return self.mod_n(integer).pow_parallel(exponent, executor,
+                                                    deadline).residue
+        except IMTimeoutError as e:
+            raise CryptoTimeoutError(str(e))
+
+    def _modexp_many(self, integers, exponent, deadline=None):
+        integers = list(integers)
+        n = self.key.n
+        for integer in integers:
+            if not 0 <= integer < n:
+                raise CryptoValueError("integer %d out of range" % integer)
+        try:
+            powers = self.mod_n.pow_many(integers, exponent, deadline)
+        except IMTimeoutError as e:
+            raise CryptoTimeoutError(str(e))
+        return [x.residue for x in powers]
 
-    def _decrypt(self, integer):
+    def _private_exponent(self):
         try:
-            d = self.key.d
+            return self.key.d
         except AttributeError:
             raise CryptoRuntimeError("can't decrypt without a private key")
-        else:
-            return self._modexp(integer, d)
 
-    def encrypt(self, plaintext):
-        return self.i2c(map(self._encrypt, self.p2i(plaintext)))
-    def decrypt(self, ciphertext):
-        return self.i2p(map(self._decrypt, self.c2i(ciphertext)))
+    def _cached(self, private, integer, compute):
+        if self.chunk_cache is None:
+            return compute()
+        return self.chunk_cache.get(
+            (self.context.fingerprint, private, integer), compute)
+
+    def _encrypt(self, integer, deadline=None):
+        return self._cached(False, integer, lambda:
+                            self._modexp(integer, self.key.e, deadline))
+
+    def _decrypt(self, integer, deadline=None):
+        d = self._private_exponent()
+        return self._cached(True, integer, lambda:
+                            self._modexp(integer, d, deadline,
+                                         self.crt_executor))
+
+    # If a `Deadline' is given, the encryption/decryption is interrupted
+    # with a `CryptoTimeoutError' once it expires.  Note that, when the
+    # result is returned through a generator, the deadline applies to
+    # the whole iteration over it (so `map' can't be used here, since
+    # it's not lazy in python 2).
+    def encrypt(self, plaintext, deadline=None):
+        return self.i2c(self._encrypt(x, deadline)
+                        for x in self.p2i(plaintext))
+    def decrypt(self, ciphertext, deadline=None):
+        return self.i2p(self._decrypt(x, deadline)
+                        for x in self.c2i(ciphertext))
+
+    # Batch encryption/decryption of integers < n.  These work directly
+    # on the integers, without the conversions done by o2i/i2o and
+    # friends (so they behave the same in all the subclasses), and share
+    # the setup of the exponentiations among all the elements.
+    def encrypt_many(self, integers, deadline=None):
+        """Encrypt all the given integers, returning a list."""
+        return self._modexp_many(integers, self.key.e, deadline)
+    def decrypt_many(self, integers, deadline=None):
+        """Decrypt all the given integers, returning a list."""
+        return self._modexp_many(integers, self._private_exponent(),
+                                 deadline)
+
+    # Encrypters (as well as their keys and contexts) are never modified
+    # after their creation, so they can be used by many threads at once.
+    def map_parallel(self, function, messages, executor=None,
+                     max_workers=None):
+        """Apply function, normally the `encrypt' or `decrypt' method of
+        this encrypter, to all the given messages, in the threads of the
+        given executor (or of a new `concurrent.futures.ThreadPoolExecutor'
+        with `max_workers' threads).  Return the list of the results; the
+        results given as iterators (e.g., by a `BinaryEncrypter') are
+        turned into lists.  Note that only on free-threaded builds of
+        python the threads really run in parallel.
+
+          >>> D = IntegerEncrypter(PrivateKey(p=4111, q=4703, e=127))
+          >>> D.map_parallel(D.decrypt, D.map_parallel(D.encrypt, [1, 7, 0]))
+          ... #doctest: +SKIP
+          [1, 7, 0]
+        """
+        def apply(message):
+            # Consume the iterators in the worker thread, where the
+            # encryption/decryption really takes place.
+            result = function(message)
+            try:
+                is_iterator = iter(result) is result
+            except TypeError:
+                is_iterator = False
+            return list(result) if is_iterator else result
+        if executor is not None:
+            return list(executor.map(apply, messages))
+        import concurrent.futures
+        with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+            return list(executor.map(apply, messages))
 
 
 class IntegerEncrypter(BasicEncrypter):
@@ -762,8 +1568,9 @@ class BinaryEncrypter(BasicEncrypter):
     # suffice (this length is simply one-eight of the length in bits
     # of n, rounded *up*).
 
-    def __init__(self, key):
-        super(BinaryEncrypter, self).__init__(key)
+    def __init__(self, key, crt_executor=None, chunk_cache=None):
+        super(BinaryEncrypter, self).__init__(key, crt_executor,
+                                              chunk_cache)
         self._setup_byte_lengths(key.n)
 
     def _setup_byte_lengths(self, n):
@@ -824,18 +1631,2190 @@ class BinaryEncrypter(BasicEncrypter):
             # Yield one encrypted chunk at a time.
             yield b''.join(map(_ord2byte, digits))
 
+    def _blocks2i(self, blocks, is_plain):
+        # Like `_o2i', but for an iterable of blocks of bytes of any size.
+        # The blocks are split into whole chunks at once, except for the
+        # chunks straddling two blocks, which are gathered apart.
+        chunk_length = self._chunk_bytelen(is_plain)
+        pending = bytearray()
+        for block in blocks:
+            view = memoryview(block)
+            start = 0
+            if pending:
+                start = min(chunk_length - len(pending), len(view))
+                pending.extend(view[:start].tobytes())
+                if len(pending) < chunk_length:
+                    continue
+                yield self._chunk2i(bytes(pending), is_plain)
+                del pending[:]
+            end = len(view) - (len(view) - start) % chunk_length
+            for offset in range(start, end, chunk_length):
+                # Not bytes(), which gives the repr of the view in
+                # python 2.
+                yield self._chunk2i(
+                    view[offset:offset+chunk_length].tobytes(), is_plain)
+            pending.extend(view[end:].tobytes())
+        if pending:
+            if is_plain:
+                yield self._chunk2i(bytes(pending), is_plain)
+            else:
+                raise CryptoValueError(
+                    "input is not aligned (%u unconverted bytes)"
+                    % len(pending))
+
+    def _chunk2i(self, chunk, is_plain):
+        # The same conversion done by `_o2i' on the byte string chunk,
+        # with the digits in little-endian order.
+        digits = chunk[::-1]
+        if is_plain:
+            digits = b'\xff' + digits
+        return _bytes2int(digits)
+
+    # A single sequence of bytes is converted as a single block, which
+    # is much faster than going through it a byte at a time.
     def p2i(self, bytes):
+        if isinstance(bytes, _BYTES_TYPES):
+            return self._blocks2i([bytes], is_plain=True)
         return self._o2i(bytes, is_plain=True)
 
     def c2i(self, bytes):
+        if isinstance(bytes, _BYTES_TYPES):
+            return self._blocks2i([bytes], is_plain=False)
         return self._o2i(bytes, is_plain=False)
 
+    def p2i_blocks(self, blocks):
+        """From an iterable of blocks of plaintext bytes, of any size, to
+        sequence of integers.  Same as `p2i' applied to the concatenation
+        of the blocks."""
+        return self._blocks2i(blocks, is_plain=True)
+
+    def c2i_blocks(self, blocks):
+        """From an iterable of blocks of ciphertext bytes, of any size, to
+        sequence of integers.  Same as `c2i' applied to the concatenation
+        of the blocks."""
+        return self._blocks2i(blocks, is_plain=False)
+
+    def encrypt_blocks(self, blocks, deadline=None):
+        """Like `encrypt', but for plaintext given as an iterable of blocks
+        of bytes of any size (e.g., the data read from a socket).
+
+          >>> E = BinaryEncrypter(PrivateKey(p=4111, q=4703, e=127))
+          >>> blocks = [b'foo', b'', b'b', b'arbaz']
+          >>> ciphertext = b''.join(E.encrypt_blocks(blocks))
+          >>> ciphertext == b''.join(E.encrypt(b'foobarbaz'))
+          True
+          >>> (b''.join(E.decrypt_blocks([ciphertext[:5], ciphertext[5:]]))
+          ...  == b'foobarbaz')
+          True
+        """
+        return self.i2c(self._encrypt(x, deadline)
+                        for x in self.p2i_blocks(blocks))
+
+    def decrypt_blocks(self, blocks, deadline=None):
+        """Like `decrypt', but for ciphertext given as an iterable of
+        blocks of bytes of any size."""
+        return self.i2p(self._decrypt(x, deadline)
+                        for x in self.c2i_blocks(blocks))
+
     def i2p(self, integers):
         return self._i2o(integers, is_plain=True)
 
     def i2c(self, integers):
         return self._i2o(integers, is_plain=False)
 
+class PackedBinaryEncrypter(BinaryEncrypter):
+    """Like `BinaryEncrypter', but pack the plaintext more tightly: each
+    integer is filled with as many bits of plaintext as it can hold, i.e.
+    one less than the bits of n, without regard for byte boundaries and
+    without any padding byte.  The number of bits in the final integer is
+    carried by an additional trailer integer, encrypted like the others.
+    This cuts both the number of chunks (and thus of exponentiations) and
+    the size of the ciphertext, especially with small keys:
+
+      >>> key = PrivateKey(p=99713, q=104707, e=997)
+      >>> for encrypter in BinaryEncrypter(key), PackedBinaryEncrypter(key):
+      ...     ciphertext = b''.join(encrypter.encrypt(b'x' * 1000))
+      ...     print(len(ciphertext))
+      1670
+      1220
+      >>> b''.join(encrypter.decrypt(ciphertext)) == b'x' * 1000
+      True
+
+    Since the chunks of plaintext are not made of whole bytes, the
+    encrypters of this class can't be used with the APIs relying on the
+    chunk geometry (like `encrypt_container' and `encrypt_file')."""
+
+    def _setup_byte_lengths(self, n):
+        super(PackedBinaryEncrypter, self)._setup_byte_lengths(n)
+        self.plain_chunk_bit_length = n.bit_length() - 1
+        self.plain_chunk_byte_length = None
+
+    def p2i_blocks(self, blocks):
+        return self.p2i(_iterbytes(blocks))
+
+    def p2i(self, bytes):
+        width = self.plain_chunk_bit_length
+        mask = (1 << width) - 1
+        accumulator, bit_count, total = 0, 0, 0
+        for byte in bytes:
+            # The bits are packed in little-endian order, as the digits
+            # of the chunks of a `BinaryEncrypter'.
+            accumulator |= _byte2ord(byte) << bit_count
+            bit_count += 8
+            total += 1
+            if bit_count >= width:
+                yield accumulator & mask
+                accumulator >>= width
+                bit_count -= width
+        if bit_count > 0:
+            yield accumulator
+        # The trailer: the number of bits in the last integer.
+        yield bit_count or (width if total else 0)
+
+    def i2p(self, integers):
+        width = self.plain_chunk_bit_length
+        held = []
+        accumulator, bit_count = 0, 0
+        for integer in integers:
+            # The last two integers (the partial one and the trailer)
+            # can only be dealt with at the end.
+            held.append(integer)
+            if len(held) < 3:
+                continue
+            accumulator, bit_count, data = self._unpack_bits(
+                held.pop(0), width, accumulator, bit_count)
+            yield data
+        if not held:
+            raise CryptoValueError("missing trailer")
+        trailer = held.pop()
+        if held:
+            if not 0 < trailer <= width:
+                raise CryptoValueError("invalid trailer %u" % trailer)
+            accumulator, bit_count, data = self._unpack_bits(
+                held.pop(), trailer, accumulator, bit_count)
+            yield data
+        elif trailer != 0:
+            raise CryptoValueError("invalid trailer %u" % trailer)
+        if bit_count > 0:
+            raise CryptoValueError("plaintext is not made of whole bytes")
+
+    def _unpack_bits(self, integer, width, accumulator, bit_count):
+        if integer >> width:
+            raise CryptoValueError("too many bits in integer %u" % integer)
+        accumulator |= integer << bit_count
+        bit_count += width
+        length = bit_count // 8
+        if length == 0:
+            return accumulator, bit_count, b''
+        data = _int2bytes(accumulator & ((1 << 8 * length) - 1), length)
+        return accumulator >> 8 * length, bit_count % 8, data[::-1]
+
+#--------------------------------------------------------------------------
+
+
+## ------------------- ##
+##  Hybrid Encryption  ##
+## ------------------- ##
+
+# The output of a `HybridEncrypter' is made of:
+#   * an header, containing:
+#     - the magic string "PYRSAHY\0" (8 bytes);
+#     - the format version (1 byte);
+#     - the keystream algorithm (1 byte);
+#     - the segment size (4 bytes);
+#     - the fingerprint of the RSA key (32 bytes);
+#     - the length of the encapsulated key (2 bytes), followed by the
+#       encapsulated key itself;
+#   * a sequence of segments, each one made of up to `segment_size'
+#     bytes of encrypted data followed by its MAC (32 bytes); all the
+#     segments but the last one are full, and the last one is never
+#     full (it might also be empty).
+# All the integers are in big-endian format.
+#
+# The encapsulated key is a random integer r < n, encrypted with RSA;
+# the encryption and MAC keys are derived from it.  The MAC of a segment
+# is the HMAC-SHA256 of the header digest, the segment index, a flag
+# telling whether the segment is the last one, and the encrypted data;
+# so segments can't be modified, reordered or dropped undetected.
+
+_HYBRID_MAGIC = b'PYRSAHY\0'
+_HYBRID_VERSION = 1
+
+"""The keystream algorithms, as identified in the header."""
+HYBRID_SHAKE256 = 1
+HYBRID_HMAC_SHA256_CTR = 2
+
+def _xor_bytes(data, stream):
+    # Much faster than xoring the bytes one by one.
+    if not data:
+        return b''
+    return _int2bytes(_bytes2int(data) ^ _bytes2int(stream[:len(data)]),
+                      len(data))
+
+def _shake256_keystream(key, index, length):
+    return hashlib.shake_256(key + _int2bytes(index, 8)).digest(length)
+
+def _hmac_sha256_ctr_keystream(key, index, length):
+    prefix = _int2bytes(index, 8)
+    blocks = [hmac.new(key, prefix + _int2bytes(counter, 8),
+                       hashlib.sha256).digest()
+              for counter in range((length + 31) // 32)]
+    return b''.join(blocks)[:length]
+
+_hybrid_keystreams = {
+    HYBRID_SHAKE256: _shake256_keystream,
+    HYBRID_HMAC_SHA256_CTR: _hmac_sha256_ctr_keystream,
+}
+
+"""The default keystream algorithm; SHAKE-256 is not available before
+python 3.6."""
+if hasattr(hashlib, 'shake_256'):
+    DEFAULT_HYBRID_ALGORITHM = HYBRID_SHAKE256
+else:
+    DEFAULT_HYBRID_ALGORITHM = HYBRID_HMAC_SHA256_CTR
+
+class HybridEncrypter(BasicEncrypter):
+    """Encrypt/Decrypt sequences of bytes of any length, using RSA only
+    to encrypt a random session key, and a keystream derived from it
+    (plus a MAC) for the data itself.  So, however big the data is, only
+    one RSA encryption/decryption is needed.
+
+    The data can be given all at once to `encrypt' and `decrypt', or as
+    an iterable of blocks to `encrypt_stream' and `decrypt_stream'; in
+    both cases, a generator of blocks of bytes is returned.  A decrypted
+    segment is only returned after its MAC has been checked.
+
+      >>> key = PrivateKey(p=2**521-1, q=2**607-1, e=65537)
+      >>> E = HybridEncrypter(key.public())
+      >>> D = HybridEncrypter(key)
+      >>> plaintext = b'foobar' * 100000
+      >>> ciphertext = b''.join(E.encrypt(plaintext))
+      >>> len(ciphertext) - len(plaintext) < 512
+      True
+      >>> b''.join(D.decrypt(ciphertext)) == plaintext
+      True
+    """
+
+    """Default number of bytes of data in each segment."""
+    default_segment_size = 2**16
+
+    def __init__(self, key, crt_executor=None, segment_size=None,
+                 algorithm=DEFAULT_HYBRID_ALGORITHM):
+        super(HybridEncrypter, self).__init__(key, crt_executor)
+        if segment_size is None:
+            segment_size = self.default_segment_size
+        if not 0 < segment_size < 2**32:
+            raise CryptoValueError("invalid segment size %r" % segment_size)
+        if algorithm not in _hybrid_keystreams:
+            raise CryptoValueError("unknown keystream algorithm %r"
+                                   % algorithm)
+        self.segment_size = segment_size
+        self.algorithm = algorithm
+        self.n_byte_length = (key.n.bit_length() + 7) // 8
+
+    def _session_keys(self, r):
+        secret = _int2bytes(r, self.n_byte_length)
+        return (hmac.new(secret, b'py-rsa hybrid encryption',
+                         hashlib.sha256).digest(),
+                hmac.new(secret, b'py-rsa hybrid authentication',
+                         hashlib.sha256).digest())
+
+    def _segment_mac(self, mac_key, header_digest, index, is_last, data):
+        return hmac.new(mac_key, header_digest + _int2bytes(index, 8) +
+                        (b'\x01' if is_last else b'\x00') + data,
+                        hashlib.sha256).digest()
+
+    def encrypt(self, plaintext, deadline=None):
+        return self.encrypt_stream([plaintext], deadline)
+
+    def decrypt(self, ciphertext, deadline=None):
+        return self.decrypt_stream([ciphertext], deadline)
+
+    def encrypt_stream(self, blocks, deadline=None):
+        """Encrypt the concatenation of the given blocks of bytes,
+        returning a generator of blocks of encrypted bytes."""
+        # Don't wait for the first item to be requested to do the RSA
+        # encryption, so that errors show up early.
+        r = random.SystemRandom().randrange(2, self.key.n - 1)
+        encapsulated = _int2bytes(self._encrypt(r, deadline),
+                                  self.n_byte_length)
+        header = b''.join([_HYBRID_MAGIC, _int2bytes(_HYBRID_VERSION, 1),
+                           _int2bytes(self.algorithm, 1),
+                           _int2bytes(self.segment_size, 4),
+                           self.context.fingerprint,
+                           _int2bytes(len(encapsulated), 2), encapsulated])
+        return self._encrypt_segments(header, self._session_keys(r), blocks)
+
+    def _encrypt_segments(self, header, session_keys, blocks):
+        yield header
+        header_digest = hashlib.sha256(header).digest()
+        keystream = _hybrid_keystreams[self.algorithm]
+        encryption_key, mac_key = session_keys
+        size = self.segment_size
+        buffer = bytearray()
+        index = 0
+        blocks = iter(blocks)
+        while True:
+            block = next(blocks, None)
+            if block is not None:
+                buffer.extend(block)
+            # The last segment is never full, so keep a full one in the
+            # buffer until we know there is more data.
+            while len(buffer) > size or (block is None and buffer):
+                data = bytes(buffer[:size])
+                del buffer[:size]
+                is_last = len(data) < size
+                encrypted = _xor_bytes(
+                    data, keystream(encryption_key, index, len(data)))
+                yield encrypted + self._segment_mac(
+                    mac_key, header_digest, index, is_last, encrypted)
+                index += 1
+                if is_last:
+                    return
+            if block is None:
+                # Empty last segment.
+                yield self._segment_mac(mac_key, header_digest, index,
+                                        True, b'')
+                return
+
+    def decrypt_stream(self, blocks, deadline=None):
+        """Decrypt the concatenation of the given blocks of bytes,
+        returning a generator of blocks of decrypted bytes."""
+        return self._decrypt_segments(iter(blocks), deadline)
+
+    def _decrypt_segments(self, blocks, deadline):
+        buffer = bytearray()
+        def fill(length):
+            # Read until the buffer has at least length bytes; return
+            # False if the data ends before that.
+            while len(buffer) < length:
+                block = next(blocks, None)
+                if block is None:
+                    return False
+                buffer.extend(block)
+            return True
+        fixed_length = len(_HYBRID_MAGIC) + 38
+        if (not fill(fixed_length + 2)
+                or bytes(buffer[:len(_HYBRID_MAGIC)]) != _HYBRID_MAGIC):
+            raise CryptoValueError("not hybrid-encrypted data")
+        position = len(_HYBRID_MAGIC)
+        version = buffer[position]
+        algorithm = buffer[position + 1]
+        size = _bytes2int(bytes(buffer[position+2:position+6]))
+        fingerprint = bytes(buffer[position+6:position+38])
+        if version != _HYBRID_VERSION:
+            raise CryptoValueError("unsupported hybrid encryption version %u"
+                                   % version)
+        if algorithm not in _hybrid_keystreams or size == 0:
+            raise CryptoValueError("invalid hybrid encryption header")
+        if fingerprint != self.context.fingerprint:
+            raise CryptoValueError("data encrypted with a different key")
+        encapsulated_length = _bytes2int(bytes(buffer[fixed_length:
+                                                      fixed_length+2]))
+        header_length = fixed_length + 2 + encapsulated_length
+        if not fill(header_length):
+            raise CryptoValueError("truncated hybrid encryption header")
+        header = bytes(buffer[:header_length])
+        del buffer[:header_length]
+        r = self._decrypt(_bytes2int(header[-encapsulated_length:]),
+                          deadline)
+        encryption_key, mac_key = self._session_keys(r)
+        header_digest = hashlib.sha256(header).digest()
+        keystream = _hybrid_keystreams[algorithm]
+        index = 0
+        while True:
+            # A full segment is never the last one: make sure there's
+            # something after it.
+            is_last = not fill(size + 32 + 1)
+            if is_last and len(buffer) > size + 31:
+                raise CryptoValueError("truncated hybrid-encrypted data")
+            if is_last and len(buffer) < 32:
+                raise CryptoValueError("truncated hybrid-encrypted data")
+            length = len(buffer) - 32 if is_last else size
+            encrypted = bytes(buffer[:length])
+            mac = bytes(buffer[length:length+32])
+            del buffer[:length+32]
+            expected = self._segment_mac(mac_key, header_digest, index,
+                                         is_last, encrypted)
+            if not hmac.compare_digest(mac, expected):
+                raise CryptoValueError("hybrid-encrypted data failed "
+                                       "authentication")
+            if encrypted:
+                yield _xor_bytes(encrypted,
+                                 keystream(encryption_key, index, length))
+            if is_last:
+                return
+            index += 1
+
+#--------------------------------------------------------------------------
+
+
+## ------------- ##
+##  Compression  ##
+## ------------- ##
+
+# Every byte of plaintext costs a share of an RSA exponentiation, so it
+# pays off to compress the plaintext before encrypting it.  These are
+# streaming stages that can be put in front of
+# `BinaryEncrypter.encrypt_blocks' and after `BinaryEncrypter.decrypt'.
+
+COMPRESSION_NONE = 0
+COMPRESSION_ZLIB = 1
+COMPRESSION_BZ2 = 2
+COMPRESSION_LZMA = 3
+
+_COMPRESSION_MODULES = {
+    COMPRESSION_ZLIB: 'zlib',
+    COMPRESSION_BZ2: 'bz2',
+    COMPRESSION_LZMA: 'lzma',
+}
+
+def _compression_module(method):
+    try:
+        name = _COMPRESSION_MODULES[method]
+    except KeyError:
+        raise CryptoValueError("unknown compression method %r" % (method,))
+    # Not all of them are available everywhere (e.g., lzma is missing
+    # in python 2).
+    try:
+        return __import__(name)
+    except ImportError:
+        raise CryptoRuntimeError("compression method %s not available"
+                                 % name)
+
+def compress_blocks(blocks, method=COMPRESSION_ZLIB):
+    """Compress the given iterable of blocks of bytes with the given
+    method, returning a generator of blocks of compressed bytes.
+
+      >>> E = BinaryEncrypter(PrivateKey(p=2**89-1, q=2**107-1, e=65537))
+      >>> ciphertext = b''.join(E.encrypt_blocks(
+      ...     compress_blocks([b'foobar' * 1000])))
+      >>> len(ciphertext) < 100
+      True
+      >>> len(b''.join(decompress_blocks(E.decrypt(ciphertext))))
+      6000
+    """
+    module = _compression_module(method)
+    if method == COMPRESSION_ZLIB:
+        compressor = module.compressobj()
+    elif method == COMPRESSION_BZ2:
+        compressor = module.BZ2Compressor()
+    else:
+        compressor = module.LZMACompressor()
+    for block in blocks:
+        data = compressor.compress(block)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def decompress_blocks(blocks, method=COMPRESSION_ZLIB):
+    """The inverse of `compress_blocks'.  A `CryptoValueError' is raised
+    if the compressed data is corrupted or truncated."""
+    module = _compression_module(method)
+    if method == COMPRESSION_ZLIB:
+        decompressor = module.decompressobj()
+    elif method == COMPRESSION_BZ2:
+        decompressor = module.BZ2Decompressor()
+    else:
+        decompressor = module.LZMADecompressor()
+    errors = (IOError, OSError, EOFError, ValueError,
+              getattr(module, 'error', IOError),
+              getattr(module, 'LZMAError', IOError))
+    def call(function, *args):
+        # Only the errors of the decompressor itself are about the
+        # compressed data; those raised while getting the blocks (e.g.,
+        # by a decrypter) must go through unchanged.
+        try:
+            return function(*args)
+        except errors as e:
+            raise CryptoValueError("corrupted compressed data: %s" % e)
+    for block in blocks:
+        data = call(decompressor.decompress, block)
+        if data:
+            yield data
+    # Before flushing, which prevents inspecting the state of the zlib
+    # decompressor of python 2.
+    complete = call(_decompression_complete, decompressor, module, method)
+    if method == COMPRESSION_ZLIB:
+        data = call(decompressor.flush)
+        if data:
+            yield data
+    if not complete:
+        raise CryptoValueError("truncated compressed data")
+    if decompressor.unused_data:
+        raise CryptoValueError("garbage after compressed data")
+
+def _decompression_complete(decompressor, module, method):
+    # Whether the end of the compressed stream was reached.  The
+    # decompressors of python 2 don't tell it directly: the bz2 one
+    # refuses any further data, while the zlib one leaves it unused.
+    try:
+        return decompressor.eof
+    except AttributeError:
+        pass
+    if method == COMPRESSION_BZ2:
+        try:
+            decompressor.decompress(b'')
+        except EOFError:
+            return True
+        return False
+    probe = decompressor.copy()
+    try:
+        probe.decompress(b'\0')
+    except module.error:
+        return False
+    return bool(probe.unused_data)
+
+#--------------------------------------------------------------------------
+
+
+## ----------------------- ##
+##  Ciphertext Containers  ##
+## ----------------------- ##
+
+# A container holds the ciphertext produced by a `BinaryEncrypter',
+# together with the information needed to decrypt any part of it without
+# decrypting it all.  Its format is:
+#   * an header of fixed length, containing:
+#     - the magic string "PYRSACT\0" (8 bytes);
+#     - the format version (1 byte);
+#     - flags (1 byte): bit 0 is set if the container has an index,
+#       bits 1 and 2 tell the compression method (see below);
+#     - the length of the ciphertext chunks (4 bytes);
+#     - the length of the plaintext chunks (4 bytes);
+#     - the length of the (uncompressed) plaintext (8 bytes);
+#     - the fingerprint of the RSA key (32 bytes);
+#     - the CRC-32 of all the above (4 bytes);
+#   * the ciphertext chunks, each one followed by its CRC-32 (4 bytes)
+#     only if the container has an index.
+# All the integers are in big-endian format.  Since the geometry of the
+# chunks is fixed, the chunks covering any range of the plaintext can be
+# found directly; the index allows to detect corrupted chunks.  Data
+# past the last chunk can only be left by an interrupted append, and is
+# ignored (the header is always updated last).  If the
+# plaintext was compressed before being encrypted (with one of the
+# COMPRESSION_* methods of `compress_blocks'), the chunks contain the
+# compressed data instead; such containers are smaller, but accessing a
+# range of their plaintext requires decompressing everything before it,
+# and they can't be appended to.
+
+_CONTAINER_MAGIC = b'PYRSACT\0'
+_CONTAINER_VERSION = 1
+_CONTAINER_INDEXED = 0x01
+_CONTAINER_COMPRESSION_SHIFT = 1
+_CONTAINER_FLAGS = 0x07
+_CONTAINER_HEADER_LENGTH = len(_CONTAINER_MAGIC) + 54
+
+def _crc32(data):
+    return binascii.crc32(data) & 0xffffffff
+
+def _check_byte_chunks(encrypter):
+    # The chunks of a `PackedBinaryEncrypter' are not made of whole bytes.
+    if encrypter.plain_chunk_byte_length is None:
+        raise CryptoValueError("encrypter chunks are not made of whole "
+                               "bytes")
+
+def _container_header(encrypter, flags, plaintext_length):
+    header = b''.join([_CONTAINER_MAGIC, _int2bytes(_CONTAINER_VERSION, 1),
+                       _int2bytes(flags, 1),
+                       _int2bytes(encrypter.n_byte_length, 4),
+                       _int2bytes(encrypter.plain_chunk_byte_length, 4),
+                       _int2bytes(plaintext_length, 8),
+                       encrypter.context.fingerprint])
+    return header + _int2bytes(_crc32(header), 4)
+
+def encrypt_container(encrypter, plaintext, indexed=False,
+                      compression=COMPRESSION_NONE):
+    """Encrypt the byte sequence plaintext with the `BinaryEncrypter'
+    encrypter, returning a container (see `ContainerReader') as a
+    generator of blocks of bytes.  If indexed is true, the container also
+    has an index of its chunks, to detect their corruption.  If a
+    compression method is given, the plaintext is compressed with it
+    before being encrypted.
+
+      >>> E = BinaryEncrypter(PrivateKey(p=2**89-1, q=2**107-1, e=65537))
+      >>> container = b''.join(encrypt_container(E, b'foobar' * 100))
+      >>> ContainerReader(E, container).decrypt_range(297, 9) == b'barfoobar'
+      True
+    """
+    _check_byte_chunks(encrypter)
+    if compression != COMPRESSION_NONE:
+        # Here rather than in the generator, to fail early.
+        _compression_module(compression)
+    flags = _CONTAINER_INDEXED if indexed else 0
+    header = _container_header(encrypter,
+                               flags | compression <<
+                               _CONTAINER_COMPRESSION_SHIFT,
+                               len(plaintext))
+    if compression != COMPRESSION_NONE:
+        blocks = compress_blocks([plaintext], compression)
+    else:
+        blocks = [plaintext]
+    return _container_blocks(encrypter, header, blocks, indexed)
+
+def _container_entry(chunk, indexed):
+    if indexed:
+        return chunk + _int2bytes(_crc32(chunk), 4)
+    return chunk
+
+def _container_blocks(encrypter, header, blocks, indexed):
+    yield header
+    for chunk in encrypter.encrypt_blocks(blocks):
+        yield _container_entry(chunk, indexed)
+
+class ContainerReader(object):
+    """Give random access to the plaintext of a container created by
+    `encrypt_container'.  The container can be given as a byte sequence
+    (or any object supporting the buffer protocol, e.g. a memory map), or
+    as a seekable binary file."""
+
+    # Number of chunks decrypted at once when decompressing.
+    decompression_batch_chunks = 64
+
+    def __init__(self, decrypter, source):
+        self.decrypter = decrypter
+        if hasattr(source, 'seek'):
+            self._file = source
+            source.seek(0, 2)
+            self.size = source.tell()
+        else:
+            self._file = None
+            self._view = memoryview(source)
+            self.size = len(self._view)
+        self._read_header()
+
+    def _read(self, offset, length):
+        if self._file is None:
+            return self._view[offset:offset+length].tobytes()
+        self._file.seek(offset)
+        return self._file.read(length)
+
+    def _read_header(self):
+        header = self._read(0, _CONTAINER_HEADER_LENGTH)
+        if (len(header) < _CONTAINER_HEADER_LENGTH
+                or header[:len(_CONTAINER_MAGIC)] != _CONTAINER_MAGIC):
+            raise CryptoValueError("not a ciphertext container")
+        if _bytes2int(header[-4:]) != _crc32(header[:-4]):
+            raise CryptoValueError("corrupted container header")
+        position = len(_CONTAINER_MAGIC)
+        version = _bytes2int(header[position:position+1])
+        if version != _CONTAINER_VERSION:
+            raise CryptoValueError("unsupported container version %u"
+                                   % version)
+        self.flags = _bytes2int(header[position+1:position+2])
+        if self.flags & ~_CONTAINER_FLAGS:
+            raise CryptoValueError("unsupported container flags 0x%02x"
+                                   % self.flags)
+        self.indexed = bool(self.flags & _CONTAINER_INDEXED)
+        self.compression = self.flags >> _CONTAINER_COMPRESSION_SHIFT
+        if self.compression != COMPRESSION_NONE:
+            _compression_module(self.compression)
+        self.cipher_chunk_length = _bytes2int(header[position+2:position+6])
+        self.plain_chunk_length = _bytes2int(header[position+6:position+10])
+        self.plaintext_length = _bytes2int(header[position+10:position+18])
+        fingerprint = header[position+18:position+50]
+        decrypter = self.decrypter
+        if fingerprint != decrypter.context.fingerprint:
+            raise CryptoValueError("container encrypted with a different key")
+        if (self.cipher_chunk_length != decrypter.n_byte_length or
+                self.plain_chunk_length !=
+                decrypter.plain_chunk_byte_length):
+            raise CryptoValueError("unexpected container chunk geometry")
+        entry_length = self.cipher_chunk_length + 4 * self.indexed
+        if self.compression == COMPRESSION_NONE:
+            self.chunk_count = -(-self.plaintext_length //
+                                 self.plain_chunk_length)
+        else:
+            # The length of the compressed data is not recorded.
+            self.chunk_count = max(self.size - _CONTAINER_HEADER_LENGTH,
+                                   0) // entry_length
+        expected_size = (_CONTAINER_HEADER_LENGTH +
+                         self.chunk_count * entry_length)
+        if (self.size < expected_size or self.size != expected_size
+                and self.compression != COMPRESSION_NONE):
+            raise CryptoValueError("container has wrong size %u (expected "
+                                   "%u)" % (self.size, expected_size))
+
+    def _read_chunks(self, first, count):
+        # Return the given ciphertext chunks, checking them against the
+        # index if there is one.
+        length = self.cipher_chunk_length
+        entry_length = length + 4 * self.indexed
+        data = self._read(_CONTAINER_HEADER_LENGTH + first * entry_length,
+                          count * entry_length)
+        if not self.indexed:
+            return data
+        chunks = []
+        for i in range(count):
+            entry = data[i*entry_length:(i+1)*entry_length]
+            if _crc32(entry[:length]) != _bytes2int(entry[length:]):
+                raise CryptoValueError("chunk %u is corrupted" % (first + i))
+            chunks.append(entry[:length])
+        return b''.join(chunks)
+
+    def _decrypt_chunks(self, first, count, deadline):
+        # All the chunks but the last one of the container must be full.
+        ciphertext = self._read_chunks(first, count)
+        chunks = list(self.decrypter.decrypt(ciphertext, deadline))
+        for i, chunk in enumerate(chunks):
+            if (len(chunk) != self.plain_chunk_length and
+                    (first + i != self.chunk_count - 1 or not chunk)):
+                raise CryptoValueError("chunk %u has wrong contents"
+                                       % (first + i))
+        return b''.join(chunks)
+
+    def _payload_blocks(self, deadline):
+        batch = self.decompression_batch_chunks
+        for first in range(0, self.chunk_count, batch):
+            yield self._decrypt_chunks(
+                first, min(batch, self.chunk_count - first), deadline)
+
+    def _decompress_range(self, offset, end, deadline):
+        # The whole plaintext is decompressed only if needed, and then
+        # it is also checked against the recorded length.
+        blocks = []
+        position = 0
+        for block in decompress_blocks(self._payload_blocks(deadline),
+                                       self.compression):
+            if position + len(block) > offset and position < end:
+                blocks.append(block[max(offset - position, 0):
+                                    end - position])
+            position += len(block)
+            if position >= end and end < self.plaintext_length:
+                return b''.join(blocks)
+        if position != self.plaintext_length:
+            raise CryptoValueError("container has wrong plaintext length")
+        return b''.join(blocks)
+
+    def decrypt_range(self, offset, length, deadline=None):
+        """Return the length bytes of plaintext starting at the given
+        offset (fewer if the plaintext ends before), decrypting only the
+        chunks containing them (or, for compressed containers, only
+        those up to them)."""
+        if offset < 0 or length < 0:
+            raise CryptoValueError("invalid range")
+        end = min(offset + length, self.plaintext_length)
+        if offset >= end:
+            return b''
+        if self.compression != COMPRESSION_NONE:
+            return self._decompress_range(offset, end, deadline)
+        first = offset // self.plain_chunk_length
+        last = (end - 1) // self.plain_chunk_length
+        plaintext = self._decrypt_chunks(first, last - first + 1, deadline)
+        expected_length = (min(self.plaintext_length,
+                               (last + 1) * self.plain_chunk_length) -
+                           first * self.plain_chunk_length)
+        # An interrupted append might have left a last chunk longer than
+        # recorded in the header, which is also fine.
+        if len(plaintext) < expected_length:
+            raise CryptoValueError("container chunks have wrong contents")
+        start = offset - first * self.plain_chunk_length
+        return plaintext[start:start + end - offset]
+
+    def decrypt(self, deadline=None):
+        """Return the whole plaintext."""
+        return self.decrypt_range(0, self.plaintext_length, deadline)
+
+def append_container(encrypter, fileobj, plaintext, deadline=None):
+    """Append the byte sequence plaintext to the container stored in the
+    given seekable binary file, opened for reading and writing.  Only the
+    new chunks are written, except for the final partial one (if any),
+    which is decrypted and encrypted again together with the new data;
+    the header is updated last, so that an interrupted append leaves the
+    container as it was.  Return the new length of the plaintext.
+
+      >>> E = BinaryEncrypter(PrivateKey(p=2**89-1, q=2**107-1, e=65537))
+      >>> import io
+      >>> f = io.BytesIO(b''.join(encrypt_container(E, b'foo', True)))
+      >>> append_container(E, f, b'bar' * 10)
+      33
+      >>> ContainerReader(E, f).decrypt() == b'foo' + b'bar' * 10
+      True
+    """
+    reader = ContainerReader(encrypter, fileobj)
+    if reader.compression != COMPRESSION_NONE:
+        raise CryptoValueError("can't append to a compressed container")
+    entry_length = reader.cipher_chunk_length + 4 * reader.indexed
+    kept_chunks, partial = divmod(reader.plaintext_length,
+                                  reader.plain_chunk_length)
+    if partial:
+        tail = reader.decrypt_range(kept_chunks * reader.plain_chunk_length,
+                                    partial, deadline)
+        plaintext = tail + plaintext
+    # The new chunks go past the old end first.  The rewritten partial
+    # chunk still starts with the old plaintext, so it is overwritten
+    # only afterwards, and the header last of all.
+    position = _CONTAINER_HEADER_LENGTH + kept_chunks * entry_length
+    fileobj.seek(position + entry_length)
+    entries = (_container_entry(chunk, reader.indexed)
+               for chunk in encrypter.encrypt(plaintext, deadline))
+    first_entry = next(entries, None)
+    end = position
+    if first_entry is not None:
+        for entry in entries:
+            fileobj.write(entry)
+        end = fileobj.tell()
+        fileobj.seek(position)
+        fileobj.write(first_entry)
+        _sync_file(fileobj)
+    length = kept_chunks * reader.plain_chunk_length + len(plaintext)
+    fileobj.seek(0)
+    fileobj.write(_container_header(encrypter, reader.flags, length))
+    # Drop what an interrupted append might have left.
+    fileobj.truncate(end)
+    _sync_file(fileobj)
+    return length
+
+def _sync_file(fileobj):
+    # Flush the file, and make sure its data are on disk if it is a real
+    # file (and not, e.g., an `io.BytesIO').
+    fileobj.flush()
+    try:
+        fileno = fileobj.fileno()
+    except (AttributeError, IOError, ValueError):
+        return
+    os.fsync(fileno)
+
+#--------------------------------------------------------------------------
+
+
+## ----------------- ##
+##  File Encryption  ##
+## ----------------- ##
+
+# Encrypting a big file can take hours, so `encrypt_file' can save
+# checkpoints of its progress, allowing `resume_encrypt_file' to continue
+# an interrupted job rather than starting it again.  This is possible
+# because the chunk geometry of a `BinaryEncrypter' is deterministic: a
+# checkpoint is always taken after a whole number of chunks, and the
+# ciphertext written until then is exactly the one of the plaintext read
+# until then.  The checkpoint files have the same layout as the key
+# context snapshots, and contain the input offset, the output offset, the
+# number of chunks, and a SHA-256 hash (binding together the key and the
+# input and output read and written so far) validating the state.
+
+_CHECKPOINT_MAGIC = b'PYRSACK\0'
+_CHECKPOINT_VERSION = 1
+
+"""Default number of chunks encrypted between two checkpoints."""
+DEFAULT_CHECKPOINT_CHUNKS = 1024
+
+def _read_fully(fp, size):
+    data = fp.read(size)
+    while 0 < len(data) < size:
+        more = fp.read(size - len(data))
+        if not more:
+            break
+        data += more
+    return data
+
+def _hash_prefix(fp, length, block_size=2**20):
+    # Hash the first length bytes of the given file.
+    digest = hashlib.sha256()
+    fp.seek(0)
+    while length > 0:
+        data = fp.read(min(length, block_size))
+        if not data:
+            break
+        digest.update(data)
+        length -= len(data)
+    return digest
+
+def _checkpoint_state_hash(encrypter, input_digest, output_digest):
+    return hashlib.sha256(encrypter.context.fingerprint +
+                          input_digest.digest() +
+                          output_digest.digest()).digest()
+
+def _load_checkpoint(encrypter, path):
+    _check_byte_chunks(encrypter)
+    with open(path, 'rb') as fp:
+        _, integers = _unpack_integers(fp.read(), _CHECKPOINT_MAGIC,
+                                       _CHECKPOINT_VERSION,
+                                       "encryption checkpoint")
+    if len(integers) != 4:
+        raise CryptoValueError("malformed encryption checkpoint")
+    input_offset, output_offset, chunk_count, state_hash = integers
+    if (input_offset != chunk_count * encrypter.plain_chunk_byte_length or
+            output_offset != chunk_count * encrypter.n_byte_length):
+        raise CryptoValueError("checkpoint doesn't match the chunk "
+                               "geometry of the encrypter")
+    return input_offset, output_offset, chunk_count, state_hash
+
+def encrypt_file(encrypter, input_path, output_path, checkpoint_path=None,
+                 checkpoint_chunks=DEFAULT_CHECKPOINT_CHUNKS, deadline=None):
+    """Encrypt the file at input_path with the `BinaryEncrypter'
+    encrypter, writing the ciphertext to the file at output_path, and
+    return its length.  If checkpoint_path is given, a checkpoint is
+    saved there every `checkpoint_chunks' chunks, and removed when the
+    encryption is complete; if the job is interrupted (e.g. because the
+    deadline is reached), it can be continued by `resume_encrypt_file'."""
+    _check_byte_chunks(encrypter)
+    with open(input_path, 'rb') as source:
+        with open(output_path, 'wb') as target:
+            return _encrypt_file(encrypter, source, target, checkpoint_path,
+                                 checkpoint_chunks, 0, hashlib.sha256(),
+                                 hashlib.sha256(), deadline)
+
+def resume_encrypt_file(encrypter, input_path, output_path,
+                        checkpoint_path,
+                        checkpoint_chunks=DEFAULT_CHECKPOINT_CHUNKS,
+                        deadline=None):
+    """Continue a job started by `encrypt_file', from the checkpoint saved
+    at checkpoint_path, and return the length of the ciphertext.  The
+    input and the partial output are validated against the checkpoint;
+    anything written after it is discarded.  If there is no checkpoint,
+    the encryption is started from scratch."""
+    if not os.path.exists(checkpoint_path):
+        return encrypt_file(encrypter, input_path, output_path,
+                            checkpoint_path, checkpoint_chunks, deadline)
+    input_offset, output_offset, chunk_count, state_hash = \
+        _load_checkpoint(encrypter, checkpoint_path)
+    with open(input_path, 'rb') as source:
+        with open(output_path, 'r+b') as target:
+            input_digest = _hash_prefix(source, input_offset)
+            output_digest = _hash_prefix(target, output_offset)
+            if (source.tell() != input_offset or
+                    target.tell() != output_offset or
+                    _bytes2int(_checkpoint_state_hash(
+                        encrypter, input_digest, output_digest))
+                    != state_hash):
+                raise CryptoValueError("input or output don't match the "
+                                       "encryption checkpoint")
+            target.truncate()
+            return _encrypt_file(encrypter, source, target, checkpoint_path,
+                                 checkpoint_chunks, chunk_count,
+                                 input_digest, output_digest, deadline)
+
+def _encrypt_file(encrypter, source, target, checkpoint_path,
+                  checkpoint_chunks, chunk_count, input_digest,
+                  output_digest, deadline):
+    if checkpoint_chunks <= 0:
+        raise CryptoValueError("checkpoint_chunks must be positive")
+    batch_size = encrypter.plain_chunk_byte_length * checkpoint_chunks
+    while True:
+        plaintext = _read_fully(source, batch_size)
+        if not plaintext:
+            break
+        ciphertext = b''.join(encrypter.encrypt(plaintext, deadline))
+        target.write(ciphertext)
+        if len(plaintext) < batch_size:
+            break
+        input_digest.update(plaintext)
+        output_digest.update(ciphertext)
+        chunk_count += checkpoint_chunks
+        if checkpoint_path is not None:
+            # The ciphertext must be on disk before the checkpoint
+            # telling it is there.
+            target.flush()
+            os.fsync(target.fileno())
+            state_hash = _checkpoint_state_hash(encrypter, input_digest,
+                                                output_digest)
+            _write_file_atomically(checkpoint_path, _pack_integers(
+                _CHECKPOINT_MAGIC, _CHECKPOINT_VERSION, 0,
+                [source.tell(), target.tell(), chunk_count,
+                 _bytes2int(state_hash)]))
+    target.flush()
+    if checkpoint_path is not None and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    return target.tell()
+
+#--------------------------------------------------------------------------
+
+
+## -------------- ##
+##  Key Rotation  ##
+## -------------- ##
+
+# Re-encrypting a ciphertext under a new key doesn't require going
+# through the plaintext bytes: if the chunks of the old and the new
+# `BinaryEncrypter' have the same geometry (i.e., the same length of
+# the plaintext chunks), the integers obtained by decrypting the old
+# ciphertext are exactly the ones the new encrypter would get from the
+# plaintext, and can be encrypted again right away.  The work is split
+# in windows of chunks, which are independent from one another and can
+# thus be processed in parallel.
+
+"""Default number of chunks re-encrypted by a single job."""
+DEFAULT_REENCRYPT_WINDOW_CHUNKS = 256
+
+def _same_chunk_geometry(decrypter, encrypter):
+    return (isinstance(decrypter, BinaryEncrypter) and
+            isinstance(encrypter, BinaryEncrypter) and
+            decrypter.plain_chunk_byte_length is not None and
+            decrypter.plain_chunk_byte_length ==
+            encrypter.plain_chunk_byte_length)
+
+def _reencrypt_window(old_decrypter, new_encrypter, ciphertext):
+    integers = old_decrypter.decrypt_many(old_decrypter.c2i(ciphertext))
+    max_length = old_decrypter.plain_chunk_byte_length + 1
+    for integer in integers:
+        # Sanity checks, as done by `BinaryEncrypter.i2p'.
+        length = (integer.bit_length() + 7) // 8
+        if length == 0 or integer >> 8 * (length - 1) != 0xff:
+            raise CryptoValueError("uncorrect padding in decrypted chunk")
+        if length > max_length:
+            raise CryptoValueError("too many digits: %u" % (length - 1))
+    return b''.join(new_encrypter.i2c(new_encrypter.encrypt_many(integers)))
+
+def _bounded_map(executor, function, iterable, max_pending):
+    # Like `executor.map', but with at most max_pending jobs submitted
+    # and not yet consumed, so that the input is read lazily.
+    pending = collections.deque()
+    try:
+        for item in iterable:
+            pending.append(executor.submit(function, item))
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+def reencrypt_stream(old_decrypter, new_encrypter, src, dst, executor=None,
+                     window_chunks=DEFAULT_REENCRYPT_WINDOW_CHUNKS,
+                     max_pending=2):
+    """Read the ciphertext produced by the `BinaryEncrypter' old_decrypter
+    from the binary file src, and write to the binary file dst the same
+    plaintext encrypted by new_encrypter; return the number of bytes
+    written.  The ciphertext is processed in windows of `window_chunks'
+    chunks, so that only a few of them are in memory at once.
+
+    If the two encrypters have the same chunk geometry, the plaintext is
+    never converted back to bytes, and the windows are processed in the
+    given executor (if any; e.g., a `concurrent.futures.ProcessPoolExecutor'),
+    with at most `max_pending' of them in flight at once.  Otherwise, the
+    executor is not used, and the conversion goes through the plaintext
+    bytes, still a chunk at a time.
+
+      >>> import io
+      >>> old = BinaryEncrypter(PrivateKey(p=2**89-1, q=2**107-1, e=65537))
+      >>> new = BinaryEncrypter(PrivateKey(p=2**61-1, q=2**127-1, e=17))
+      >>> src = io.BytesIO(b''.join(old.encrypt(b'foobar' * 100)))
+      >>> dst = io.BytesIO()
+      >>> reencrypt_stream(old, new, src, dst, window_chunks=4)
+      672
+      >>> b''.join(new.decrypt(dst.getvalue())) == b'foobar' * 100
+      True
+    """
+    if window_chunks <= 0 or max_pending <= 0:
+        raise CryptoValueError("window_chunks and max_pending must be "
+                               "positive")
+    window_size = old_decrypter.n_byte_length * window_chunks
+    windows = iter(lambda: _read_fully(src, window_size), b'')
+    if not _same_chunk_geometry(old_decrypter, new_encrypter):
+        results = new_encrypter.encrypt_blocks(
+            old_decrypter.decrypt_blocks(windows))
+    else:
+        function = functools.partial(_reencrypt_window, old_decrypter,
+                                     new_encrypter)
+        if executor is None:
+            results = (function(window) for window in windows)
+        else:
+            results = _bounded_map(executor, function, windows,
+                                   max_pending)
+    count = 0
+    for data in results:
+        dst.write(data)
+        count += len(data)
+    return count
+
+#--------------------------------------------------------------------------
+
+
+## ------------- ##
+##  Text Armor  ##
+## ------------- ##
+
+# The ciphertext produced by a `BinaryEncrypter' is binary data; to send
+# it through a text-based transport it can be "armored", i.e., encoded
+# in base64, base32 or hexadecimal, split in lines.  The encoding and
+# decoding are done incrementally, in blocks made of a whole number of
+# encoding quanta (e.g., 3 bytes encoded as 4 characters for base64), so
+# that they only need memory for one block at a time.
+
+ARMOR_BASE64 = 'base64'
+ARMOR_BASE32 = 'base32'
+ARMOR_HEX = 'hex'
+
+"""Default length of the lines of armored data (a multiple of the
+length of the encoding quanta of all the supported encodings)."""
+DEFAULT_ARMOR_LINE_LENGTH = 64
+
+def _b64encode(data):
+    return binascii.b2a_base64(data)[:-1]
+
+def _b32decode(data):
+    try:
+        return base64.b32decode(data)
+    except TypeError as e:
+        # Raised instead of `binascii.Error' by python 2.
+        raise binascii.Error(str(e))
+
+# Maps every encoding to (length of the binary quantum, length of the
+# encoded quantum, alphabet, encoding function, decoding function).
+_ARMOR_ENCODINGS = {
+    ARMOR_BASE64: (3, 4, b'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+                         b'abcdefghijklmnopqrstuvwxyz0123456789+/=',
+                   _b64encode, binascii.a2b_base64),
+    ARMOR_BASE32: (5, 8, b'ABCDEFGHIJKLMNOPQRSTUVWXYZ234567=',
+                   base64.b32encode, _b32decode),
+    ARMOR_HEX: (1, 2, b'0123456789abcdefABCDEF',
+                binascii.hexlify, binascii.unhexlify),
+}
+
+def _armor_encoding(encoding):
+    try:
+        return _ARMOR_ENCODINGS[encoding]
+    except KeyError:
+        raise CryptoValueError("unknown armor encoding %r" % (encoding,))
+
+def armor(blocks, encoding=ARMOR_BASE64,
+          line_length=DEFAULT_ARMOR_LINE_LENGTH):
+    """Encode the given iterable of blocks of bytes (e.g., the output of
+    `BinaryEncrypter.encrypt') with the given encoding, returning a
+    generator of blocks of lines of text (as bytes), each one ending
+    with a newline and no longer than `line_length' characters.
+
+      >>> print(b''.join(armor([b'foo', b'bar' * 9],
+      ...                      line_length=12)).decode('ascii'))
+      Zm9vYmFyYmFy
+      YmFyYmFyYmFy
+      YmFyYmFyYmFy
+      YmFy
+      <BLANKLINE>
+    """
+    binary_quantum, text_quantum, _, encode, _ = _armor_encoding(encoding)
+    if line_length <= 0 or line_length % text_quantum:
+        raise CryptoValueError("line length must be a positive multiple "
+                               "of %u" % text_quantum)
+    binary_line_length = line_length // text_quantum * binary_quantum
+    buffer = bytearray()
+    for block in blocks:
+        buffer.extend(block)
+        end = len(buffer) - len(buffer) % binary_line_length
+        if end:
+            yield b''.join([encode(bytes(buffer[i:i+binary_line_length]))
+                            + b'\n'
+                            for i in range(0, end, binary_line_length)])
+            del buffer[:end]
+    if buffer:
+        yield encode(bytes(buffer)) + b'\n'
+
+def dearmor(blocks, encoding=ARMOR_BASE64):
+    """Decode the given iterable of blocks of text (as bytes or strings)
+    encoded with the given encoding, ignoring whitespace; return a
+    generator of blocks of bytes.
+
+      >>> b''.join(dearmor([b'Zm9vYmFy', b'YmF', b'6\\n'])) == b'foobarbaz'
+      True
+    """
+    _, text_quantum, alphabet, _, decode = _armor_encoding(encoding)
+    buffer = bytearray()
+    padded = False
+    for block in blocks:
+        if isinstance(block, bytes):
+            pass
+        elif _is_string(block):
+            try:
+                block = block.encode('ascii')
+            except UnicodeError:
+                raise CryptoValueError("invalid %s armor" % encoding)
+        else:
+            # Any object supporting the buffer protocol.
+            block = memoryview(block).tobytes()
+        block = block.translate(None, b' \t\r\n')
+        if not block:
+            continue
+        if padded or block.translate(None, alphabet):
+            raise CryptoValueError("invalid %s armor" % encoding)
+        buffer.extend(block)
+        end = len(buffer) - len(buffer) % text_quantum
+        if end:
+            data = bytes(buffer[:end])
+            del buffer[:end]
+            # Padding is only allowed at the very end.
+            if b'=' in data:
+                padded = True
+                if buffer or b'=' in data[:-text_quantum]:
+                    raise CryptoValueError("invalid %s armor" % encoding)
+            try:
+                yield decode(data)
+            except binascii.Error:
+                raise CryptoValueError("invalid %s armor" % encoding)
+    if buffer:
+        raise CryptoValueError("truncated %s armor" % encoding)
+
+def armored_encrypt(encrypter, plaintext, encoding=ARMOR_BASE64,
+                    line_length=DEFAULT_ARMOR_LINE_LENGTH, deadline=None):
+    """Encrypt plaintext with the `BinaryEncrypter' encrypter, and return
+    the ciphertext armored as by `armor'."""
+    return armor(encrypter.encrypt(plaintext, deadline), encoding,
+                 line_length)
+
+def armored_decrypt(decrypter, blocks, encoding=ARMOR_BASE64,
+                    deadline=None):
+    """Decrypt the ciphertext armored in the given blocks of text, as
+    produced by `armored_encrypt', returning a generator of blocks of
+    plaintext.  The decoded ciphertext is fed to the decrypter as it is
+    produced, without being gathered in memory first.
+
+      >>> E = BinaryEncrypter(PrivateKey(p=2**89-1, q=2**107-1, e=65537))
+      >>> text = b''.join(armored_encrypt(E, b'foobar' * 5))
+      >>> [len(line) for line in text.splitlines()]
+      [64, 4]
+      >>> b''.join(armored_decrypt(E, text.splitlines())) == b'foobar' * 5
+      True
+    """
+    return decrypter.decrypt_blocks(dearmor(blocks, encoding), deadline)
+
+#--------------------------------------------------------------------------
+
+
+## ---------------------------------------- ##
+##  Keys Import and Export (PKCS#1 format)  ##
+## ---------------------------------------- ##
+
+# The keys are encoded as the ASN.1 structures defined in RFC 3447:
+#   RSAPublicKey ::= SEQUENCE {
+#       modulus           INTEGER,  -- n
+#       publicExponent    INTEGER   -- e
+#   }
+#   RSAPrivateKey ::= SEQUENCE {
+#       version           Version,  -- 0 (two primes)
+#       modulus           INTEGER,  -- n
+#       publicExponent    INTEGER,  -- e
+#       privateExponent   INTEGER,  -- d
+#       prime1            INTEGER,  -- p
+#       prime2            INTEGER,  -- q
+#       exponent1         INTEGER,  -- d mod (p-1)
+#       exponent2         INTEGER,  -- d mod (q-1)
+#       coefficient       INTEGER,  -- (inverse of q) mod p
+#   }
+# with the DER encoding rules; we only need to deal with sequences of
+# non-negative integers.
+
+_DER_INTEGER = 0x02
+_DER_SEQUENCE = 0x30
+
+_PEM_PUBLIC_LABEL = 'RSA PUBLIC KEY'
+_PEM_PRIVATE_LABEL = 'RSA PRIVATE KEY'
+
+def _der_encode_length(length):
+    if length < 0x80:
+        return _ord2byte(length)
+    size = (length.bit_length() + 7) // 8
+    return _ord2byte(0x80 | size) + _int2bytes(length, size)
+
+def _der_encode(tag, content):
+    return _ord2byte(tag) + _der_encode_length(len(content)) + content
+
+def _der_encode_integers(integers):
+    contents = []
+    for x in integers:
+        # The leading zero bit is the (positive) sign.
+        contents.append(_der_encode(_DER_INTEGER,
+                                    _int2bytes(x, x.bit_length() // 8 + 1)))
+    return _der_encode(_DER_SEQUENCE, b''.join(contents))
+
+def _der_read(view, position, tag):
+    """Read the DER element with the given tag starting at position in
+    the memoryview; return the start and end of its content."""
+    try:
+        got_tag = _byte2ord(view[position])
+        length = _byte2ord(view[position + 1])
+    except IndexError:
+        raise CryptoValueError("truncated DER data")
+    if got_tag != tag:
+        raise CryptoValueError("unexpected DER tag 0x%02x" % got_tag)
+    position += 2
+    if length & 0x80:
+        size = length & 0x7f
+        if not 0 < size <= 4:
+            raise CryptoValueError("unsupported DER length")
+        length = _bytes2int(view[position:position+size])
+        position += size
+    if position + length > len(view):
+        raise CryptoValueError("truncated DER data")
+    return position, position + length
+
+def _der_decode_integers(data, count):
+    """Decode a DER sequence of exactly count non-negative integers."""
+    view = memoryview(data)
+    start, end = _der_read(view, 0, _DER_SEQUENCE)
+    if end != len(view):
+        raise CryptoValueError("trailing garbage after DER data")
+    integers = []
+    position = start
+    while position < end:
+        if len(integers) == count:
+            raise CryptoValueError("too many integers in DER sequence")
+        start, position = _der_read(view, position, _DER_INTEGER)
+        if start == position or _byte2ord(view[start]) & 0x80:
+            raise CryptoValueError("invalid or negative DER integer")
+        integers.append(_bytes2int(view[start:position]))
+    if len(integers) != count:
+        raise CryptoValueError("too few integers in DER sequence")
+    return integers
+
+def _private_key_from_der(cls, data, validate=False):
+    version, n, e, d, p, q, dp, dq, qinv = _der_decode_integers(data, 9)
+    if version != 0:
+        raise CryptoValueError("unsupported RSAPrivateKey version %u"
+                               % version)
+    if n != p * q or dp != d % (p - 1) or dq != d % (q - 1):
+        raise CryptoValueError("inconsistent RSAPrivateKey")
+    return cls.from_components(p, q, e, d, qinv, validate)
+
+def _private_key_to_der(key):
+    p, q, d = key.p, key.q, key.d
+    qinv = key.qinv
+    if qinv is None:
+        qinv = modular_reciprocal(q, p)
+    return _der_encode_integers(
+        [0, key.n, key.e, d, p, q, d % (p - 1), d % (q - 1), qinv])
+
+def _p_reciprocal_from_qinv(key):
+    """Given a private key, return the inverse of max(p, q) modulo
+    min(p, q) (as used by `IntegerModPQ') if it can be cheaply derived
+    from the inverse of q modulo p, None otherwise."""
+    p, q, qinv = key.p, key.q, getattr(key, 'qinv', None)
+    if qinv is None:
+        return None
+    elif p < q:
+        return qinv
+    else:
+        # q * qinv = 1 + k * p, hence p * (-k) = 1 (mod q).
+        return (-((q * qinv - 1) // p)) % q
+
+def _pem_encode(der, label):
+    lines = ['-----BEGIN %s-----' % label]
+    encoded = binascii.b2a_base64(der).decode('ascii').replace('\n', '')
+    for i in range(0, len(encoded), 64):
+        lines.append(encoded[i:i+64])
+    lines.append('-----END %s-----' % label)
+    return '\n'.join(lines) + '\n'
+
+def _pem_decode(text, label):
+    if not _is_string(text):
+        text = text.decode('ascii')
+    begin = '-----BEGIN %s-----' % label
+    end = '-----END %s-----' % label
+    try:
+        start = text.index(begin) + len(begin)
+        stop = text.index(end, start)
+    except ValueError:
+        raise CryptoValueError("no PEM block labelled %r" % label)
+    try:
+        return binascii.a2b_base64(''.join(text[start:stop].split()))
+    except binascii.Error:
+        raise CryptoValueError("invalid base64 data in PEM block")
+
+#--------------------------------------------------------------------------
+
+
+## ------------------------- ##
+##  Key Contexts Snapshots.  ##
+## ------------------------- ##
+
+# A snapshot of a key context is a byte sequence containing the key and
+# all the data precomputed from it, so that the context can be rebuilt
+# with no expensive calculations (e.g., when starting a new worker
+# process).  Its format is:
+#   * the magic string "PYRSAKC\0" (8 bytes);
+#   * the format version (1 byte);
+#   * flags (1 byte): bit 0 is set for contexts of private keys;
+#   * the number of integers that follow (2 bytes);
+#   * the integers, each one given as its length in bytes (4 bytes)
+#     followed by its digits in base 256;
+#   * the SHA-256 digest of all the above (32 bytes).
+# All the integers are in big-endian format.  The integers stored are
+# n and e, followed for private keys by p, q, d and the inverse of p
+# (mod q), with p > q.
+
+_SNAPSHOT_MAGIC = b'PYRSAKC\0'
+_SNAPSHOT_VERSION = 1
+_SNAPSHOT_PRIVATE = 0x01
+
+def dumps_key_context(context):
+    """Return a snapshot of the given key context, as a byte sequence."""
+    key = context.key
+    integers = [key.n, key.e]
+    flags = 0
+    if context.is_private:
+        mod_n = context.mod_n
+        integers.extend([mod_n.p, mod_n.q, key.d, mod_n.p_reciprocal_mod_q])
+        flags |= _SNAPSHOT_PRIVATE
+    return _pack_integers(_SNAPSHOT_MAGIC, _SNAPSHOT_VERSION, flags,
+                          integers)
+
+def _pack_integers(magic, version, flags, integers):
+    # Also used for other files with the same layout as the snapshots.
+    if len(integers) >= 1 << 16:
+        raise CryptoValueError("too many integers to pack")
+    chunks = [magic, _int2bytes(version, 1),
+              _int2bytes(flags, 1), _int2bytes(len(integers), 2)]
+    for x in integers:
+        length = (x.bit_length() + 7) // 8
+        chunks.extend([_int2bytes(length, 4), _int2bytes(x, length)])
+    data = b''.join(chunks)
+    return data + hashlib.sha256(data).digest()
+
+def _write_file_atomically(path, data):
+    # The file is only readable by its owner.
+    temp_path = path + '.tmp'
+    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'wb') as fp:
+        fp.write(data)
+        # Otherwise, after a crash the renamed file might be empty.
+        fp.flush()
+        os.fsync(fp.fileno())
+    getattr(os, 'replace', os.rename)(temp_path, path)
+    _fsync_directory(path)
+
+def _fsync_directory(path):
+    # Make the creation, renaming or removal of the file at path durable,
+    # where the platform allows that (not on Windows, e.g.).
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def dump_key_context(context, path):
+    """Save a snapshot of the given key context in the file at path.
+    The file is only readable by its owner, and is replaced atomically,
+    so that processes loading it never see a truncated snapshot."""
+    _write_file_atomically(path, dumps_key_context(context))
+
+def loads_key_context(data):
+    """Rebuild a key context from a snapshot, given as a byte sequence
+    or any object supporting the buffer protocol.  The context is also
+    registered in `key_contexts', for the encrypters to use it.
+
+      >>> context = BasicEncrypter(PrivateKey(p=4111, q=4703, e=127)).context
+      >>> loads_key_context(dumps_key_context(context)) is context
+      True
+    """
+    flags, integers = _unpack_integers(data, _SNAPSHOT_MAGIC,
+                                       _SNAPSHOT_VERSION,
+                                       "key context snapshot")
+    expected_count = 6 if flags & _SNAPSHOT_PRIVATE else 2
+    if len(integers) != expected_count:
+        raise CryptoValueError("malformed key context snapshot")
+    if not flags & _SNAPSHOT_PRIVATE:
+        n, e = integers
+        return key_contexts.get(PublicKey(n, e))
+    n, e, p, q, d, p_reciprocal_mod_q = integers
+    if n != p * q:
+        raise CryptoValueError("malformed key context snapshot")
+    key = PrivateKey.from_components(p, q, e, d)
+    # Make sure the CRT precomputations are reused too.
+    return key_contexts.get(key, integer_mod_pq_class(p, q,
+                                                      p_reciprocal_mod_q))
+
+def _unpack_integers(data, magic, version, what):
+    # The inverse of `_pack_integers'; what describes the kind of data
+    # expected, for the error messages.
+    view = memoryview(data)
+    try:
+        return _parse_packed_integers(view, magic, version, what)
+    finally:
+        # Don't keep the underlying buffer (e.g., a memory map) busy.
+        if _is_py3k:
+            view.release()
+
+def _parse_packed_integers(view, magic, expected_version, what):
+    digest_start = len(view) - 32
+    header_length = len(magic) + 4
+    if digest_start < header_length or view[:len(magic)] != magic:
+        raise CryptoValueError("not a %s" % what)
+    if hashlib.sha256(view[:digest_start]).digest() != view[digest_start:]:
+        raise CryptoValueError("corrupted %s" % what)
+    position = len(magic)
+    version = _bytes2int(view[position:position+1])
+    flags = _bytes2int(view[position+1:position+2])
+    if version != expected_version:
+        raise CryptoValueError("unsupported %s version %u" % (what, version))
+    count = _bytes2int(view[position+2:position+4])
+    position += 4
+    integers = []
+    for i in range(count):
+        length = _bytes2int(view[position:position+4])
+        position += 4
+        integers.append(_bytes2int(view[position:position+length]))
+        position += length
+    if position != digest_start:
+        raise CryptoValueError("malformed %s" % what)
+    return flags, integers
+
+def load_key_context(path, use_mmap=True):
+    """Rebuild a key context from the snapshot saved in the file at path.
+    If `use_mmap' is true, the file is memory-mapped rather than read
+    (except with python 2, whose memory maps don't support memoryview)."""
+    with open(path, 'rb') as fp:
+        if not use_mmap or not _is_py3k:
+            return loads_key_context(fp.read())
+        import mmap
+        mapped = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return loads_key_context(mapped)
+        finally:
+            mapped.close()
+
+#--------------------------------------------------------------------------
+
+
+## ---------------------------------- ##
+##  Prime Numbers and Key Generation  ##
+## ---------------------------------- ##
+
+"""Candidate primes are sieved with all the primes below this limit."""
+SIEVE_PRIMES_LIMIT = 2**12
+
+"""Candidates surviving the sieve are checked for common factors with
+the product of all the primes between `SIEVE_PRIMES_LIMIT' and this
+limit, before being submitted to the Miller-Rabin test."""
+PRIMORIAL_PRIMES_LIMIT = 2**16
+
+"""Number of candidates (i.e., of odd integers) sieved at a time."""
+SIEVE_WINDOW_SIZE = 4096
+
+# The primes below SIEVE_PRIMES_LIMIT and the product of the others below
+# PRIMORIAL_PRIMES_LIMIT, computed only once and only when needed.
+_sieve_primes_cache = []
+_sieve_primes_lock = threading.Lock()
+
+def small_primes(limit):
+    """Return the list of the primes smaller than limit, found with a
+    segmented sieve of Eratosthenes: the primes up to the square root of
+    limit are found first (in the same way), and then used to sieve
+    windows of `SIEVE_WINDOW_SIZE' integers at a time.
+
+      >>> small_primes(30)
+      [2, 3, 5, 7, 11, 13, 17, 19, 23, 29]
+    """
+    if limit <= 2:
+        return []
+    # All the primes p such that p*p < limit.
+    base_limit = _isqrt(limit - 1) + 1
+    primes = small_primes(base_limit)
+    base_primes = list(primes)
+    for low in range(base_limit, limit, SIEVE_WINDOW_SIZE):
+        high = min(low + SIEVE_WINDOW_SIZE, limit)
+        window = bytearray([1]) * (high - low)
+        for prime in base_primes:
+            if prime * prime >= high:
+                break
+            start = max(prime * prime, -(-low // prime) * prime) - low
+            window[start::prime] = bytearray((high - low - 1 - start)
+                                             // prime + 1)
+        primes.extend(low + i for i in range(high - low) if window[i])
+    return primes
+
+def _sieve_primes():
+    if not _sieve_primes_cache:
+        with _sieve_primes_lock:
+            if not _sieve_primes_cache:
+                primes = small_primes(PRIMORIAL_PRIMES_LIMIT)
+                primorial = 1
+                for prime in primes:
+                    if prime >= SIEVE_PRIMES_LIMIT:
+                        primorial *= prime
+                _sieve_primes_cache.append(
+                    ([p for p in primes if p < SIEVE_PRIMES_LIMIT],
+                     primorial))
+    return _sieve_primes_cache[0]
+
+def _miller_rabin_rounds(bits):
+    # Rounds giving an error probability smaller than 2**-100 for random
+    # candidates, as per FIPS 186-4, Appendix C.3.
+    if bits >= 1536:
+        return 3
+    elif bits >= 1024:
+        return 4
+    elif bits >= 512:
+        return 7
+    elif bits >= 256:
+        return 16
+    return 40
+
+def _strong_probable_prime(n, base):
+    # The strong Fermat test of the odd integer n > 3 to the given base.
+    # We use the builtin modular exponentiation, for speed.
+    t, s = n - 1, 0
+    while t % 2 == 0:
+        t, s = t // 2, s + 1
+    x = pow(base, t, n)
+    if x == 1 or x == n - 1:
+        return True
+    for _ in range(s - 1):
+        x = x * x % n
+        if x == n - 1:
+            return True
+    return False
+
+def _miller_rabin(n, rounds, rng):
+    # Here n is odd and greater than 3.
+    for _ in range(rounds):
+        if not _strong_probable_prime(n, rng.randrange(2, n - 1)):
+            return False
+    return True
+
+def jacobi(a, n):
+    """Return the Jacobi symbol (a/n), for n odd and positive.
+
+      >>> [jacobi(a, 7) for a in range(7)]
+      [0, 1, 1, -1, 1, -1, -1]
+    """
+    if n <= 0 or n % 2 == 0:
+        raise CryptoValueError("%u is not an odd positive integer" % n)
+    a %= n
+    result = 1
+    while a != 0:
+        while a % 2 == 0:
+            a //= 2
+            if n % 8 in (3, 5):
+                result = -result
+        a, n = n, a
+        if a % 4 == 3 and n % 4 == 3:
+            result = -result
+        a %= n
+    return result if n == 1 else 0
+
+def _isqrt(n):
+    # Integer square root, with Newton's method.
+    x = 1 << ((n.bit_length() + 1) // 2)
+    while True:
+        y = (x + n // x) // 2
+        if y >= x:
+            return x
+        x = y
+
+def _halve_mod(x, n):
+    # x / 2 (mod n), for n odd.
+    x %= n
+    return (x + n if x % 2 else x) // 2
+
+def _strong_lucas_probable_prime(n):
+    # The strong Lucas test of the odd integer n > 3, which must not be
+    # a perfect square, with the parameters chosen by Selfridge's method
+    # A (so that P = 1).
+    D = 5
+    while True:
+        j = jacobi(D, n)
+        if j == -1:
+            break
+        if j == 0 and abs(D) != n:
+            return False
+        D = -D - 2 if D > 0 else -D + 2
+    Q = (1 - D) // 4
+    t, s = n + 1, 0
+    while t % 2 == 0:
+        t, s = t // 2, s + 1
+    # Calculate U_t, V_t and Q^t (mod n), from left to right.
+    U, V, Qk = 1, 1, Q % n
+    for bit in bin(t)[3:]:
+        U, V, Qk = U * V % n, (V * V - 2 * Qk) % n, Qk * Qk % n
+        if bit == '1':
+            U, V = _halve_mod(U + V, n), _halve_mod(D * U + V, n)
+            Qk = Qk * Q % n
+    if U == 0 or V == 0:
+        return True
+    for _ in range(s - 1):
+        V, Qk = (V * V - 2 * Qk) % n, Qk * Qk % n
+        if V == 0:
+            return True
+    return False
+
+def _is_probable_prime_after_screening(n):
+    # Here n is odd, and has no prime factors smaller than
+    # PRIMORIAL_PRIMES_LIMIT.
+    if n < PRIMORIAL_PRIMES_LIMIT**2:
+        return True
+    return (_strong_probable_prime(n, 2) and _isqrt(n)**2 != n
+            and _strong_lucas_probable_prime(n))
+
+def is_probable_prime(n):
+    """Tell whether n is a probable prime, according to the Baillie-PSW
+    test: after trial division by the small primes, n must pass both a
+    strong Fermat test to base 2 and a strong Lucas test.  There are no
+    known composite numbers passing this test (and there are none below
+    2**64).
+
+      >>> [n for n in range(30) if is_probable_prime(n)]
+      [2, 3, 5, 7, 11, 13, 17, 19, 23, 29]
+      >>> is_probable_prime(2**89 - 1), is_probable_prime(2**91 - 1)
+      (True, False)
+    """
+    if n < 2:
+        return False
+    primes, primorial = _sieve_primes()
+    for prime in primes:
+        if n % prime == 0:
+            return n == prime
+    if n < SIEVE_PRIMES_LIMIT**2:
+        return True
+    if gcd(n, primorial) != 1:
+        return False
+    return _is_probable_prime_after_screening(n)
+
+def _remainders(x, integers):
+    # Return [x % i for i in integers], using a remainder tree: x is
+    # reduced modulo the product of all the integers, then modulo the
+    # products of each half of them, and so on.  This is much faster
+    # than the obvious way when x is much bigger than the integers.
+    if len(integers) == 1:
+        return [x % integers[0]]
+    middle = len(integers) // 2
+    halves = (integers[:middle], integers[middle:])
+    result = []
+    for half in halves:
+        product = 1
+        for i in half:
+            product *= i
+        result.extend(_remainders(x % product, half))
+    return result
+
+def are_probable_primes(candidates):
+    """Like `is_probable_prime', but for many candidates at once.  Those
+    surviving the trial division are screened together for the larger
+    small prime factors, reducing the product of such primes modulo all
+    of them with a remainder tree.  Return a list of booleans.
+
+      >>> are_probable_primes([2**61 - 1, 2**61 + 1, 2**89 - 1])
+      [True, False, True]
+    """
+    primes, primorial = _sieve_primes()
+    result = [False] * len(candidates)
+    survivors = []
+    for (i, n) in enumerate(candidates):
+        if n < SIEVE_PRIMES_LIMIT**2:
+            result[i] = is_probable_prime(n)
+        elif all(n % prime for prime in primes):
+            survivors.append(i)
+    if survivors:
+        remainders = _remainders(primorial,
+                                 [candidates[i] for i in survivors])
+        for (i, remainder) in zip(survivors, remainders):
+            n = candidates[i]
+            result[i] = (gcd(remainder, n) == 1
+                         and _is_probable_prime_after_screening(n))
+    return result
+
+def _sieve_window(start, size, primes):
+    # Return a bytearray whose i-th item is nonzero iff start + 2*i is
+    # not a multiple of any of the given (odd) primes.
+    sieve = bytearray([1]) * size
+    for prime in primes:
+        if prime >= start:
+            break
+        # First index i such that start + 2*i is a multiple of prime.
+        i = (-start) * ((prime + 1) // 2) % prime
+        if i < size:
+            sieve[i::prime] = bytearray((size - 1 - i) // prime + 1)
+    return sieve
+
+def _prime_in_window(start, bits, rng, condition):
+    # Return the first prime (satisfying condition, if given) among the
+    # SIEVE_WINDOW_SIZE odd integers starting from start, or None.
+    primes, primorial = _sieve_primes()
+    use_primorial = bits > PRIMORIAL_PRIMES_LIMIT.bit_length()
+    rounds = _miller_rabin_rounds(bits)
+    limit = 1 << bits
+    sieve = _sieve_window(start, SIEVE_WINDOW_SIZE, primes[1:])
+    i = sieve.find(b'\x01')
+    while i >= 0:
+        candidate = start + 2 * i
+        if candidate >= limit:
+            break
+        if ((not use_primorial or gcd(candidate, primorial) == 1)
+                and _miller_rabin(candidate, rounds, rng)
+                and (condition is None or condition(candidate))):
+            return candidate
+        i = sieve.find(b'\x01', i + 1)
+    return None
+
+def _random_window_start(bits, rng):
+    return rng.getrandbits(bits) | (3 << (bits - 2)) | 1
+
+def generate_prime(bits, rng=None, condition=None):
+    """Return a random prime of exactly `bits' bits, whose two highest
+    bits are set (so that the product of two such primes has exactly
+    twice as many bits).  The candidates are taken from a random point
+    on, sieved a window at a time, and the survivors are checked with
+    the Miller-Rabin test.  If given, condition must be a function
+    telling whether a prime is acceptable.  The random numbers are
+    obtained from rng, a `random.Random' instance (by default, a
+    `random.SystemRandom' one).
+
+      >>> p = generate_prime(64)
+      >>> p.bit_length() == 64 and p >> 62 == 3
+      True
+    """
+    if bits < 8:
+        raise CryptoValueError("primes must have at least 8 bits")
+    if rng is None:
+        rng = random.SystemRandom()
+    while True:
+        start = _random_window_start(bits, rng)
+        while start < 1 << bits:
+            prime = _prime_in_window(start, bits, rng, condition)
+            if prime is not None:
+                return prime
+            start += 2 * SIEVE_WINDOW_SIZE
+
+def _coprime_with(e):
+    return lambda prime: gcd(e, prime - 1) == 1
+
+def _prime_window_job(start, bits, e, seed):
+    # Run in the worker processes: everything here must be picklable.
+    # The random numbers are only used to choose the bases of the
+    # Miller-Rabin test, so they need not be secret.
+    return _prime_in_window(start, bits, random.Random(seed),
+                            _coprime_with(e))
+
+def _parallel_generate_primes(sizes, e, rng, executor, max_pending):
+    # Look for primes of the given sizes (in bits), testing random
+    # windows of candidates in the executor.  The pending windows are
+    # cancelled as soon as all the primes have been found.
+    import concurrent.futures
+    found = [None] * len(sizes)
+    pending = {}
+    try:
+        while None in found:
+            missing = [i for (i, prime) in enumerate(found) if prime is None]
+            while len(pending) < max_pending:
+                index = missing[len(pending) % len(missing)]
+                start = _random_window_start(sizes[index], rng)
+                future = executor.submit(_prime_window_job, start,
+                                         sizes[index], e, rng.getrandbits(64))
+                pending[future] = index
+            done, _ = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                index = pending.pop(future)
+                prime = future.result()
+                if prime is not None and found[index] is None:
+                    found[index] = prime
+    finally:
+        for future in pending:
+            future.cancel()
+    return found
+
+def generate_key(bits, e=65537, rng=None, executor=None, max_pending=8):
+    """Generate a new `PrivateKey', whose modulus has exactly the given
+    number of bits, and whose public exponent is e.  The two primes are
+    balanced (i.e., of about half that number of bits each).
+
+    If an executor (e.g., a `concurrent.futures.ProcessPoolExecutor') is
+    given, the windows of candidate primes are tested in it, with at most
+    `max_pending' windows submitted at the same time.
+
+      >>> key = generate_key(256, e=17)
+      >>> key.n.bit_length(), key.e
+      (256, 17)
+      >>> encrypter = BinaryEncrypter(key)
+      >>> ciphertext = b''.join(encrypter.encrypt(b'ok'))
+      >>> b''.join(encrypter.decrypt(ciphertext)) == b'ok'
+      True
+    """
+    if bits < 16:
+        raise CryptoValueError("keys must have at least 16 bits")
+    if e < 3 or e % 2 == 0:
+        raise CryptoValueError("invalid exponent %u" % e)
+    if max_pending <= 0:
+        raise CryptoValueError("max_pending must be positive")
+    if rng is None:
+        rng = random.SystemRandom()
+    sizes = [bits - bits // 2, bits // 2]
+    while True:
+        if executor is None:
+            p, q = [generate_prime(size, rng, _coprime_with(e))
+                    for size in sizes]
+        else:
+            p, q = _parallel_generate_primes(sizes, e, rng, executor,
+                                             max_pending)
+        # Avoid primes too close to each other, which would make n easy
+        # to factor (cfr. FIPS 186-4, B.3.1).
+        if abs(p - q).bit_length() > max(bits // 2 - 100, 1):
+            break
+    p, q = max(p, q), min(p, q)
+    return PrivateKey(p, q, e)
+
+class KeyBatch(list):
+    """A list of keys generated in bulk by `generate_keys', also telling
+    how long their generation took."""
+    def __init__(self, keys, elapsed):
+        list.__init__(self, keys)
+        self.elapsed = elapsed
+    @property
+    def keys_per_second(self):
+        if self.elapsed <= 0:
+            return float('inf')
+        return len(self) / self.elapsed
+
+def _generate_key_job(bits, e, seed):
+    # Run in the worker processes.  Without a seed, the worker uses its
+    # own system random numbers generator.
+    rng = None if seed is None else random.Random(seed)
+    return generate_key(bits, e, rng)
+
+def generate_keys(count, bits, e=65537, rng=None, executor=None):
+    """Generate count new keys as per `generate_key', returning them in a
+    `KeyBatch'.  If an executor is given, each key is generated by a
+    different job in it.  If rng is given, the keys generated by the
+    jobs are derived from seeds it provides, and thus only as good as
+    the seeds themselves.
+
+      >>> batch = generate_keys(3, 128)
+      >>> len(batch), batch.keys_per_second > 0
+      (3, True)
+    """
+    start_time = _monotonic()
+    if executor is None:
+        keys = [generate_key(bits, e, rng) for _ in range(count)]
+    else:
+        seeds = [None if rng is None else rng.getrandbits(128)
+                 for _ in range(count)]
+        futures = [executor.submit(_generate_key_job, bits, e, seed)
+                   for seed in seeds]
+        try:
+            keys = [future.result() for future in futures]
+        finally:
+            for future in futures:
+                future.cancel()
+    return KeyBatch(keys, _monotonic() - start_time)
+
+# A prime pool file has the same layout as a key context snapshot (with
+# a different magic string); the integers stored are the public exponent
+# the primes are good for, followed by the primes themselves.
+_PRIME_POOL_MAGIC = b'PYRSAPP\0'
+_PRIME_POOL_VERSION = 1
+
+class KeyFactory(object):
+    """A factory of private keys, keeping pools of pre-generated primes
+    (one pool for every size in bits), so that a new key can be issued
+    just by pairing two primes and calculating the private exponent.
+
+    Once `start'ed, background worker threads refill each pool as soon
+    as it holds no more than `low_watermark' primes, until it holds (at
+    least) `high_watermark' of them.  If an executor is given, the
+    workers search the primes in it, as `generate_key' does.  If the
+    pools are exhausted, the primes are generated on the spot.
+
+    If a path is given, the pools are loaded from that file if it
+    exists, and are saved back there when the factory is stopped.  Be
+    careful: the file contains the factors of all the keys still to be
+    issued.  Since a prime must never be issued twice, loading the file
+    consumes it, and saving the pools empties them.
+
+      >>> factory = KeyFactory(e=17, low_watermark=1, high_watermark=2)
+      >>> factory.start(256)
+      >>> key = factory.new_key(256)
+      >>> key.n.bit_length(), key.e
+      (256, 17)
+      >>> factory.stop()
+    """
+    def __init__(self, e=65537, low_watermark=4, high_watermark=16,
+                 path=None, rng=None, executor=None, workers=1):
+        if not 0 <= low_watermark < high_watermark:
+            raise CryptoValueError("invalid watermarks %r and %r"
+                                   % (low_watermark, high_watermark))
+        if e < 3 or e % 2 == 0:
+            raise CryptoValueError("invalid exponent %u" % e)
+        self.e = e
+        self.low_watermark = low_watermark
+        self.high_watermark = high_watermark
+        self.path = path
+        self.rng = random.SystemRandom() if rng is None else rng
+        self.executor = executor
+        self.workers = workers
+        self._pools = {}
+        self._in_progress = collections.defaultdict(int)
+        self._filling = set()
+        self._condition = threading.Condition(threading.RLock())
+        self._threads = []
+        self._stopping = False
+        if path is not None:
+            self.load(path)
+
+    def _prime_sizes(self, bits):
+        if bits < 16:
+            raise CryptoValueError("keys must have at least 16 bits")
+        return [bits - bits // 2, bits // 2]
+
+    def reserve(self, bits):
+        """Have the workers keep primes for keys of the given size."""
+        with self._condition:
+            for size in self._prime_sizes(bits):
+                self._pools.setdefault(size, [])
+            self._condition.notify_all()
+
+    def pool_size(self, size):
+        """Return the number of primes of the given size available."""
+        with self._condition:
+            return len(self._pools.get(size, ()))
+
+    def start(self, *key_sizes):
+        """Start the workers, reserving primes for the given key sizes."""
+        for bits in key_sizes:
+            self.reserve(bits)
+        with self._condition:
+            if self._threads:
+                return
+            self._stopping = False
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work)
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self):
+        """Stop the workers (waiting for the primes being generated) and,
+        if the factory has a path, save the pools there."""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+            threads, self._threads = self._threads, []
+        for thread in threads:
+            thread.join()
+        if self.path is not None:
+            self.save(self.path)
+
+    def _next_size_to_fill(self):
+        # Called with the lock held.  Pools start being refilled when
+        # they go down to the low watermark, and stop when they reach the
+        # high one.
+        candidates = []
+        for (size, pool) in self._pools.items():
+            available = len(pool) + self._in_progress[size]
+            if len(pool) <= self.low_watermark:
+                self._filling.add(size)
+            if available >= self.high_watermark:
+                self._filling.discard(size)
+            elif size in self._filling:
+                candidates.append((available, size))
+        return min(candidates)[1] if candidates else None
+
+    def _work(self):
+        while True:
+            with self._condition:
+                size = self._next_size_to_fill()
+                while size is None and not self._stopping:
+                    self._condition.wait()
+                    size = self._next_size_to_fill()
+                if self._stopping:
+                    return
+                self._in_progress[size] += 1
+            prime = None
+            try:
+                prime = self._generate_prime(size)
+            finally:
+                # Both at once, lest other workers start generating
+                # primes that are not needed.
+                with self._condition:
+                    self._in_progress[size] -= 1
+                    if prime is not None:
+                        self._pools[size].append(prime)
+                    self._condition.notify_all()
+
+    def _generate_prime(self, size):
+        if self.executor is None:
+            return generate_prime(size, self.rng, _coprime_with(self.e))
+        return _parallel_generate_primes([size], self.e, self.rng,
+                                         self.executor, 2)[0]
+
+    def _take_prime(self, size):
+        with self._condition:
+            pool = self._pools.setdefault(size, [])
+            prime = pool.pop() if pool else None
+            # Wake up the workers, if there's something to refill.
+            self._condition.notify_all()
+        if prime is None:
+            prime = self._generate_prime(size)
+        return prime
+
+    def new_key(self, bits):
+        """Return a new `PrivateKey' whose modulus has the given number
+        of bits, made from the pooled primes if possible."""
+        sizes = self._prime_sizes(bits)
+        p = self._take_prime(sizes[0])
+        # The primes too close to p are still good for other keys: they
+        # go back to the pool once q is found (not before, lest they are
+        # drawn again).
+        rejected = []
+        try:
+            while True:
+                q = self._take_prime(sizes[1])
+                # Same check done by `generate_key'.
+                if abs(p - q).bit_length() > max(bits // 2 - 100, 1):
+                    break
+                rejected.append(q)
+        finally:
+            if rejected:
+                with self._condition:
+                    self._pools[sizes[1]].extend(rejected)
+                    self._condition.notify_all()
+        p, q = max(p, q), min(p, q)
+        return PrivateKey(p, q, self.e)
+
+    def save(self, path):
+        """Move the pooled primes to the file at path, so that they are
+        not issued by this factory anymore.  The file is only readable by
+        its owner, and is replaced atomically."""
+        with self._condition:
+            primes = [prime for pool in self._pools.values()
+                      for prime in pool]
+            for pool in self._pools.values():
+                del pool[:]
+            self._condition.notify_all()
+        _write_file_atomically(path, _pack_integers(
+            _PRIME_POOL_MAGIC, _PRIME_POOL_VERSION, 0, [self.e] + primes))
+
+    def load(self, path):
+        """Move to the pools the primes saved in the file at path, which
+        is removed before any of them is used; nothing is loaded if the
+        file doesn't exist (e.g., another factory consumed it first).
+        The primes are verified again, since the file might have been
+        tampered with."""
+        # Renaming is atomic, so only one factory can claim the file.
+        claimed_path = '%s.%d.%x.claimed' % (path, os.getpid(), id(self))
+        try:
+            os.rename(path, claimed_path)
+        except OSError:
+            if os.path.exists(path):
+                raise
+            return
+        try:
+            # Make sure the file doesn't come back after a crash.
+            _fsync_directory(path)
+            with open(claimed_path, 'rb') as fp:
+                data = fp.read()
+        finally:
+            os.remove(claimed_path)
+        _, integers = _unpack_integers(data, _PRIME_POOL_MAGIC,
+                                       _PRIME_POOL_VERSION, "prime pool")
+        if not integers or integers[0] != self.e:
+            raise CryptoValueError("prime pool not made for exponent %u"
+                                   % self.e)
+        primes = integers[1:]
+        for prime in primes:
+            size = prime.bit_length()
+            if not (size >= 8 and prime >> (size - 2) == 3
+                    and gcd(self.e, prime - 1) == 1
+                    and is_probable_prime(prime)):
+                raise CryptoValueError("invalid prime in prime pool")
+        with self._condition:
+            for prime in primes:
+                self._pools.setdefault(prime.bit_length(), []).append(prime)
+            self._condition.notify_all()
+
 #--------------------------------------------------------------------------
 
 
@@ -0,0 +1,211 @@
+# -*- python -*-
+# -*- coding: utf-8 -*-
+
+#--------------------------------------------------------------------------
+
+## --------------------------------- ##
+##  Metadata & Global Documentation  ##
+## --------------------------------- ##
+
+"""Asyncio front-ends for the encrypters defined in RSA.py.
+
+Unlike RSA.py itself, this module requires python >= 3.7.
+
+The byte sequence read from an `asyncio.StreamReader' is split into
+batches of whole chunks, and each batch is encrypted (or decrypted) in
+an executor, so that the event loop is never blocked by the modular
+exponentiations.  Since the chunks of a `BinaryEncrypter' are converted
+independently from one another, the result is byte-by-byte identical
+to what a single call to `encrypt' or `decrypt' would have produced.
+
+  >>> import asyncio
+  >>> from RSA import PrivateKey, BinaryEncrypter
+  >>> encrypter = BinaryEncrypter(PrivateKey(p=4111, q=4703, e=127))
+  >>> async def roundtrip(plaintext):
+  ...     reader = asyncio.StreamReader()
+  ...     reader.feed_data(plaintext)
+  ...     reader.feed_eof()
+  ...     ciphertext = b''
+  ...     async for block in aencrypt_iter(encrypter, reader):
+  ...         ciphertext += block
+  ...     reader = asyncio.StreamReader()
+  ...     reader.feed_data(ciphertext)
+  ...     reader.feed_eof()
+  ...     return b''.join([block async for block in
+  ...                      adecrypt_iter(encrypter, reader)])
+  >>> asyncio.run(roundtrip(b'foobar' * 1000)) == b'foobar' * 1000
+  True
+"""
+
+#--------------------------------------------------------------------------
+
+## ---------------- ##
+##  Global Imports  ##
+## ---------------- ##
+
+import asyncio
+import collections
+
+from RSA import _check_byte_chunks
+
+#--------------------------------------------------------------------------
+
+## ---------------------------------- ##
+##  Internal Classes and Subroutines  ##
+## ---------------------------------- ##
+
+"""Default number of chunks converted by a single executor job."""
+DEFAULT_BATCH_CHUNKS = 64
+
+"""Default number of executor jobs that can be in flight at once."""
+DEFAULT_MAX_PENDING = 2
+
+"""Default number of "square and multiply" iterations performed by
+`apow' before yielding control to the event loop."""
+DEFAULT_SLICE_STEPS = 64
+
+async def _read_batch(reader, size):
+    try:
+        return await reader.readexactly(size)
+    except asyncio.IncompleteReadError as e:
+        return e.partial
+
+def _convert_batch(method, data):
+    return b''.join(method(data))
+
+async def _aconvert(method, chunk_length, reader, executor,
+                    batch_chunks, max_pending):
+    if batch_chunks <= 0 or max_pending <= 0:
+        raise ValueError("batch_chunks and max_pending must be positive")
+    loop = asyncio.get_running_loop()
+    # Batches are made of whole chunks, so that the chunk boundaries
+    # are the same we would have converting the input all at once.
+    batch_size = chunk_length * batch_chunks
+    pending = collections.deque()
+    reading = None
+    eof = False
+    try:
+        while pending or not eof:
+            # Keep the executor busy while the consumer deals with the
+            # results already available.
+            if reading is None and not eof and len(pending) < max_pending:
+                reading = asyncio.ensure_future(
+                    _read_batch(reader, batch_size))
+            # Don't hold back the results already available while
+            # waiting for more input.
+            waited = {pending[0]} if pending else set()
+            if reading is not None:
+                waited.add(reading)
+            await asyncio.wait(waited, return_when=asyncio.FIRST_COMPLETED)
+            if reading is not None and reading.done():
+                data = reading.result()
+                reading = None
+                eof = len(data) < batch_size
+                if data:
+                    pending.append(loop.run_in_executor(
+                        executor, _convert_batch, method, data))
+            if pending and pending[0].done():
+                yield pending.popleft().result()
+    finally:
+        if reading is not None:
+            reading.cancel()
+        for future in pending:
+            future.cancel()
+
+#--------------------------------------------------------------------------
+
+## ------------------------------------ ##
+##  Asynchronous Encryption/Decryption  ##
+## ------------------------------------ ##
+
+def aencrypt_iter(encrypter, reader, executor=None,
+                  batch_chunks=DEFAULT_BATCH_CHUNKS,
+                  max_pending=DEFAULT_MAX_PENDING):
+    """Asynchronously iterate over the encryption of the bytes read from
+    the `asyncio.StreamReader' reader, using the `BinaryEncrypter'
+    encrypter (which can't be a `PackedBinaryEncrypter').  Each batch
+    of `batch_chunks' chunks is encrypted in the given executor (the
+    loop's default one if None); at most `max_pending' batches are
+    processed at the same time."""
+    # The batches must be made of whole chunks.
+    _check_byte_chunks(encrypter)
+    return _aconvert(encrypter.encrypt, encrypter.plain_chunk_byte_length,
+                     reader, executor, batch_chunks, max_pending)
+
+def adecrypt_iter(decrypter, reader, executor=None,
+                  batch_chunks=DEFAULT_BATCH_CHUNKS,
+                  max_pending=DEFAULT_MAX_PENDING):
+    """Like `aencrypt_iter', but decrypt the bytes read from reader
+    instead.  Here too, decrypter can't be a `PackedBinaryEncrypter'."""
+    # Each batch would be decrypted as a whole ciphertext, with its own
+    # trailer.
+    _check_byte_chunks(decrypter)
+    return _aconvert(decrypter.decrypt, decrypter.n_byte_length,
+                     reader, executor, batch_chunks, max_pending)
+
+async def _astream(blocks, writer):
+    count = 0
+    async for block in blocks:
+        writer.write(block)
+        count += len(block)
+        # Apply backpressure: don't convert more data than the
+        # receiving end is willing to accept.
+        await writer.drain()
+    return count
+
+async def aencrypt_stream(encrypter, reader, writer, executor=None,
+                          batch_chunks=DEFAULT_BATCH_CHUNKS,
+                          max_pending=DEFAULT_MAX_PENDING):
+    """Encrypt all the bytes read from the `asyncio.StreamReader' reader,
+    writing the result to the `asyncio.StreamWriter' writer.  Return the
+    number of bytes written."""
+    return await _astream(aencrypt_iter(encrypter, reader, executor,
+                                        batch_chunks, max_pending),
+                          writer)
+
+async def adecrypt_stream(decrypter, reader, writer, executor=None,
+                          batch_chunks=DEFAULT_BATCH_CHUNKS,
+                          max_pending=DEFAULT_MAX_PENDING):
+    """Decrypt all the bytes read from the `asyncio.StreamReader' reader,
+    writing the result to the `asyncio.StreamWriter' writer.  Return the
+    number of bytes written."""
+    return await _astream(adecrypt_iter(decrypter, reader, executor,
+                                        batch_chunks, max_pending),
+                          writer)
+
+#--------------------------------------------------------------------------
+
+## -------------------------------- ##
+##  Cooperative Modular Arithmetic  ##
+## -------------------------------- ##
+
+async def apow(base, exponent, slice_steps=DEFAULT_SLICE_STEPS):
+    """Calculate base**exponent, where base is an integer (mod n), in the
+    current thread, yielding control to the event loop after every
+    `slice_steps' iterations of the exponentiation algorithm.
+
+      >>> from RSA import IntegerModPQ
+      >>> class IntegerMod221(IntegerModPQ):
+      ...     p, q = 13, 17
+      >>> print (asyncio.run(apow(IntegerMod221(2), 100, slice_steps=3)))
+      16 (mod 221)
+    """
+    steps = base.pow_steps(exponent)
+    while not steps.advance(slice_steps):
+        await asyncio.sleep(0)
+    return steps.result
+
+#--------------------------------------------------------------------------
+
+## ----------- ##
+##  Main Code  ##
+## ----------- ##
+
+if __name__ == "__main__":
+    # If running as a script, run all the doctests defined in this module.
+     import sys, doctest
+     sys.exit(doctest.testmod()[0] > 0)
+
+#--------------------------------------------------------------------------
+
+# vim: ft=python et sw=4 ts=4
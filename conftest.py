@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+# This file is part of RSA.py testsuite.
+
+"""Configuration of the testsuite shared by all the tests."""
+
+import sys
+
+# The asyncio front-ends use syntax that older pythons can't even parse,
+# so they and their tests must not be collected there.
+collect_ignore = []
+if sys.version_info < (3, 7):
+    collect_ignore.extend(['RSA_async.py',
+                           'tests/encryption_async_test.py'])
+
+# vim: et sw=4 ts=4 ft=python
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This file is part of RSA.py testsuite.
+
+"""Tests for the base64/base32/hex armoring of the ciphertext."""
+
+import base64
+import binascii
+import random
+import pytest
+from RSA import BinaryEncrypter, PrivateKey, CryptoValueError
+from RSA import armor, dearmor, armored_encrypt, armored_decrypt
+from RSA import ARMOR_BASE64, ARMOR_BASE32, ARMOR_HEX
+from .lib import keys_with_bits, random_bytes
+from .lib import with_params, pytest_generate_tests
+
+keys_list = keys_with_bits(16)
+
+encodings = [
+    dict(encoding=ARMOR_BASE64, encode=base64.b64encode),
+    dict(encoding=ARMOR_BASE32, encode=base64.b32encode),
+    dict(encoding=ARMOR_HEX, encode=binascii.hexlify),
+]
+
+def split(data, seed):
+    # Split data into randomly sized blocks (some of them empty).
+    rng = random.Random(seed)
+    blocks = []
+    while data:
+        length = rng.randrange(0, 30)
+        blocks.append(data[:length])
+        data = data[length:]
+    return blocks
+
+@with_params([0, 1, 2, 3, 4, 5, 47, 48, 49, 200], 'length')
+@with_params(encodings)
+def test_armor(encoding, encode, length):
+    data = random_bytes(length)
+    text = b''.join(armor(split(data, length), encoding, line_length=16))
+    lines = text.splitlines()
+    assert b''.join(lines) == encode(data)
+    assert all(len(line) == 16 for line in lines[:-1])
+    assert text == b''.join(line + b'\n' for line in lines)
+    assert b''.join(dearmor(split(text, length + 1), encoding)) == data
+
+@with_params(encodings)
+def test_dearmor_text_strings(encoding, encode):
+    data = random_bytes(50)
+    text = encode(data).decode('ascii')
+    blocks = [' ' + text[:7] + '\r\n', '\t' + text[7:]]
+    assert b''.join(dearmor(blocks, encoding)) == data
+
+@with_params(encodings)
+def test_dearmor_buffers(encoding, encode):
+    data = random_bytes(50, seed=1)
+    text = encode(data)
+    blocks = [bytearray(text[:9]), memoryview(text[9:20]), text[20:]]
+    assert b''.join(dearmor(blocks, encoding)) == data
+
+def test_dearmor_non_ascii_text():
+    pytest.raises(CryptoValueError, b''.join,
+                  dearmor([b'Zm9v'.decode('ascii') + u'\xe9']))
+
+def test_dearmor_constant_memory():
+    # The decoded data is produced as the text is consumed.
+    def blocks():
+        for _ in range(10000):
+            yield b'Zm9vYmFy\n'
+    decoded = dearmor(blocks())
+    assert next(decoded) == b'foobar'
+
+@with_params([
+    dict(encoding=ARMOR_BASE64, text=b'Zm9vY'),
+    dict(encoding=ARMOR_BASE64, text=b'Zm9v!mFy'),
+    dict(encoding=ARMOR_BASE64, text=b'Zm8=Zm9v'),
+    dict(encoding=ARMOR_BASE32, text=b'MZ=W6==='),
+    dict(encoding=ARMOR_BASE32, text=b'MZXW6YQ'),
+    dict(encoding=ARMOR_HEX, text=b'abc'),
+    dict(encoding=ARMOR_HEX, text=b'zz'),
+])
+def test_dearmor_invalid(encoding, text):
+    pytest.raises(CryptoValueError, b''.join, dearmor([text], encoding))
+
+def test_armor_invalid_settings():
+    pytest.raises(CryptoValueError, b''.join, armor([b'x'], 'rot13'))
+    pytest.raises(CryptoValueError, b''.join, armor([b'x'], line_length=0))
+    pytest.raises(CryptoValueError, b''.join,
+                  armor([b'x'], ARMOR_BASE32, line_length=12))
+
+@with_params([0, 1, 100], 'length')
+@with_params(encodings)
+@with_params(keys_list)
+def test_armored_encryption(n, p, q, e, d, encoding, encode, length):
+    encrypter = BinaryEncrypter(PrivateKey(p, q, e))
+    plaintext = random_bytes(length)
+    text = b''.join(armored_encrypt(encrypter, plaintext, encoding))
+    ciphertext = b''.join(encrypter.encrypt(plaintext))
+    assert b''.join(text.split()) == encode(ciphertext)
+    decrypted = armored_decrypt(encrypter, split(text, length), encoding)
+    assert b''.join(decrypted) == plaintext
+
+# vim: et sw=4 ts=4 ft=python
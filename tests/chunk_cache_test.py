@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This file is part of RSA.py testsuite.
+
+"""Tests for the cache of encrypted/decrypted chunks."""
+
+import pickle
+import threading
+import pytest
+from RSA import BasicEncrypter, BinaryEncrypter, PrivateKey, ChunkCache
+from RSA import CryptoValueError, CryptoRuntimeError
+from .keys import keys as keys_dict
+from .lib import keys_with_bits, make_key
+from .lib import with_params, pytest_generate_tests
+
+keys_list = keys_with_bits(16)
+
+@with_params(keys_list)
+def test_cached_encryption_same_result(n, p, q, e, d):
+    key = PrivateKey(p, q, e)
+    cache = ChunkCache()
+    encrypter = BinaryEncrypter(key, chunk_cache=cache)
+    chunk = encrypter.plain_chunk_byte_length
+    plaintext = (b'\0' * chunk * 10 + b'x' * chunk * 5 + b'\0' * chunk) * 3
+    ciphertext = b''.join(encrypter.encrypt(plaintext))
+    assert ciphertext == b''.join(BinaryEncrypter(key).encrypt(plaintext))
+    assert (cache.hits, cache.misses) == (46, 2)
+    assert b''.join(encrypter.decrypt(ciphertext)) == plaintext
+    assert (cache.hits, cache.misses) == (92, 4)
+
+def test_cache_eviction():
+    cache = ChunkCache(max_size=2)
+    encrypter = BasicEncrypter(make_key(), chunk_cache=cache)
+    for x in (1, 2, 1, 3, 2, 1):
+        encrypter.encrypt(x)
+    # 1 was used more recently than 2 when 3 was added.
+    assert (cache.hits, cache.misses) == (1, 5)
+    assert len(cache) == 2
+    cache.clear()
+    assert len(cache) == 0
+
+def test_cache_shared_among_keys():
+    cache = ChunkCache()
+    tags = [tag for tag in keys_dict
+            if keys_dict[tag]['n'].bit_length() > 16][:2]
+    encrypters = [BasicEncrypter(make_key(tag), chunk_cache=cache)
+                  for tag in tags]
+    results = [encrypter.encrypt(12345) for encrypter in encrypters]
+    assert results == [BasicEncrypter(make_key(tag)).encrypt(12345)
+                       for tag in tags]
+    assert cache.misses == 2
+
+def test_cache_errors_not_cached():
+    cache = ChunkCache()
+    key = make_key()
+    encrypter = BasicEncrypter(key.public(), chunk_cache=cache)
+    pytest.raises(CryptoValueError, encrypter.encrypt, key.n)
+    pytest.raises(CryptoRuntimeError, encrypter.decrypt, 1)
+    assert len(cache) == 0
+
+def test_cache_invalid_size():
+    pytest.raises(CryptoValueError, ChunkCache, 0)
+
+def test_cache_threads():
+    cache = ChunkCache(max_size=8)
+    key = make_key()
+    encrypter = BasicEncrypter(key, chunk_cache=cache)
+    expected = [BasicEncrypter(key).encrypt(x) for x in range(16)]
+    failures = []
+    def work(offset):
+        for i in range(200):
+            x = (i + offset) % 16
+            if encrypter.encrypt(x) != expected[x]:
+                failures.append(x)
+    threads = [threading.Thread(target=work, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not failures
+    assert cache.hits + cache.misses == 800
+    assert len(cache) <= 8
+
+def test_cache_pickle():
+    cache = ChunkCache(max_size=5)
+    encrypter = BasicEncrypter(make_key(), chunk_cache=cache)
+    encrypter.encrypt(42)
+    clone = pickle.loads(pickle.dumps(encrypter))
+    assert clone.chunk_cache.max_size == 5
+    assert len(clone.chunk_cache) == 0
+    assert clone.encrypt(42) == encrypter.encrypt(42)
+
+# vim: et sw=4 ts=4 ft=python
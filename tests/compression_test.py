@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This file is part of RSA.py testsuite.
+
+"""Tests for the compression stage put in front of the encryption."""
+
+import json
+import pytest
+import RSA
+from RSA import BinaryEncrypter, CryptoValueError
+from RSA import CryptoRuntimeError, compress_blocks, decompress_blocks
+from .lib import make_key
+from .lib import with_params, pytest_generate_tests
+
+methods = []
+for method in (RSA.COMPRESSION_ZLIB, RSA.COMPRESSION_BZ2,
+               RSA.COMPRESSION_LZMA):
+    try:
+        RSA._compression_module(method)
+        methods.append(method)
+    except CryptoRuntimeError:
+        pass
+
+payload = json.dumps([dict(id=i, name="item%u" % i, tags=["a", "b"])
+                      for i in range(300)]).encode('ascii')
+
+def split(data, size):
+    return [data[i:i+size] for i in range(0, len(data), size)]
+
+@with_params([b'', b'x', payload], 'data')
+@with_params(methods, 'method')
+def test_compression_roundtrip(method, data):
+    compressed = list(compress_blocks(split(data, 100), method))
+    assert b''.join(decompress_blocks(compressed, method)) == data
+    # Decompression works however the data is split.
+    compressed = b''.join(compressed)
+    assert b''.join(decompress_blocks(split(compressed, 7), method)) == data
+
+@with_params(methods, 'method')
+def test_compression_cuts_chunks(method):
+    encrypter = BinaryEncrypter(make_key())
+    ciphertext = b''.join(encrypter.encrypt_blocks(
+        compress_blocks([payload], method)))
+    assert 3 * len(ciphertext) < len(b''.join(encrypter.encrypt(payload)))
+    plaintext = decompress_blocks(encrypter.decrypt(ciphertext), method)
+    assert b''.join(plaintext) == payload
+
+@with_params(methods, 'method')
+def test_decompression_errors(method):
+    compressed = b''.join(compress_blocks([payload], method))
+    for data in (compressed[:-5], compressed + b'garbage',
+                 b'garbage' + compressed):
+        pytest.raises(CryptoValueError, b''.join,
+                      decompress_blocks([data], method))
+
+@with_params(methods, 'method')
+def test_decompression_input_errors_unchanged(method):
+    compressed = b''.join(compress_blocks([payload], method))
+    def blocks(error):
+        yield compressed[:10]
+        raise error
+    for error in (CryptoValueError("bad padding"), IOError("read error")):
+        info = pytest.raises(type(error), b''.join,
+                             decompress_blocks(blocks(error), method))
+        assert info.value is error
+
+def test_unknown_compression_method():
+    pytest.raises(CryptoValueError, b''.join, compress_blocks([b'x'], 42))
+
+# vim: et sw=4 ts=4 ft=python
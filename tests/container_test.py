@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This file is part of RSA.py testsuite.
+
+"""Tests for the chunk-indexed ciphertext containers."""
+
+import io
+import random
+import pytest
+from RSA import BinaryEncrypter, PrivateKey, CryptoValueError
+from RSA import encrypt_container, append_container, ContainerReader
+from RSA import COMPRESSION_NONE, COMPRESSION_ZLIB, COMPRESSION_BZ2
+from .keys import keys as keys_dict
+from .lib import keys_with_bits, make_key, random_bytes
+from .lib import with_params, pytest_generate_tests
+
+keys_list = keys_with_bits(16)
+
+def make_container(encrypter, plaintext, indexed,
+                   compression=COMPRESSION_NONE):
+    return b''.join(encrypt_container(encrypter, plaintext, indexed,
+                                      compression))
+
+@with_params([0, 1, 37, 300], 'length')
+@with_params([False, True], 'indexed')
+@with_params(keys_list)
+def test_container_roundtrip(n, p, q, e, d, length, indexed):
+    encrypter = BinaryEncrypter(PrivateKey(p, q, e))
+    plaintext = random_bytes(length)
+    container = make_container(encrypter, plaintext, indexed)
+    reader = ContainerReader(encrypter, container)
+    assert reader.plaintext_length == length
+    assert reader.indexed == indexed
+    assert reader.decrypt() == plaintext
+
+@with_params([False, True], 'indexed')
+def test_container_chunks_same_as_encrypt(indexed):
+    encrypter = BinaryEncrypter(make_key())
+    plaintext = random_bytes(100)
+    container = make_container(encrypter, plaintext, indexed)
+    reader = ContainerReader(encrypter, container)
+    chunks = list(encrypter.encrypt(plaintext))
+    entry_length = encrypter.n_byte_length + 4 * indexed
+    start = len(container) - len(chunks) * entry_length
+    for i, chunk in enumerate(chunks):
+        position = start + i * entry_length
+        assert container[position:position+len(chunk)] == chunk
+
+@with_params([False, True], 'use_file')
+def test_container_decrypt_range(use_file):
+    encrypter = BinaryEncrypter(make_key())
+    plaintext = random_bytes(200, seed=1)
+    container = make_container(encrypter, plaintext, True)
+    source = io.BytesIO(container) if use_file else container
+    reader = ContainerReader(encrypter, source)
+    rng = random.Random(2)
+    for _ in range(50):
+        offset = rng.randrange(0, 210)
+        length = rng.randrange(0, 30)
+        assert (reader.decrypt_range(offset, length) ==
+                plaintext[offset:offset+length])
+
+def test_container_decrypt_range_only_needed_chunks():
+    encrypter = BinaryEncrypter(make_key())
+    plaintext = random_bytes(200, seed=3)
+    container = bytearray(make_container(encrypter, plaintext, False))
+    reader = ContainerReader(encrypter, container)
+    chunk = reader.plain_chunk_length
+    # Garble the last chunk: the first ones are still readable.
+    container[-1] ^= 0xff
+    assert reader.decrypt_range(0, 2 * chunk) == plaintext[:2*chunk]
+
+def test_container_invalid_range():
+    encrypter = BinaryEncrypter(make_key())
+    container = make_container(encrypter, b'xy', False)
+    reader = ContainerReader(encrypter, container)
+    pytest.raises(CryptoValueError, reader.decrypt_range, -1, 1)
+    pytest.raises(CryptoValueError, reader.decrypt_range, 0, -1)
+
+def test_container_corrupted_chunk_detected():
+    encrypter = BinaryEncrypter(make_key())
+    plaintext = random_bytes(100, seed=4)
+    container = bytearray(make_container(encrypter, plaintext, True))
+    reader = ContainerReader(encrypter, container)
+    position = len(container) - 5
+    container[position] ^= 0x01
+    pytest.raises(CryptoValueError, reader.decrypt)
+    assert reader.decrypt_range(0, 1) == plaintext[:1]
+
+@with_params([0, 9, 20, 40], 'position')
+def test_container_corrupted_header(position):
+    encrypter = BinaryEncrypter(make_key())
+    container = bytearray(make_container(encrypter, b'foobar', False))
+    container[position] ^= 0x01
+    pytest.raises(CryptoValueError, ContainerReader, encrypter,
+                  bytes(container))
+
+def test_container_truncated():
+    encrypter = BinaryEncrypter(make_key())
+    container = make_container(encrypter, b'foobar' * 10, True)
+    for size in (0, 10, len(container) - 1):
+        pytest.raises(CryptoValueError, ContainerReader, encrypter,
+                      container[:size])
+
+def test_container_wrong_key():
+    container = make_container(BinaryEncrypter(make_key()), b'foo', False)
+    other = BinaryEncrypter(make_key(
+        [tag for tag in keys_dict if tag != 'styere_e19'
+         and keys_dict[tag]['n'].bit_length() > 16][0]))
+    pytest.raises(CryptoValueError, ContainerReader, other, container)
+
+class WriteCountingFile(io.BytesIO):
+    def __init__(self, data):
+        io.BytesIO.__init__(self, data)
+        self.written = 0
+    def write(self, data):
+        self.written += len(data)
+        return io.BytesIO.write(self, data)
+
+@with_params([False, True], 'indexed')
+@with_params(keys_list)
+def test_container_append(n, p, q, e, d, indexed):
+    encrypter = BinaryEncrypter(PrivateKey(p, q, e))
+    plaintext = random_bytes(150, seed=5)
+    rng = random.Random(6)
+    pieces, position = [], 0
+    while position < len(plaintext):
+        length = rng.randrange(0, 20)
+        pieces.append(plaintext[position:position+length])
+        position += length
+    fileobj = io.BytesIO(make_container(encrypter, b'', indexed))
+    for i, piece in enumerate(pieces):
+        length = append_container(encrypter, fileobj, piece)
+        assert length == len(b''.join(pieces[:i+1]))
+    # Same result as encrypting everything at once.
+    assert fileobj.getvalue() == make_container(encrypter, plaintext, indexed)
+    assert ContainerReader(encrypter, fileobj).decrypt() == plaintext
+
+@with_params([False, True], 'indexed')
+def test_container_append_writes_only_new_data(indexed):
+    encrypter = BinaryEncrypter(make_key())
+    chunk = encrypter.plain_chunk_byte_length
+    container = make_container(encrypter, random_bytes(50 * chunk + 1),
+                               indexed)
+    fileobj = WriteCountingFile(container)
+    append_container(encrypter, fileobj, b'x' * chunk)
+    # The header, the rewritten partial chunk and one new chunk, with
+    # their CRCs if the container has an index.
+    header_length = len(make_container(encrypter, b'', False))
+    assert fileobj.written == (header_length + 2 * encrypter.n_byte_length
+                               + 4 * 2 * indexed)
+
+@with_params([0, 1, 7], 'old_length')
+@with_params([False, True], 'indexed')
+def test_container_interrupted_append(indexed, old_length):
+    encrypter = BinaryEncrypter(make_key())
+    plaintext = random_bytes(old_length + 40, seed=7)
+    container = make_container(encrypter, plaintext[:old_length], indexed)
+    header_length = len(make_container(encrypter, b'', False))
+    fileobj = io.BytesIO(container)
+    append_container(encrypter, fileobj, plaintext[old_length:])
+    # The crash came before the header was updated.
+    interrupted = bytearray(fileobj.getvalue())
+    interrupted[:header_length] = container[:header_length]
+    reader = ContainerReader(encrypter, interrupted)
+    assert reader.decrypt() == plaintext[:old_length]
+    fileobj = io.BytesIO(bytes(interrupted))
+    append_container(encrypter, fileobj, plaintext[old_length:-5])
+    assert fileobj.getvalue() == make_container(encrypter, plaintext[:-5],
+                                                indexed)
+
+def test_container_append_corrupted():
+    encrypter = BinaryEncrypter(make_key())
+    fileobj = io.BytesIO(make_container(encrypter, b'foobar', False)[:-1])
+    pytest.raises(CryptoValueError, append_container, encrypter, fileobj,
+                  b'baz')
+
+@with_params([0, 1, 300, 5000], 'length')
+@with_params([COMPRESSION_ZLIB, COMPRESSION_BZ2], 'compression')
+@with_params([False, True], 'indexed')
+def test_container_compressed(indexed, compression, length):
+    encrypter = BinaryEncrypter(make_key())
+    plaintext = (b'{"foo": "bar"}, ' * 400)[:length]
+    container = make_container(encrypter, plaintext, indexed, compression)
+    reader = ContainerReader(encrypter, container)
+    assert reader.compression == compression
+    assert reader.plaintext_length == length
+    assert reader.decrypt() == plaintext
+    if length > 1000:
+        assert len(container) < len(make_container(encrypter, plaintext,
+                                                   indexed)) // 3
+    reader.decompression_batch_chunks = 1
+    rng = random.Random(length)
+    for _ in range(10):
+        offset = rng.randrange(0, length + 10)
+        size = rng.randrange(0, 50)
+        assert (reader.decrypt_range(offset, size) ==
+                plaintext[offset:offset+size])
+
+def test_container_compressed_corrupted():
+    encrypter = BinaryEncrypter(make_key())
+    plaintext = b'foobar' * 1000
+    container = make_container(encrypter, plaintext, False,
+                               COMPRESSION_ZLIB)
+    # Drop the last chunk.
+    truncated = bytearray(container[:-encrypter.n_byte_length])
+    pytest.raises(CryptoValueError,
+                  ContainerReader(encrypter, truncated).decrypt)
+    # Wrong plaintext length in the header.
+    other = make_container(encrypter, plaintext + b'x', False,
+                           COMPRESSION_ZLIB)
+    header_length = len(make_container(encrypter, b'', False))
+    forged = other[:header_length] + container[header_length:]
+    pytest.raises(CryptoValueError,
+                  ContainerReader(encrypter, forged).decrypt)
+
+@with_params([4, 200, -1, 'zlib'], 'compression')
+def test_container_unknown_compression(compression):
+    encrypter = BinaryEncrypter(make_key())
+    pytest.raises(CryptoValueError, encrypt_container, encrypter, b'foo',
+                  False, compression)
+
+def test_container_compressed_append():
+    encrypter = BinaryEncrypter(make_key())
+    fileobj = io.BytesIO(make_container(encrypter, b'foo', False,
+                                        COMPRESSION_ZLIB))
+    pytest.raises(CryptoValueError, append_container, encrypter, fileobj,
+                  b'bar')
+
+# vim: et sw=4 ts=4 ft=python
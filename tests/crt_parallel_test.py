@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This file is part of RSA.py testsuite.
+
+"""Tests for the exponentiations (mod pq) whose halves are calculated
+concurrently in an executor."""
+
+import pickle
+import pytest
+import RSA
+from RSA import Deadline, PrivateKey, PublicKey, integer_mod_pq_class
+from RSA import IntegerEncrypter, BinaryEncrypter
+from .lib import keys_with_bits
+from .lib import with_params, pytest_generate_tests
+
+futures = pytest.importorskip('concurrent.futures')
+
+keys_list = keys_with_bits(max_bits=3000)
+
+def setup_module(module):
+    global process_pool
+    process_pool = futures.ProcessPoolExecutor(2)
+
+def teardown_module(module):
+    process_pool.shutdown()
+
+@with_params(keys_list)
+def test_pow_parallel(n, p, q, e, d):
+    mod_n = integer_mod_pq_class(p, q)
+    for x in (0, 1, 2, n // 3, n - 1):
+        for exponent in (0, 1, e, d, -1, -d):
+            if exponent < 0 and x in (0, n // 3):
+                continue
+            assert (mod_n(x).pow_parallel(exponent, process_pool)
+                    == mod_n(x)**exponent)
+
+def test_pow_parallel_thread_pool():
+    mod_n = integer_mod_pq_class(2**521 - 1, 2**607 - 1)
+    with futures.ThreadPoolExecutor(1) as executor:
+        assert (mod_n(12345).pow_parallel(2**600 + 1, executor)
+                == mod_n(12345)**(2**600 + 1))
+        # The example in the docstring, skipped by the doctests.
+        mod_221 = integer_mod_pq_class(13, 17)
+        assert str(mod_221(2).pow_parallel(100, executor)) == '16 (mod 221)'
+
+def test_pow_parallel_deadline():
+    mod_n = integer_mod_pq_class(2**2203 - 1, 2**2281 - 1)
+    deadline = Deadline(timeout=0)
+    pytest.raises(RSA.IMTimeoutError, mod_n(3).pow_parallel,
+                  2**4000 - 1, process_pool, deadline)
+    # The executor is still usable afterwards.
+    assert mod_n(3).pow_parallel(3, process_pool) == mod_n(27)
+
+@with_params(keys_list)
+def test_encrypter_crt_executor(n, p, q, e, d):
+    encrypter = IntegerEncrypter(PrivateKey(p, q, e), process_pool)
+    plain = n // 7 + 1
+    cipher = IntegerEncrypter(PublicKey(n, e)).encrypt(plain)
+    assert encrypter.decrypt(cipher) == plain
+    assert encrypter.encrypt(plain) == cipher
+
+def test_binary_encrypter_crt_executor():
+    key = PrivateKey(p=2**521 - 1, q=2**607 - 1, e=65537)
+    plaintext = b'foobar' * 100
+    ciphertext = b''.join(BinaryEncrypter(key.public()).encrypt(plaintext))
+    encrypter = BinaryEncrypter(key, process_pool)
+    assert b''.join(encrypter.decrypt(ciphertext)) == plaintext
+    deadline = Deadline(timeout=0)
+    pytest.raises(RSA.CryptoTimeoutError, list,
+                  encrypter.decrypt(ciphertext, deadline))
+
+def test_pickle_encrypter_crt_executor():
+    key = PrivateKey(p=2**89 - 1, q=2**107 - 1, e=65537)
+    encrypter = IntegerEncrypter(key, process_pool)
+    clone = pickle.loads(pickle.dumps(encrypter))
+    assert clone.crt_executor is None
+    assert encrypter.crt_executor is process_pool
+    assert clone.decrypt(encrypter.encrypt(42)) == 42
+
+# vim: et sw=4 ts=4 ft=python
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This file is part of RSA.py testsuite.
+
+"""Tests for deadlines and cancellation of long computations."""
+
+import pytest
+import RSA
+from RSA import Deadline, BasicEncrypter, BinaryEncrypter
+from .lib import make_key
+from .lib import integers_mod, with_params, pytest_generate_tests
+
+# Big enough that no exponentiation can complete before the first check
+# of the deadline.
+big_modulos = [2**521 - 1, (2**521 - 1, 2**607 - 1)]
+
+# Deadlines which are already expired.
+def expired_deadlines():
+    cancelled = Deadline()
+    cancelled.cancel()
+    return [Deadline(timeout=0), Deadline(timeout=-1), cancelled]
+
+def test_deadline_not_expired():
+    deadline = Deadline(timeout=3600)
+    assert not deadline.expired()
+    deadline.check()
+
+def test_deadline_without_timeout_never_expires():
+    deadline = Deadline()
+    assert deadline.expires_at is None
+    assert not deadline.expired()
+
+def test_deadline_cancel():
+    deadline = Deadline(timeout=3600)
+    deadline.cancel()
+    assert deadline.expired()
+    pytest.raises(RSA.IMTimeoutError, deadline.check)
+
+@with_params(expired_deadlines(), 'deadline')
+@with_params(big_modulos, 'modulo')
+def test_integermod_pow_expired_deadline(modulo, deadline):
+    cls = integers_mod(modulo)
+    pytest.raises(RSA.IMTimeoutError, cls(3).pow_with_deadline,
+                  2**600 + 1, deadline)
+
+@with_params(big_modulos, 'modulo')
+def test_integermod_pow_with_deadline(modulo):
+    cls = integers_mod(modulo)
+    exponent = 2**600 + 1
+    assert (cls(3).pow_with_deadline(exponent, Deadline(timeout=3600))
+            == cls(3)**exponent)
+
+def test_integermod_pow_third_argument_not_a_deadline():
+    cls = integers_mod(101)
+    pytest.raises(TypeError, pow, cls(3), 5, Deadline(timeout=3600))
+
+@with_params(expired_deadlines(), 'deadline')
+def test_encrypter_expired_deadline(deadline):
+    encrypter = BasicEncrypter(make_key('M2281_M2203'))
+    pytest.raises(RSA.CryptoTimeoutError, encrypter.encrypt, 2**100,
+                  deadline)
+    pytest.raises(RSA.CryptoTimeoutError, encrypter.decrypt, 2**100,
+                  deadline)
+
+def test_binary_encrypter_with_deadline():
+    encrypter = BinaryEncrypter(make_key('M2281_M2203'))
+    plaintext = b'foobar' * 500
+    ciphertext = b''.join(encrypter.encrypt(plaintext,
+                                            Deadline(timeout=3600)))
+    assert plaintext == b''.join(encrypter.decrypt(ciphertext,
+                                                   Deadline(timeout=3600)))
+    # The deadline spans the whole iteration over the returned generator.
+    deadline = Deadline(timeout=3600)
+    chunks = encrypter.decrypt(ciphertext, deadline)
+    next(chunks)
+    deadline.cancel()
+    pytest.raises(RSA.CryptoTimeoutError, list, chunks)
+
+# vim: et sw=4 ts=4 ft=python
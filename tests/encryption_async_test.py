@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This file is part of RSA.py testsuite.
+
+"""Tests for the asyncio front-ends of our encrypters."""
+
+import asyncio
+import pytest
+from RSA import BinaryEncrypter, PackedBinaryEncrypter, PrivateKey
+from RSA import CryptoValueError
+from RSA_async import apow, aencrypt_iter, adecrypt_iter
+from RSA_async import aencrypt_stream, adecrypt_stream
+from .lib import keys_with_bits, make_key
+from .lib import with_params, pytest_generate_tests
+
+keys_list = keys_with_bits(16)
+
+plaintexts = [b'', b'x', b'foobar' * 100, bytes(range(256)) * 7]
+
+# Minimal stand-in for an `asyncio.StreamWriter', recording how data
+# is written and drained.
+class BufferWriter:
+    def __init__(self):
+        self.data = b''
+        self.undrained = 0
+        self.max_undrained = 0
+    def write(self, data):
+        self.data += data
+        self.undrained += len(data)
+        self.max_undrained = max(self.max_undrained, self.undrained)
+    async def drain(self):
+        self.undrained = 0
+
+# Readers must be created from within a running event loop.
+def make_reader(data):
+    reader = asyncio.StreamReader()
+    reader.feed_data(data)
+    reader.feed_eof()
+    return reader
+
+def run_iter(function, encrypter, data, **kwargs):
+    async def collect():
+        blocks = function(encrypter, make_reader(data), **kwargs)
+        return b''.join([block async for block in blocks])
+    return asyncio.run(collect())
+
+def run_stream(function, encrypter, data, writer, **kwargs):
+    async def stream():
+        return await function(encrypter, make_reader(data), writer, **kwargs)
+    return asyncio.run(stream())
+
+@with_params(plaintexts, 'plaintext')
+@with_params([1, 3, 64], 'batch_chunks')
+@with_params(keys_list)
+def test_async_iter_same_as_sync(n, p, q, e, d, plaintext, batch_chunks):
+    encrypter = BinaryEncrypter(PrivateKey(p, q, e))
+    expected = b''.join(encrypter.encrypt(plaintext))
+    ciphertext = run_iter(aencrypt_iter, encrypter, plaintext,
+                          batch_chunks=batch_chunks)
+    assert ciphertext == expected
+    deciphertext = run_iter(adecrypt_iter, encrypter, ciphertext,
+                            batch_chunks=batch_chunks)
+    assert deciphertext == plaintext
+
+@with_params([1, 2, 5], 'max_pending')
+def test_async_stream_roundtrip(max_pending):
+    encrypter = BinaryEncrypter(make_key())
+    plaintext = b'abcdefgh' * 500
+    writer = BufferWriter()
+    count = run_stream(aencrypt_stream, encrypter, plaintext, writer,
+                       batch_chunks=2, max_pending=max_pending)
+    assert count == len(writer.data)
+    # The writer must be drained after every batch.
+    assert writer.max_undrained <= 2 * encrypter.n_byte_length
+    ciphertext = writer.data
+    writer = BufferWriter()
+    run_stream(adecrypt_stream, encrypter, ciphertext, writer)
+    assert writer.data == plaintext
+
+def test_async_decrypt_unaligned_input():
+    encrypter = BinaryEncrypter(make_key())
+    ciphertext = b''.join(encrypter.encrypt(b'foo' * 100))
+    pytest.raises(CryptoValueError, run_iter,
+                  adecrypt_iter, encrypter, ciphertext[:-1])
+
+def test_async_results_not_held_back_by_input():
+    encrypter = BinaryEncrypter(make_key())
+    chunk_length = encrypter.plain_chunk_byte_length
+    plaintext = b'foobar' * chunk_length
+    async def convert():
+        reader = asyncio.StreamReader()
+        reader.feed_data(plaintext[:2 * chunk_length])
+        blocks = aencrypt_iter(encrypter, reader, batch_chunks=2)
+        # The first batch is yielded while waiting for the second one.
+        first = await asyncio.wait_for(blocks.__anext__(), 30)
+        reader.feed_data(plaintext[2 * chunk_length:])
+        reader.feed_eof()
+        return first, b''.join([block async for block in blocks])
+    first, rest = asyncio.run(convert())
+    assert first == b''.join(encrypter.encrypt(plaintext[:2 * chunk_length]))
+    assert first + rest == b''.join(encrypter.encrypt(plaintext))
+
+@with_params([dict(batch_chunks=0, max_pending=1),
+              dict(batch_chunks=1, max_pending=0)])
+def test_async_invalid_batching(batch_chunks, max_pending):
+    encrypter = BinaryEncrypter(PrivateKey(p=4111, q=4703, e=127))
+    pytest.raises(ValueError, run_iter, aencrypt_iter, encrypter, b'x',
+                  batch_chunks=batch_chunks, max_pending=max_pending)
+
+def test_async_packed_encrypter_rejected():
+    encrypter = PackedBinaryEncrypter(PrivateKey(p=4111, q=4703, e=127))
+    pytest.raises(CryptoValueError, run_iter, aencrypt_iter, encrypter,
+                  b'foobar')
+    pytest.raises(CryptoValueError, run_stream, aencrypt_stream,
+                  encrypter, b'foobar', BufferWriter())
+    # Rejected up front, not once a batch fails to decrypt.
+    ciphertext = b''.join(encrypter.encrypt(b'foobar' * 100))
+    pytest.raises(CryptoValueError, adecrypt_iter, encrypter, None)
+    info = pytest.raises(CryptoValueError, run_stream, adecrypt_stream,
+                         encrypter, ciphertext, BufferWriter(),
+                         batch_chunks=8)
+    assert 'whole bytes' in str(info.value)
+
+@with_params([1, 10, 1000], 'slice_steps')
+@with_params(keys_list)
+def test_apow_interleaved(n, p, q, e, d, slice_steps):
+    mod_n = BinaryEncrypter(PrivateKey(p, q, e)).mod_n
+    ticks = []
+    async def ticker():
+        while True:
+            ticks.append(None)
+            await asyncio.sleep(0)
+    async def decrypt(plain):
+        task = asyncio.ensure_future(ticker())
+        try:
+            cipher = await apow(mod_n(plain), e, slice_steps)
+            return await apow(cipher, d, slice_steps)
+        finally:
+            task.cancel()
+    plain = (n - 1) // 3
+    assert asyncio.run(decrypt(plain)) == mod_n(plain)
+    # The exponentiations didn't monopolize the event loop.
+    if slice_steps == 1:
+        assert len(ticks) > d.bit_length()
+
+# vim: et sw=4 ts=4 ft=python
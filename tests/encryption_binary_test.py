@@ -5,12 +5,15 @@
 """Tests for our implementation of RSA applied to generic sequences
 of bytes."""
 
-from RSA import BinaryEncrypter, PublicKey, PrivateKey
+import pytest
+from RSA import BinaryEncrypter, PublicKey, PrivateKey, Deadline
+from RSA import CryptoValueError
 from .keys import keys as keys_dict
+from .lib import keys_with_bits, make_key
 from .lib import ord2byte, with_params, without_duplicates
 from .lib import pytest_generate_tests
 
-keys_list = [ keys_dict[tag] for tag in keys_dict ]
+keys_list = keys_with_bits()
 
 def define_texts():
     texts = set()
@@ -104,9 +107,8 @@ def test_privkey_encrypt_privkey_decrypt(n, p, q, e, d, plaintext):
     assert plaintext == b''.join(encrypter.decrypt(ciphertext))
 
 # Check that we can enncrypt/decrypt also "biggish" byte sequences
-# (~ 50M) in a reasonable time.
-# FIXME: having a timeout here would be better than risking to have
-# the testsuite almost hang ...
+# (~ 50M) in a reasonable time.  We give up (and fail) after a generous
+# timeout, rather than risking to have the testsuite almost hang.
 @with_params([keys_dict['M2281_M2203'], keys_dict['styere_e19']])
 def test_encrypt_decrypt_large(n, p, q, e, d):
     def gen_bytes():
@@ -120,6 +122,56 @@ def test_encrypt_decrypt_large(n, p, q, e, d):
                     fp.close()
                     break
     encrypter = BinaryEncrypter(PrivateKey(p, q, e))
-    for chunk in encrypter.encrypt(gen_bytes()): pass
+    for chunk in encrypter.encrypt(gen_bytes(), Deadline(timeout=600)):
+        pass
+
+def split_blocks(data, sizes):
+    # Split data into blocks with the given sizes (cycling over them).
+    blocks, position, i = [], 0, 0
+    while position < len(data):
+        size = sizes[i % len(sizes)]
+        blocks.append(data[position:position+size])
+        position += size
+        i += 1
+    return blocks
+
+@with_params([[1], [0, 3], [7, 1, 0, 64], [1000]], 'sizes')
+@with_params([k for k in keys_list if k['n'].bit_length() > 16])
+def test_encrypt_decrypt_blocks(n, p, q, e, d, sizes):
+    encrypter = BinaryEncrypter(PrivateKey(p, q, e))
+    plaintext = b''.join(ord2byte(x % 256) for x in range(500))
+    expected = list(encrypter.encrypt(iter(plaintext)))
+    blocks = split_blocks(plaintext, sizes)
+    assert list(encrypter.p2i_blocks(blocks)) == list(encrypter.p2i(
+        iter(plaintext)))
+    assert list(encrypter.encrypt_blocks(blocks)) == expected
+    ciphertext = b''.join(expected)
+    blocks = [bytearray(b) for b in split_blocks(ciphertext, sizes)]
+    assert b''.join(encrypter.decrypt_blocks(blocks)) == plaintext
+
+@with_params([b'', b'x', b'foobar' * 33], 'plaintext')
+@with_params([k for k in keys_list if k['n'].bit_length() > 16])
+def test_bytes_like_same_as_iterable(n, p, q, e, d, plaintext):
+    encrypter = BinaryEncrypter(PrivateKey(p, q, e))
+    expected = list(encrypter.p2i(iter(plaintext)))
+    for data in (plaintext, bytearray(plaintext), memoryview(plaintext)):
+        assert list(encrypter.p2i(data)) == expected
+
+# Byte sequences are split into chunks directly: make sure that works on
+# all the supported pythons, whatever the number of chunks.
+@with_params([b'hello world' * 5, bytearray(b'hello world' * 5)],
+             'plaintext')
+@with_params([k for k in keys_list if k['n'].bit_length() > 16])
+def test_encrypt_decrypt_byte_sequence(n, p, q, e, d, plaintext):
+    encrypter = BinaryEncrypter(PrivateKey(p, q, e))
+    ciphertext = b''.join(encrypter.encrypt(plaintext))
+    assert b''.join(encrypter.decrypt(ciphertext)) == plaintext
+    assert b''.join(encrypter.decrypt(bytearray(ciphertext))) == plaintext
+
+def test_decrypt_blocks_unaligned():
+    encrypter = BinaryEncrypter(make_key())
+    ciphertext = b''.join(encrypter.encrypt(b'foobar'))
+    pytest.raises(CryptoValueError, b''.join,
+                  encrypter.decrypt_blocks([ciphertext[:3], b'\0']))
 
 # vim: et sw=4 ts=4 ft=python
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This file is part of RSA.py testsuite.
+
+"""Tests for the hybrid (RSA plus keystream) encryption."""
+
+import random
+import pytest
+import RSA
+from RSA import HybridEncrypter, PrivateKey, CryptoValueError
+from RSA import HYBRID_SHAKE256, HYBRID_HMAC_SHA256_CTR
+from .lib import keys_with_bits, random_bytes
+from .lib import with_params, pytest_generate_tests
+
+keys_list = keys_with_bits(16)
+
+algorithms = [HYBRID_HMAC_SHA256_CTR]
+if hasattr(__import__('hashlib'), 'shake_256'):
+    algorithms.append(HYBRID_SHAKE256)
+
+def split(data, seed):
+    # Split data into randomly sized blocks (some of them empty).
+    rng = random.Random(seed)
+    blocks = []
+    while data:
+        length = rng.randrange(0, 40)
+        blocks.append(data[:length])
+        data = data[length:]
+    return blocks
+
+def encrypt(encrypter, plaintext):
+    return b''.join(encrypter.encrypt(plaintext))
+
+def decrypt(encrypter, ciphertext):
+    return b''.join(encrypter.decrypt(ciphertext))
+
+key = PrivateKey(p=2**89-1, q=2**107-1, e=65537)
+
+@with_params(algorithms, 'algorithm')
+@with_params(keys_list)
+def test_hybrid_roundtrip(n, p, q, e, d, algorithm):
+    encrypter = HybridEncrypter(PrivateKey(p, q, e), algorithm=algorithm)
+    for plaintext in (b'', b'x', random_bytes(1000)):
+        assert decrypt(encrypter, encrypt(encrypter, plaintext)) == plaintext
+
+@with_params([1, 7, 16], 'segment_size')
+@with_params(algorithms, 'algorithm')
+def test_hybrid_segment_boundaries(segment_size, algorithm):
+    encrypter = HybridEncrypter(key, segment_size=segment_size,
+                                algorithm=algorithm)
+    # The header is self-describing: the decrypter settings don't matter.
+    decrypter = HybridEncrypter(key)
+    for length in range(0, 3 * segment_size + 2):
+        plaintext = random_bytes(length, length)
+        ciphertext = encrypt(encrypter, plaintext)
+        full, partial = divmod(length, segment_size)
+        assert len(ciphertext) == (len(encrypt(encrypter, b'')) - 32 +
+                                   length + 32 * (full + 1))
+        assert decrypt(decrypter, ciphertext) == plaintext
+
+@with_params([0, 1, 2], 'seed')
+def test_hybrid_streams(seed):
+    encrypter = HybridEncrypter(key, segment_size=10)
+    plaintext = random_bytes(500, seed)
+    ciphertext = b''.join(encrypter.encrypt_stream(split(plaintext, seed)))
+    assert decrypt(encrypter, ciphertext) == plaintext
+    blocks = list(encrypter.decrypt_stream(split(ciphertext, seed + 1)))
+    assert b''.join(blocks) == plaintext
+    # Each decrypted segment is returned as soon as it's authenticated.
+    assert [len(block) for block in blocks] == [10] * 50
+
+def test_hybrid_encrypt_stream_is_lazy():
+    encrypter = HybridEncrypter(key, segment_size=4)
+    def blocks():
+        yield b'abcdefgh'
+        raise RuntimeError("read too much")
+    ciphertext = encrypter.encrypt_stream(blocks())
+    next(ciphertext) # header
+    assert len(next(ciphertext)) == 4 + 32
+
+def test_hybrid_randomized():
+    encrypter = HybridEncrypter(key)
+    assert encrypt(encrypter, b'foo') != encrypt(encrypter, b'foo')
+
+def test_hybrid_public_key():
+    encrypter = HybridEncrypter(key.public())
+    ciphertext = encrypt(encrypter, b'foobar')
+    pytest.raises(RSA.CryptoRuntimeError, decrypt, encrypter, ciphertext)
+    assert decrypt(HybridEncrypter(key), ciphertext) == b'foobar'
+
+def test_hybrid_wrong_key():
+    other = PrivateKey(p=2**61-1, q=2**107-1, e=65537)
+    ciphertext = encrypt(HybridEncrypter(other), b'foobar')
+    pytest.raises(CryptoValueError, decrypt, HybridEncrypter(key),
+                  ciphertext)
+
+def test_hybrid_tampering():
+    encrypter = HybridEncrypter(key, segment_size=8)
+    ciphertext = encrypt(encrypter, b'0123456789abcdefghij')
+    for position in range(len(ciphertext)):
+        tampered = bytearray(ciphertext)
+        tampered[position] ^= 0x40
+        pytest.raises((CryptoValueError, RSA.CryptoRuntimeError), decrypt,
+                      encrypter, bytes(tampered))
+    for length in range(len(ciphertext)):
+        pytest.raises(CryptoValueError, decrypt, encrypter,
+                      ciphertext[:length])
+    pytest.raises(CryptoValueError, decrypt, encrypter, ciphertext + b'x')
+    # Swap two segments.
+    header_length = len(ciphertext) - 3 * 40 + 4
+    segments = [ciphertext[i:i+40] for i in range(header_length,
+                                                  header_length + 80, 40)]
+    swapped = (ciphertext[:header_length] + segments[1] + segments[0] +
+               ciphertext[header_length + 80:])
+    pytest.raises(CryptoValueError, decrypt, encrypter, swapped)
+
+@with_params([dict(segment_size=0), dict(segment_size=2**32),
+              dict(algorithm=0), dict(algorithm=3)], 'settings')
+def test_hybrid_invalid_settings(settings):
+    pytest.raises(CryptoValueError, HybridEncrypter, key, **settings)
+
+def test_hybrid_not_encrypted():
+    encrypter = HybridEncrypter(key)
+    for data in (b'', b'foobar', b'PYRSAHY\0' + b'\0' * 100):
+        pytest.raises(CryptoValueError, decrypt, encrypter, data)
+
+# vim: et sw=4 ts=4 ft=python
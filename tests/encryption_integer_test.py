@@ -4,7 +4,9 @@
 
 """Tests for our implementation of RSA applied to integers."""
 
-from RSA import PublicKey, PrivateKey, IntegerEncrypter
+import pytest
+from RSA import PublicKey, PrivateKey, IntegerEncrypter, BasicEncrypter
+from RSA import CryptoValueError, CryptoRuntimeError
 from .lib import s2i, with_params, without_duplicates
 from .lib import pytest_generate_tests
 from .keys import keys
@@ -274,4 +276,19 @@ def test_decrypt(key, plain, cipher):
     encrypter = IntegerEncrypter(PrivateKey(key['p'], key['q'], key['e']))
     assert encrypter.decrypt(cipher) == plain
 
+@with_params([BasicEncrypter, IntegerEncrypter], 'cls')
+@with_params(list(keys.values()), 'key')
+def test_encrypt_decrypt_many(cls, key):
+    public = cls(PublicKey(key['n'], key['e']))
+    private = cls(PrivateKey(key['p'], key['q'], key['e']))
+    plains = [0, 1, 2, key['n'] // 3, key['n'] - 1, 2]
+    ciphers = [BasicEncrypter._encrypt(public, x) for x in plains]
+    assert public.encrypt_many(plains) == ciphers
+    assert private.encrypt_many(iter(plains)) == ciphers
+    assert private.decrypt_many(ciphers) == plains
+    assert public.encrypt_many([]) == private.decrypt_many([]) == []
+    pytest.raises(CryptoRuntimeError, public.decrypt_many, ciphers)
+    pytest.raises(CryptoValueError, private.encrypt_many, [1, key['n']])
+    pytest.raises(CryptoValueError, private.decrypt_many, [-1])
+
 # vim: et sw=4 ts=4 ft=python
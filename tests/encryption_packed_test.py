@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This file is part of RSA.py testsuite.
+
+"""Tests for the bit-packed encryption of generic sequences of bytes."""
+
+import pytest
+from RSA import BinaryEncrypter, PackedBinaryEncrypter, PrivateKey
+from RSA import CryptoValueError, encrypt_container, encrypt_file
+from .lib import keys_with_bits, make_key, random_bytes
+from .lib import with_params, pytest_generate_tests
+
+keys_list = keys_with_bits(16)
+
+@with_params([0, 1, 2, 3, 4, 5, 8, 17, 64, 333], 'length')
+@with_params(keys_list)
+def test_packed_roundtrip(n, p, q, e, d, length):
+    encrypter = PackedBinaryEncrypter(PrivateKey(p, q, e))
+    plaintext = random_bytes(length, seed=length)
+    ciphertext = b''.join(encrypter.encrypt(plaintext))
+    assert len(ciphertext) % encrypter.n_byte_length == 0
+    assert b''.join(encrypter.decrypt(ciphertext)) == plaintext
+
+@with_params(keys_list)
+def test_packed_fewer_chunks(n, p, q, e, d):
+    key = PrivateKey(p, q, e)
+    plaintext = random_bytes(2000)
+    packed = PackedBinaryEncrypter(key)
+    integers = list(packed.p2i(plaintext))
+    width = n.bit_length() - 1
+    # All the bits are used, plus one integer for the trailer.
+    assert len(integers) == -(-8 * len(plaintext) // width) + 1
+    # At worst (when the bits of n minus one are almost a multiple of
+    # 8) we only pay for the trailer.
+    unpacked = list(BinaryEncrypter(key).p2i(plaintext))
+    assert len(integers) <= len(unpacked) + 1
+
+def test_packed_small_key_gain():
+    key = PrivateKey(p=99713, q=104707, e=997)
+    plaintext = random_bytes(1000)
+    packed = b''.join(PackedBinaryEncrypter(key).encrypt(plaintext))
+    binary = b''.join(BinaryEncrypter(key).encrypt(plaintext))
+    assert 4 * len(packed) < 3 * len(binary)
+
+def test_packed_i2p_inverts_p2i():
+    encrypter = PackedBinaryEncrypter(make_key())
+    for length in range(0, 40):
+        plaintext = random_bytes(length, seed=length)
+        integers = list(encrypter.p2i(plaintext))
+        assert b''.join(encrypter.i2p(integers)) == plaintext
+
+@with_params([[], [0, 0], [5, 0], [5, 1000], [5, 7]], 'integers')
+def test_packed_invalid_integers(integers):
+    encrypter = PackedBinaryEncrypter(PrivateKey(p=4111, q=4703, e=127))
+    pytest.raises(CryptoValueError, b''.join, encrypter.i2p(integers))
+
+def test_packed_truncated_ciphertext():
+    encrypter = PackedBinaryEncrypter(make_key())
+    ciphertext = b''.join(encrypter.encrypt(b'foobar' * 20))
+    truncated = ciphertext[:-encrypter.n_byte_length]
+    pytest.raises(CryptoValueError, b''.join, encrypter.decrypt(truncated))
+
+def test_packed_no_byte_chunks(tmpdir):
+    encrypter = PackedBinaryEncrypter(PrivateKey(p=4111, q=4703, e=127))
+    pytest.raises(CryptoValueError, encrypt_container, encrypter, b'x')
+    path = str(tmpdir.join('in'))
+    with open(path, 'wb') as fp:
+        fp.write(b'x')
+    pytest.raises(CryptoValueError, encrypt_file, encrypter, path,
+                  str(tmpdir.join('out')))
+
+# vim: et sw=4 ts=4 ft=python
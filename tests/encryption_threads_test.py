@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This file is part of RSA.py testsuite.
+
+"""Tests for the use of integers (mod n) and encrypters by many threads
+at once."""
+
+import threading
+import pytest
+from RSA import IntegerModPQ, PrivateKey, PublicKey
+from RSA import IntegerEncrypter, BinaryEncrypter
+from .lib import keys_with_bits, make_key
+from .lib import with_params, pytest_generate_tests
+
+keys_list = keys_with_bits(16)
+
+def run_threads(target, count=8):
+    # Not a `threading.Barrier', which is missing in python 2.
+    start = threading.Event()
+    results = [None] * count
+    errors = []
+    def run(i):
+        start.wait()
+        try:
+            results[i] = target()
+        except Exception as e:
+            errors.append(e)
+    threads = [threading.Thread(target=run, args=(i,))
+               for i in range(count)]
+    for thread in threads:
+        thread.start()
+    start.set()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    return results
+
+@with_params(keys_list)
+def test_integer_mod_pq_class_setup_race(n, p, q, e, d):
+    for (first, second) in ((p, q), (q, p)):
+        # A fresh class, set up on first use by all the threads at once.
+        class IntegerModN(IntegerModPQ):
+            pass
+        IntegerModN.p, IntegerModN.q = first, second
+        def use():
+            x = IntegerModN(n // 3)
+            return (IntegerModN.p, IntegerModN.q, IntegerModN.modulo,
+                    (x**e)**d)
+        results = run_threads(use)
+        assert results == [(max(p, q), min(p, q), n,
+                            IntegerModN(n // 3))] * len(results)
+
+@with_params(keys_list)
+def test_shared_encrypter(n, p, q, e, d):
+    encrypter = IntegerEncrypter(PrivateKey(p, q, e))
+    plain = n // 5 + 1
+    results = run_threads(lambda: encrypter.decrypt(encrypter.encrypt(plain)))
+    assert results == [plain] * len(results)
+
+@with_params([None, 1, 4], 'max_workers')
+@with_params(keys_list)
+def test_map_parallel_integer(n, p, q, e, d, max_workers):
+    pytest.importorskip('concurrent.futures')
+    encrypter = IntegerEncrypter(PrivateKey(p, q, e))
+    plain = [0, 1, n - 1, n, n**2 + 17, 2, 3, 5]
+    cipher = encrypter.map_parallel(encrypter.encrypt, plain,
+                                    max_workers=max_workers)
+    assert cipher == [encrypter.encrypt(x) for x in plain]
+    public_encrypter = IntegerEncrypter(PublicKey(n, e))
+    assert cipher == public_encrypter.map_parallel(public_encrypter.encrypt,
+                                                   plain)
+    assert encrypter.map_parallel(encrypter.decrypt, cipher,
+                                  max_workers=max_workers) == plain
+
+def test_map_parallel_binary_executor():
+    futures = pytest.importorskip('concurrent.futures')
+    encrypter = BinaryEncrypter(make_key())
+    plain = [b'', b'x', b'foobar' * 100, bytes(bytearray(range(256)))]
+    with futures.ThreadPoolExecutor(3) as executor:
+        cipher = encrypter.map_parallel(encrypter.encrypt, plain, executor)
+        assert cipher == [list(encrypter.encrypt(x)) for x in plain]
+        decrypted = encrypter.map_parallel(
+            encrypter.decrypt, [b''.join(c) for c in cipher], executor)
+    assert [b''.join(x) for x in decrypted] == plain
+
+# vim: et sw=4 ts=4 ft=python
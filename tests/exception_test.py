@@ -23,6 +23,10 @@ exceptions_info = {
     'IMValueError': {
         'superclasses': (Exception, 'IMException', ValueError),
     },
+    'IMTimeoutError': {
+        'superclasses': (Exception, 'IMException', 'IMRuntimeError',
+                         RuntimeError),
+    },
     'CryptoException':  {
         'superclasses': (Exception,),
     },
@@ -32,6 +36,10 @@ exceptions_info = {
     'CryptoRuntimeError': {
         'superclasses': (Exception, 'CryptoException', RuntimeError),
     },
+    'CryptoTimeoutError': {
+        'superclasses': (Exception, 'CryptoException', 'CryptoRuntimeError',
+                         RuntimeError),
+    },
 }
 
 # pytest special hook function to generate test input.
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This file is part of RSA.py testsuite.
+
+"""Tests for the file encryption, with checkpoints and resumption."""
+
+import os
+import pytest
+from RSA import BinaryEncrypter, CryptoValueError
+from RSA import encrypt_file, resume_encrypt_file
+from .lib import make_key, random_bytes
+from .lib import with_params, pytest_generate_tests
+
+class Interrupted(Exception):
+    pass
+
+class InterruptedEncrypter(BinaryEncrypter):
+    # Fail after having encrypted the given number of batches.
+    def __init__(self, key, batches):
+        BinaryEncrypter.__init__(self, key)
+        self.batches = batches
+    def encrypt(self, plaintext, deadline=None):
+        if self.batches == 0:
+            raise Interrupted()
+        self.batches -= 1
+        return BinaryEncrypter.encrypt(self, plaintext, deadline)
+
+def make_files(tmpdir, plaintext):
+    paths = [str(tmpdir.join(name)) for name in ('in', 'out', 'ckpt')]
+    with open(paths[0], 'wb') as fp:
+        fp.write(plaintext)
+    return paths
+
+def read(path):
+    with open(path, 'rb') as fp:
+        return fp.read()
+
+@with_params([0, 1, 5, 64, 65], 'chunks')
+def test_encrypt_file(tmpdir, chunks):
+    encrypter = BinaryEncrypter(make_key())
+    plaintext = random_bytes(chunks * encrypter.plain_chunk_byte_length)
+    input_path, output_path, checkpoint_path = make_files(tmpdir, plaintext)
+    length = encrypt_file(encrypter, input_path, output_path,
+                          checkpoint_path, checkpoint_chunks=8)
+    expected = b''.join(encrypter.encrypt(plaintext))
+    assert length == len(expected)
+    assert read(output_path) == expected
+    assert not os.path.exists(checkpoint_path)
+
+@with_params([0, 1, 3], 'batches')
+def test_resume_encrypt_file(tmpdir, batches):
+    key = make_key()
+    encrypter = BinaryEncrypter(key)
+    plaintext = random_bytes(30 * encrypter.plain_chunk_byte_length + 3)
+    input_path, output_path, checkpoint_path = make_files(tmpdir, plaintext)
+    pytest.raises(Interrupted, encrypt_file,
+                  InterruptedEncrypter(key, batches), input_path,
+                  output_path, checkpoint_path, checkpoint_chunks=8)
+    assert os.path.exists(checkpoint_path) == (batches > 0)
+    # Leftovers written after the checkpoint must be discarded.
+    with open(output_path, 'ab') as fp:
+        fp.write(b'garbage')
+    length = resume_encrypt_file(encrypter, input_path, output_path,
+                                 checkpoint_path, checkpoint_chunks=8)
+    expected = b''.join(encrypter.encrypt(plaintext))
+    assert length == len(expected)
+    assert read(output_path) == expected
+    assert not os.path.exists(checkpoint_path)
+
+@with_params(['input', 'output', 'geometry'], 'tampered')
+def test_resume_encrypt_file_tampered(tmpdir, tampered):
+    key = make_key()
+    encrypter = BinaryEncrypter(key)
+    plaintext = random_bytes(20 * encrypter.plain_chunk_byte_length)
+    input_path, output_path, checkpoint_path = make_files(tmpdir, plaintext)
+    pytest.raises(Interrupted, encrypt_file, InterruptedEncrypter(key, 1),
+                  input_path, output_path, checkpoint_path,
+                  checkpoint_chunks=8)
+    if tampered == 'geometry':
+        encrypter = BinaryEncrypter(make_key('oregonstate'))
+    else:
+        path = input_path if tampered == 'input' else output_path
+        data = bytearray(read(path))
+        data[3] ^= 0x01
+        with open(path, 'wb') as fp:
+            fp.write(bytes(data))
+    pytest.raises(CryptoValueError, resume_encrypt_file, encrypter,
+                  input_path, output_path, checkpoint_path,
+                  checkpoint_chunks=8)
+
+def test_checkpoint_synced_before_replace(tmpdir, monkeypatch):
+    key = make_key()
+    encrypter = BinaryEncrypter(key)
+    plaintext = random_bytes(20 * encrypter.plain_chunk_byte_length)
+    input_path, output_path, checkpoint_path = make_files(tmpdir, plaintext)
+    calls = []
+    def wrap(name, function):
+        def wrapper(*args):
+            calls.append(name)
+            return function(*args)
+        monkeypatch.setattr(os, name, wrapper)
+    renamed = 'replace' if hasattr(os, 'replace') else 'rename'
+    wrap('fsync', os.fsync)
+    wrap(renamed, getattr(os, renamed))
+    pytest.raises(Interrupted, encrypt_file, InterruptedEncrypter(key, 2),
+                  input_path, output_path, checkpoint_path,
+                  checkpoint_chunks=8)
+    # The output, then the checkpoint, then (after the renaming) its
+    # directory, for each of the two checkpoints.
+    assert calls == ['fsync', 'fsync', renamed, 'fsync'] * 2
+
+def test_encrypt_file_invalid_checkpoint_chunks(tmpdir):
+    encrypter = BinaryEncrypter(make_key())
+    input_path, output_path, _ = make_files(tmpdir, b'foo')
+    pytest.raises(CryptoValueError, encrypt_file, encrypter, input_path,
+                  output_path, checkpoint_chunks=0)
+
+# vim: et sw=4 ts=4 ft=python
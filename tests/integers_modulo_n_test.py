@@ -762,6 +762,35 @@ def test_integermod_exponentiation(modulo, base, exponent, result):
     cls = integers_mod(modulo)
     check_integermod_result(cls, result, cls(base)**exponent)
 
+@with_params(exponentiation_data)
+@with_params([1, 2, 7], 'slice_steps')
+def test_integermod_stepwise_exponentiation(modulo, base, exponent, result,
+                                            slice_steps):
+    cls = integers_mod(modulo)
+    steps = cls(base).pow_steps(exponent)
+    slices = 1
+    while not steps.advance(slice_steps):
+        slices += 1
+    assert steps.steps <= slices * slice_steps
+    check_integermod_result(cls, result, steps.result)
+    # Further advancing is harmless.
+    assert steps.advance(slice_steps)
+    check_integermod_result(cls, result, steps.finish())
+
+@with_params([2, 3, 100, 2**61 - 1, (5, 11), (2**61 - 1, 2**31 - 1)],
+             'modulo')
+@with_params([0, 1, 2, 7, 1000, 2**70 + 1, -1, -5], 'exponent')
+def test_integermod_pow_many(modulo, exponent):
+    cls = integers_mod(modulo)
+    wholes = [1, 2, 3, 10, 2**40 + 3, 3**50]
+    try:
+        expected = [cls(x)**exponent for x in wholes]
+    except RSA.IMValueError:
+        pytest.raises(RSA.IMValueError, cls.pow_many, wholes, exponent)
+    else:
+        assert cls.pow_many(wholes, exponent) == expected
+    assert cls.pow_many([], exponent) == []
+
 @with_params(zero_to_zero_exponentiation_modulos, 'modulo')
 def test_integermod_zero_to_zero_exponentiation(modulo):
     cls = integers_mod(modulo)
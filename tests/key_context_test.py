@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This file is part of RSA.py testsuite.
+
+"""Tests for key fingerprints, key contexts and their registry."""
+
+import os
+import pytest
+import RSA
+from RSA import PublicKey, PrivateKey, KeyContext, KeyContextRegistry
+from RSA import BasicEncrypter, IntegerEncrypter, BinaryEncrypter
+from .keys import keys as keys_dict
+from .lib import keys_with_bits
+from .lib import with_params, pytest_generate_tests
+
+keys_list = keys_with_bits()
+
+@with_params(keys_list)
+def test_fingerprint_private_public(n, p, q, e, d):
+    private_key = PrivateKey(p, q, e)
+    assert private_key.fingerprint() == PublicKey(n, e).fingerprint()
+    assert private_key.fingerprint() == private_key.public().fingerprint()
+    assert len(private_key.fingerprint()) == 32
+
+def test_fingerprints_differ():
+    fingerprints = set()
+    for k in keys_list:
+        fingerprints.add(PublicKey(k['n'], k['e']).fingerprint())
+        fingerprints.add(PublicKey(k['n'], k['e'] + 2).fingerprint())
+        fingerprints.add(PublicKey(k['n'] + 2, k['e']).fingerprint())
+    assert len(fingerprints) == 3 * len(keys_list)
+
+@with_params(keys_list)
+def test_encrypters_share_context(n, p, q, e, d):
+    encrypter1 = IntegerEncrypter(PrivateKey(p, q, e))
+    encrypter2 = BasicEncrypter(PrivateKey(q, p, e))
+    assert encrypter1.context is encrypter2.context
+    assert encrypter1.mod_n is encrypter2.mod_n
+    encrypter3 = BasicEncrypter(PublicKey(n, e))
+    assert encrypter3.context is not encrypter1.context
+    assert encrypter3.context is BasicEncrypter(PublicKey(n, e)).context
+    assert encrypter1.context.is_private
+    assert not encrypter3.context.is_private
+
+def test_context_is_immutable():
+    context = KeyContext(PrivateKey(p=4111, q=4703, e=127))
+    pytest.raises(AttributeError, setattr, context, 'key', None)
+    pytest.raises(AttributeError, setattr, context, 'foo', None)
+
+def test_context_matches():
+    key = PrivateKey(p=4111, q=4703, e=127)
+    context = KeyContext(key)
+    assert context.matches(key)
+    assert context.matches(PrivateKey(p=4703, q=4111, e=127))
+    assert not context.matches(key.public())
+    assert not context.matches(PrivateKey(p=4111, q=4703, e=131))
+    assert KeyContext(key.public()).matches(key.public())
+
+def test_registry_lru_eviction():
+    registry = KeyContextRegistry(max_size=3)
+    contexts = []
+    for k in keys_list[:4]:
+        contexts.append(registry.get(PrivateKey(k['p'], k['q'], k['e'])))
+    assert len(registry) == 3
+    k0, k1 = keys_list[0], keys_list[1]
+    # The first key has been evicted; the second is still there.
+    assert registry.get(PrivateKey(k1['p'], k1['q'], k1['e'])) is contexts[1]
+    assert (registry.get(PrivateKey(k0['p'], k0['q'], k0['e']))
+            is not contexts[0])
+    # Getting the second key made it the most recently used one, so the
+    # third key was evicted instead.
+    assert registry.get(PrivateKey(k1['p'], k1['q'], k1['e'])) is contexts[1]
+    registry.clear()
+    assert len(registry) == 0
+
+def test_registry_disabled():
+    registry = KeyContextRegistry(max_size=0)
+    key = PrivateKey(p=4111, q=4703, e=127)
+    assert registry.get(key) is not registry.get(key)
+    assert len(registry) == 0
+
+# Snapshots of key contexts.
+
+def private_context(k):
+    return BasicEncrypter(PrivateKey(k['p'], k['q'], k['e'])).context
+
+@with_params(keys_list)
+def test_snapshot_roundtrip(n, p, q, e, d):
+    for key in (PrivateKey(p, q, e), PublicKey(n, e)):
+        context = BasicEncrypter(key).context
+        data = RSA.dumps_key_context(context)
+        RSA.key_contexts.clear()
+        loaded = RSA.loads_key_context(data)
+        assert loaded is not context
+        assert loaded.fingerprint == context.fingerprint
+        assert loaded.is_private == context.is_private
+        assert loaded.key.n == n and loaded.key.e == e
+        if loaded.is_private:
+            assert loaded.key.d == d
+            assert (loaded.mod_n.p_reciprocal_mod_q
+                    == context.mod_n.p_reciprocal_mod_q)
+        # The loaded context is registered.
+        assert BasicEncrypter(key).context is loaded
+
+@with_params([True, False], 'use_mmap')
+def test_snapshot_file(tmpdir, use_mmap):
+    context = private_context(keys_dict['M2281_M2203'])
+    path = str(tmpdir.join('key.ctx'))
+    RSA.dump_key_context(context, path)
+    # Written atomically, and readable only by its owner.
+    assert os.listdir(str(tmpdir)) == ['key.ctx']
+    assert os.stat(path).st_mode & 0o777 == 0o600
+    RSA.key_contexts.clear()
+    loaded = RSA.load_key_context(path, use_mmap=use_mmap)
+    assert loaded.fingerprint == context.fingerprint
+    encrypter = BinaryEncrypter(loaded.key)
+    assert encrypter.context is loaded
+    assert b''.join(encrypter.decrypt(b''.join(
+        encrypter.encrypt(b'foobar')))) == b'foobar'
+
+def test_snapshot_no_recomputation(monkeypatch):
+    context = private_context(keys_dict['styere_e19'])
+    data = RSA.dumps_key_context(context)
+    RSA.key_contexts.clear()
+    def fail(*args):
+        raise AssertionError("modular_reciprocal called")
+    monkeypatch.setattr(RSA, 'modular_reciprocal', fail)
+    # Make sure the CRT class isn't simply taken from the cache.
+    del context
+    import gc; gc.collect()
+    loaded = RSA.loads_key_context(data)
+    assert loaded.mod_n(5)**loaded.key.d == loaded.mod_n(5)**loaded.key.d
+
+def test_snapshot_corrupted():
+    data = bytearray(RSA.dumps_key_context(
+        private_context(keys_dict['wikipedia'])))
+    pytest.raises(RSA.CryptoValueError, RSA.loads_key_context, b'')
+    pytest.raises(RSA.CryptoValueError, RSA.loads_key_context, data[:-1])
+    pytest.raises(RSA.CryptoValueError, RSA.loads_key_context, data[1:])
+    for position in (0, 8, 9, 12, 20, len(data) - 40, len(data) - 1):
+        corrupted = bytearray(data)
+        corrupted[position] ^= 0x01
+        pytest.raises(RSA.CryptoValueError, RSA.loads_key_context,
+                      bytes(corrupted))
+
+def test_integer_mod_pq_class_wrong_reciprocal():
+    pytest.raises(RSA.IMValueError, RSA.integer_mod_pq_class,
+                  10007, 10009, 5)
+
+# vim: et sw=4 ts=4 ft=python
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This file is part of RSA.py testsuite.
+
+"""Tests for the key factory and its pools of pre-generated primes."""
+
+import os
+import random
+import time
+import pytest
+import RSA
+from RSA import KeyFactory, CryptoValueError
+from RSA import _pack_integers, _PRIME_POOL_MAGIC, _PRIME_POOL_VERSION
+from .lib import check_key
+from .lib import with_params, pytest_generate_tests
+
+def wait_for(predicate, timeout=60):
+    expires_at = time.time() + timeout
+    while not predicate():
+        assert time.time() < expires_at, "timed out"
+        time.sleep(0.01)
+
+@with_params([dict(bits=128, workers=1), dict(bits=129, workers=3)])
+def test_key_factory_fills_pools(bits, workers):
+    factory = KeyFactory(e=17, low_watermark=2, high_watermark=5,
+                         rng=random.Random(bits), workers=workers)
+    factory.start(bits)
+    try:
+        sizes = (bits - bits // 2, bits // 2)
+        wait_for(lambda: all(factory.pool_size(size) >= 5
+                             for size in sizes))
+        keys = [factory.new_key(bits) for _ in range(3)]
+        for key in keys:
+            check_key(key, bits, 17)
+        assert len(set(key.n for key in keys)) == 3
+        # Down to the low watermark: the pools are refilled.
+        wait_for(lambda: all(factory.pool_size(size) >= 5
+                             for size in sizes))
+    finally:
+        factory.stop()
+    # Never more than the high watermark.
+    assert factory.pool_size(bits // 2) <= 5
+    assert factory.pool_size(bits - bits // 2) <= 5
+
+def test_key_factory_no_refill_above_low_watermark():
+    factory = KeyFactory(e=3, low_watermark=1, high_watermark=4)
+    factory.start(64)
+    try:
+        wait_for(lambda: factory.pool_size(32) == 4)
+        factory.new_key(64)
+        time.sleep(0.2)
+        assert factory.pool_size(32) == 2
+    finally:
+        factory.stop()
+
+def test_key_factory_not_started():
+    factory = KeyFactory()
+    check_key(factory.new_key(256), 256, 65537)
+    assert factory.pool_size(128) == 0
+
+def test_key_factory_close_primes_kept():
+    factory = KeyFactory(e=17)
+    p = RSA.generate_prime(128, random.Random(3))
+    close = p + 2
+    while not RSA.is_probable_prime(close):
+        close += 2
+    far = RSA.generate_prime(128, random.Random(4))
+    # Pooled as if loaded from a file: `far' is drawn after `close'.
+    factory._pools[128] = [far, close, p]
+    key = factory.new_key(256)
+    assert set((key.p, key.q)) == set((p, far))
+    # The prime too close to p is not wasted.
+    assert factory._pools[128] == [close]
+
+def test_key_factory_persistence(tmpdir):
+    path = str(tmpdir.join('primes'))
+    factory = KeyFactory(e=5, low_watermark=1, high_watermark=3, path=path)
+    factory.start(96)
+    wait_for(lambda: factory.pool_size(48) >= 3)
+    saved = factory.pool_size(48)
+    factory.stop()
+    assert os.stat(path).st_mode & 0o777 == 0o600
+    restored = KeyFactory(e=5, path=path)
+    assert factory.pool_size(48) == 0
+    assert restored.pool_size(48) == saved
+    assert not os.path.exists(path)
+    check_key(restored.new_key(96), 96, 5)
+    assert restored.pool_size(48) == saved - 2
+    restored.stop()
+    assert restored.pool_size(48) == 0
+    assert KeyFactory(e=5, path=path).pool_size(48) == saved - 2
+
+def test_key_factory_saved_primes_issued_once(tmpdir):
+    path = str(tmpdir.join('primes'))
+    factory = KeyFactory(e=17, low_watermark=2, high_watermark=6,
+                         path=path, rng=random.Random(7))
+    factory.start(80)
+    wait_for(lambda: factory.pool_size(40) >= 6)
+    factory.stop()
+    # Keys issued by the factory after saving, and by two factories
+    # loading the same file, never share a factor.
+    first = KeyFactory(e=17, path=path)
+    second = KeyFactory(e=17, path=path)
+    keys = [f.new_key(80) for f in (factory, first, second, first)]
+    for i, key1 in enumerate(keys):
+        for key2 in keys[:i]:
+            assert RSA.gcd(key1.n, key2.n) == 1
+
+def test_key_factory_invalid_pool_file(tmpdir):
+    path = str(tmpdir.join('primes'))
+    def write(integers):
+        with open(path, 'wb') as fp:
+            fp.write(_pack_integers(_PRIME_POOL_MAGIC, _PRIME_POOL_VERSION,
+                                    0, integers))
+    write([17, 2**61 - 1])
+    pytest.raises(CryptoValueError, KeyFactory, 65537, path=path)
+    # Not a prime.
+    write([17, (2**31 - 1) * (2**61 - 1)])
+    pytest.raises(CryptoValueError, KeyFactory, 17, path=path)
+    with open(path, 'wb') as fp:
+        fp.write(b'garbage' * 10)
+    pytest.raises(CryptoValueError, KeyFactory, 17, path=path)
+
+@with_params([dict(low_watermark=2, high_watermark=2),
+              dict(low_watermark=-1, high_watermark=2),
+              dict(low_watermark=3, high_watermark=1)])
+def test_key_factory_invalid_watermarks(low_watermark, high_watermark):
+    pytest.raises(CryptoValueError, KeyFactory, 65537,
+                  low_watermark, high_watermark)
+
+def test_key_factory_invalid_sizes():
+    pytest.raises(CryptoValueError, KeyFactory(e=3).new_key, 15)
+    pytest.raises(CryptoValueError, KeyFactory, 4)
+
+# vim: et sw=4 ts=4 ft=python
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This file is part of RSA.py testsuite.
+
+"""Tests for the generation of prime numbers and RSA keys."""
+
+import random
+import pytest
+from RSA import small_primes, generate_prime, generate_key, gcd
+from RSA import generate_keys, KeyBatch
+from RSA import PrivateKey, IntegerEncrypter, CryptoValueError
+from RSA import _miller_rabin
+from .lib import naive_is_prime, check_key
+from .lib import with_params, pytest_generate_tests
+
+@with_params([0, 1, 2, 3, 4, 5, 10, 97, 1000, 4099, 20000], 'limit')
+def test_small_primes(limit):
+    assert small_primes(limit) == [i for i in range(limit)
+                                   if naive_is_prime(i)]
+
+@with_params([561, 1105, 1729, 2465, 2821, 6601, 8911,
+              # Strong pseudoprimes to base 2.
+              2047, 3277, 4033, 4681, 8321,
+              # Product of two large primes.
+              (2**61 - 1) * (2**89 - 1)], 'n')
+def test_miller_rabin_composites(n):
+    assert not _miller_rabin(n, 40, random.Random(n))
+
+@with_params([5, 7, 101, 7919, 2**61 - 1, 2**89 - 1, 2**127 - 1], 'n')
+def test_miller_rabin_primes(n):
+    assert _miller_rabin(n, 40, random.Random(n))
+
+@with_params([8, 9, 16, 17, 31, 64, 100, 256], 'bits')
+def test_generate_prime(bits):
+    rng = random.Random(bits)
+    for _ in range(5):
+        prime = generate_prime(bits, rng)
+        assert prime.bit_length() == bits
+        assert prime >> (bits - 2) == 3
+        if bits <= 31:
+            assert naive_is_prime(prime)
+        else:
+            assert _miller_rabin(prime, 40, rng)
+
+def test_generate_prime_condition():
+    rng = random.Random(0)
+    prime = generate_prime(64, rng, lambda p: p % 4 == 3)
+    assert prime % 4 == 3
+
+def test_generate_prime_reproducible():
+    assert (generate_prime(128, random.Random(7)) ==
+            generate_prime(128, random.Random(7)))
+
+@with_params([dict(bits=16, e=3), dict(bits=17, e=5),
+              dict(bits=64, e=65537), dict(bits=333, e=17),
+              dict(bits=512, e=65537), dict(bits=1024, e=65537)])
+def test_generate_key(bits, e):
+    rng = random.Random(bits * e)
+    key = generate_key(bits, e, rng)
+    assert isinstance(key, PrivateKey)
+    assert key.n.bit_length() == bits
+    assert key.e == e
+    assert key.p > key.q
+    assert key.p.bit_length() - key.q.bit_length() <= 1
+    assert gcd(e, (key.p - 1) * (key.q - 1)) == 1
+    encrypter = IntegerEncrypter(key)
+    for x in (0, 1, 2, key.n // 3, key.n - 1):
+        assert encrypter.decrypt(encrypter.encrypt(x)) == x
+
+@with_params([dict(bits=15, e=3), dict(bits=64, e=2),
+              dict(bits=64, e=1), dict(bits=64, e=-3)])
+def test_generate_key_invalid(bits, e):
+    pytest.raises(CryptoValueError, generate_key, bits, e)
+
+def test_generate_prime_invalid():
+    pytest.raises(CryptoValueError, generate_prime, 7)
+
+def test_generate_key_parallel():
+    futures = pytest.importorskip('concurrent.futures')
+    with futures.ProcessPoolExecutor(2) as executor:
+        for bits in (64, 256, 512):
+            check_key(generate_key(bits, 65537, executor=executor,
+                                   max_pending=3), bits, 65537)
+
+def test_generate_key_parallel_reproducible():
+    futures = pytest.importorskip('concurrent.futures')
+    with futures.ThreadPoolExecutor(1) as executor:
+        keys = [generate_key(128, 3, random.Random(1), executor,
+                             max_pending=1) for _ in range(2)]
+    assert keys[0] == keys[1]
+    check_key(keys[0], 128, 3)
+
+def test_generate_key_invalid_max_pending():
+    pytest.raises(CryptoValueError, generate_key, 64, 3,
+                  max_pending=0)
+
+@with_params([0, 1, 5], 'count')
+def test_generate_keys(count):
+    batch = generate_keys(count, 96, 17, random.Random(count))
+    assert isinstance(batch, KeyBatch)
+    assert len(batch) == count
+    assert batch.elapsed >= 0 and batch.keys_per_second >= 0
+    for key in batch:
+        check_key(key, 96, 17)
+
+def test_generate_keys_parallel():
+    futures = pytest.importorskip('concurrent.futures')
+    with futures.ProcessPoolExecutor(2) as executor:
+        batch = generate_keys(6, 128, executor=executor)
+        seeded = [generate_keys(3, 128, 17, random.Random(0), executor)
+                  for _ in range(2)]
+    assert len(batch) == 6
+    assert len(set(key.n for key in batch)) == 6
+    for key in batch:
+        check_key(key, 128, 65537)
+    assert seeded[0] == seeded[1]
+
+# vim: et sw=4 ts=4 ft=python
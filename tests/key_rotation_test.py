@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This file is part of RSA.py testsuite.
+
+"""Tests for the re-encryption of ciphertext under a new key."""
+
+import io
+import random
+import pytest
+from RSA import BinaryEncrypter, PackedBinaryEncrypter
+from RSA import CryptoValueError, generate_key, reencrypt_stream
+from .lib import make_key, random_bytes
+from .lib import with_params, pytest_generate_tests
+
+futures = pytest.importorskip('concurrent.futures')
+
+def setup_module(module):
+    global process_pool, old_key, same_geometry_key, other_geometry_key
+    process_pool = futures.ProcessPoolExecutor(2)
+    old_key = make_key()
+    # Same number of bits, and thus same chunk geometry.
+    same_geometry_key = generate_key(old_key.n.bit_length(),
+                                     rng=random.Random(1))
+    other_geometry_key = make_key('oregonstate')
+
+def teardown_module(module):
+    process_pool.shutdown()
+
+class RecordingFile(io.BytesIO):
+    def __init__(self, data):
+        io.BytesIO.__init__(self, data)
+        self.read_sizes = []
+    def read(self, size=-1):
+        self.read_sizes.append(size)
+        return io.BytesIO.read(self, size)
+
+def rotate(old, new, plaintext, **settings):
+    src = RecordingFile(b''.join(old.encrypt(plaintext)))
+    dst = io.BytesIO()
+    count = reencrypt_stream(old, new, src, dst, **settings)
+    assert count == len(dst.getvalue())
+    return src, dst.getvalue()
+
+@with_params([0, 1, 82, 83, 1000], 'length')
+@with_params([1, 3, 256], 'window_chunks')
+@with_params(['same', 'other'], 'geometry')
+def test_reencrypt(geometry, window_chunks, length):
+    old = BinaryEncrypter(old_key)
+    new = BinaryEncrypter(same_geometry_key if geometry == 'same'
+                          else other_geometry_key)
+    assert ((new.plain_chunk_byte_length == old.plain_chunk_byte_length)
+            == (geometry == 'same'))
+    plaintext = random_bytes(length)
+    src, ciphertext = rotate(old, new, plaintext,
+                             window_chunks=window_chunks)
+    assert ciphertext == b''.join(new.encrypt(plaintext))
+    assert max(src.read_sizes) == window_chunks * old.n_byte_length
+
+@with_params([dict(kind='process', max_pending=2),
+              dict(kind='thread', max_pending=1),
+              dict(kind='thread', max_pending=4)], 'settings')
+def test_reencrypt_executor(settings):
+    old = BinaryEncrypter(old_key)
+    new = BinaryEncrypter(same_geometry_key)
+    plaintext = random_bytes(3000, seed=1)
+    if settings['kind'] == 'process':
+        executor = process_pool
+    else:
+        executor = futures.ThreadPoolExecutor(2)
+    try:
+        _, ciphertext = rotate(old, new, plaintext, executor=executor,
+                               window_chunks=4,
+                               max_pending=settings['max_pending'])
+    finally:
+        if executor is not process_pool:
+            executor.shutdown()
+    assert ciphertext == b''.join(new.encrypt(plaintext))
+
+def test_reencrypt_packed():
+    old = BinaryEncrypter(old_key)
+    new = PackedBinaryEncrypter(same_geometry_key)
+    plaintext = random_bytes(500, seed=2)
+    _, ciphertext = rotate(old, new, plaintext, executor=process_pool)
+    assert b''.join(new.decrypt(ciphertext)) == plaintext
+
+def test_reencrypt_corrupted():
+    old = BinaryEncrypter(old_key)
+    new = BinaryEncrypter(same_geometry_key)
+    ciphertext = b''.join(old.encrypt(b'foobar' * 50))
+    length = old.n_byte_length
+    for data in (ciphertext[:-1],
+                 ciphertext[:10] + b'\0' * 10 + ciphertext[20:],
+                 # A chunk decrypting to zero.
+                 ciphertext[:length] + b'\0' * length +
+                 ciphertext[2*length:]):
+        pytest.raises(CryptoValueError, reencrypt_stream, old, new,
+                      io.BytesIO(data), io.BytesIO())
+
+@with_params([dict(window_chunks=0, max_pending=1),
+              dict(window_chunks=1, max_pending=0)])
+def test_reencrypt_invalid_settings(window_chunks, max_pending):
+    old = BinaryEncrypter(old_key)
+    pytest.raises(CryptoValueError, reencrypt_stream, old, old,
+                  io.BytesIO(), io.BytesIO(), window_chunks=window_chunks,
+                  max_pending=max_pending)
+
+# vim: et sw=4 ts=4 ft=python
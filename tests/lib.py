@@ -4,6 +4,7 @@
 
 """Helper subroutines and classes for the RSA.py's testsuite"""
 
+import random
 import RSA
 
 is_py3k = RSA._is_py3k
@@ -34,6 +35,39 @@ def no_iteration():
 def s2i(x):
     return int(''.join(x.split()))
 
+# The keys defined in `keys.py' whose modulus has more than min_bits
+# bits (and less than max_bits, if given).  That module imports this
+# one, hence the late import.
+def keys_with_bits(min_bits=0, max_bits=None):
+    from .keys import keys
+    return [ keys[tag] for tag in keys
+             if keys[tag]['n'].bit_length() > min_bits
+             and (max_bits is None or keys[tag]['n'].bit_length() < max_bits) ]
+
+# Build a private key from the key with the given tag in `keys.py'.
+def make_key(tag='styere_e19'):
+    from .keys import keys
+    k = keys[tag]
+    return RSA.PrivateKey(k['p'], k['q'], k['e'])
+
+# Reproducible pseudo-random data, as a byte string.
+def random_bytes(length, seed=0):
+    rng = random.Random(seed)
+    return bytes(bytearray(rng.getrandbits(8) for _ in range(length)))
+
+# Trial division: slow, but obviously right.
+def naive_is_prime(n):
+    return n > 1 and all(n % i for i in range(2, int(n**0.5) + 1))
+
+# Check that key is a working private key with the given exponent,
+# whose modulus has the given number of bits.
+def check_key(key, bits, e):
+    assert isinstance(key, RSA.PrivateKey)
+    assert key.n.bit_length() == bits and key.e == e
+    assert key.p > key.q
+    encrypter = RSA.IntegerEncrypter(key)
+    assert encrypter.decrypt(encrypter.encrypt(4242)) == 4242
+
 # Build a proper subclass of RSA.IntegerMod, with the given
 # modulo; the class name is set to a sane default if not given
 # explicitly.
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This file is part of RSA.py testsuite.
+
+"""Tests for pickling of integers (mod n), key contexts and encrypters."""
+
+import pickle
+import RSA
+from RSA import PublicKey, PrivateKey, BasicEncrypter, BinaryEncrypter
+from RSA import IntegerEncrypter, integer_mod_class, integer_mod_pq_class
+from .keys import keys as keys_dict
+from .lib import keys_with_bits
+from .lib import integers_mod, with_params, pytest_generate_tests
+
+keys_list = keys_with_bits()
+
+modulos = [2, 15, 2**61 - 1, 3**300, (13, 17), (2**127 - 1, 2**61 - 1)]
+
+def roundtrip(obj):
+    return pickle.loads(pickle.dumps(obj, pickle.HIGHEST_PROTOCOL))
+
+@with_params(modulos, 'modulo')
+def test_pickle_integer_mod(modulo):
+    if isinstance(modulo, tuple):
+        cls = integer_mod_pq_class(*modulo)
+    else:
+        cls = integer_mod_class(modulo)
+    for whole in (0, 1, 7, -1, 10**50):
+        x = cls(whole)
+        y = roundtrip(x)
+        assert y == x and y.__class__ is cls
+
+@with_params(modulos, 'modulo')
+def test_pickle_custom_integer_mod_class(modulo):
+    x = integers_mod(modulo)(12345)
+    y = roundtrip(x)
+    # The class is rebuilt, but the value is preserved.
+    assert isinstance(y, x.__class__.__bases__[0])
+    assert y.modulo == x.modulo and y.residue == x.residue
+    assert roundtrip(y) == y
+
+def test_pickle_integer_mod_pq_components():
+    cls = integer_mod_pq_class(2**127 - 1, 2**61 - 1)
+    y = roundtrip(cls(3**100))
+    assert y.mod_p == cls(3**100).mod_p and y.mod_q == cls(3**100).mod_q
+    assert y**65537 == cls(3**100)**65537
+
+def test_pickle_shares_modulus():
+    cls = integer_mod_class(3**3000)
+    one = len(pickle.dumps([cls(1)], pickle.HIGHEST_PROTOCOL))
+    many = len(pickle.dumps([cls(i) for i in range(100)],
+                            pickle.HIGHEST_PROTOCOL))
+    # The (big) modulus is stored only once.
+    assert many < one + 100 * 20
+
+@with_params(keys_list)
+def test_pickle_key_context(n, p, q, e, d):
+    for key in (PrivateKey(p, q, e), PublicKey(n, e)):
+        context = BasicEncrypter(key).context
+        assert roundtrip(context) is context
+
+@with_params([BasicEncrypter, IntegerEncrypter], 'cls')
+@with_params(keys_list)
+def test_pickle_encrypter(n, p, q, e, d, cls):
+    encrypter = cls(PrivateKey(p, q, e))
+    clone = roundtrip(encrypter)
+    assert clone.key == encrypter.key
+    assert clone.mod_n is encrypter.mod_n
+    plain = (n - 1) // 2
+    assert clone.decrypt(encrypter.encrypt(plain)) == plain
+
+def test_pickle_binary_encrypter():
+    k = keys_dict['M2281_M2203']
+    encrypter = BinaryEncrypter(PublicKey(k['n'], k['e']))
+    clone = roundtrip(encrypter)
+    assert clone.plain_chunk_byte_length == encrypter.plain_chunk_byte_length
+    assert (b''.join(clone.encrypt(b'foobar' * 100))
+            == b''.join(encrypter.encrypt(b'foobar' * 100)))
+    # Pickling a fresh context must work also when the registry doesn't
+    # know about its key anymore.
+    RSA.key_contexts.clear()
+    assert roundtrip(encrypter).context.fingerprint == \
+           encrypter.context.fingerprint
+
+# vim: et sw=4 ts=4 ft=python
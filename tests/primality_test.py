@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This file is part of RSA.py testsuite.
+
+"""Tests for the Baillie-PSW primality test and the validation of the
+primes of private keys."""
+
+import pytest
+from RSA import is_probable_prime, are_probable_primes, jacobi
+from RSA import PrivateKey, CryptoValueError
+from RSA import _strong_probable_prime, _strong_lucas_probable_prime
+from .lib import keys_with_bits, naive_is_prime
+from .lib import with_params, pytest_generate_tests
+
+keys_list = keys_with_bits()
+
+large_primes = [2**61 - 1, 2**89 - 1, 2**107 - 1, 2**127 - 1,
+                2**521 - 1, 2**607 - 1]
+
+large_composites = [
+    # Strong pseudoprimes to base 2.
+    3215031751, 2152302898747, 3474749660383, 341550071728321,
+    # Strong Lucas pseudoprimes, multiplied by large primes.
+    5459 * (2**61 - 1), 5777 * (2**89 - 1),
+    # Squares of primes and other products.
+    (2**61 - 1)**2, (2**89 - 1) * (2**107 - 1), 2**127 + 1,
+    (2**521 - 1) * (2**607 - 1),
+]
+
+def test_is_probable_prime_small():
+    for n in range(-10, 70000):
+        assert is_probable_prime(n) == naive_is_prime(n), n
+
+@with_params(large_primes, 'n')
+def test_is_probable_prime_large_primes(n):
+    assert is_probable_prime(n)
+
+@with_params(large_composites, 'n')
+def test_is_probable_prime_large_composites(n):
+    assert not is_probable_prime(n)
+
+@with_params([3215031751, 2152302898747, 3474749660383], 'n')
+def test_strong_pseudoprimes_base_2(n):
+    assert _strong_probable_prime(n, 2)
+
+@with_params([5459, 5777, 10877, 16109, 18971, 22499], 'n')
+def test_strong_lucas_pseudoprimes(n):
+    assert _strong_lucas_probable_prime(n)
+    assert not is_probable_prime(n)
+
+@with_params([3, 5, 7, 11, 101, 7919], 'n')
+def test_jacobi_euler_criterion(n):
+    for a in range(2 * n):
+        expected = pow(a, (n - 1) // 2, n)
+        if expected == n - 1:
+            expected = -1
+        assert jacobi(a, n) == expected
+
+def test_jacobi_composite():
+    assert jacobi(2, 15) == 1 and jacobi(7, 15) == -1
+    assert jacobi(5, 15) == 0 and jacobi(-1, 15) == -1
+    pytest.raises(CryptoValueError, jacobi, 3, 10)
+
+def test_are_probable_primes():
+    candidates = (list(range(-3, 3000)) + large_primes + large_composites
+                  + [n + 2 for n in large_primes])
+    assert are_probable_primes(candidates) == \
+        [is_probable_prime(n) for n in candidates]
+    assert are_probable_primes([]) == []
+
+@with_params(keys_list)
+def test_private_key_validate(n, p, q, e, d):
+    key = PrivateKey(p, q, e, validate=True)
+    assert key == PrivateKey(p, q, e)
+    assert PrivateKey.from_components(p, q, e, d, validate=True) == key
+    assert PrivateKey.from_pem(key.to_pem(), validate=True) == key
+
+def test_private_key_validate_composite():
+    p, q = 2**61 - 1, 3 * 5 * 7 * 11 * 13 * 17 * 19 * 23 + 2
+    assert not is_probable_prime(q)
+    key = PrivateKey(p, q, 17)
+    pytest.raises(CryptoValueError, PrivateKey, p, q, 17, True)
+    pytest.raises(CryptoValueError, PrivateKey.from_components,
+                  q, p, key.e, key.d, validate=True)
+    pytest.raises(CryptoValueError, PrivateKey.from_pem, key.to_pem(),
+                  validate=True)
+    assert PrivateKey.from_pem(key.to_pem()) == key
+
+# vim: et sw=4 ts=4 ft=python
@@ -74,4 +74,40 @@ def test_private_keys_equality(n, p, q, e, d):
 def test_invalid_private_keys(p, q, e):
     pytest.raises(CryptoValueError, "PrivateKey(p, q, e)")
 
+@with_params(private_keys)
+def test_private_key_from_components(n, p, q, e, d):
+    key = PrivateKey.from_components(p, q, e, d)
+    assert key == PrivateKey(p, q, e)
+    assert key.n == n and key.e == e
+    pytest.raises(CryptoValueError, PrivateKey.from_components,
+                  p, q, e, d + 1)
+    pytest.raises(CryptoValueError, PrivateKey.from_components,
+                  p, q, e + 2, d)
+
+@with_params(private_keys)
+def test_private_key_from_exponents(n, p, q, e, d):
+    key = PrivateKey.from_exponents(n, e, d)
+    assert set([key.p, key.q]) == set([p, q])
+    assert key.p > key.q
+    assert key.n == n and key.e == e and key.d == d
+
+def test_private_key_from_exponents_tiny():
+    # Random bases sharing a factor with n are very likely here.
+    for _ in range(200):
+        key = PrivateKey.from_exponents(35, 5, 5)
+        assert (key.p, key.q) == (7, 5)
+
+@with_params([dict(n=35, e=5, d=6), dict(n=35, e=5, d=0),
+              dict(n=3233, e=17, d=2753 + 1), dict(n=4, e=3, d=3)])
+def test_private_key_from_exponents_invalid(n, e, d):
+    pytest.raises(CryptoValueError, PrivateKey.from_exponents, n, e, d)
+
+@with_params(private_keys)
+def test_keys_immutable(n, p, q, e, d):
+    for key in (PrivateKey(p, q, e), PrivateKey.from_components(p, q, e, d),
+                PublicKey(n, e)):
+        pytest.raises(AttributeError, setattr, key, 'e', 3)
+        pytest.raises(AttributeError, setattr, key, 'foo', 3)
+        assert key.e == e
+
 # vim: et sw=4 ts=4 ft=python